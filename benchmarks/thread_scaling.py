@@ -0,0 +1,92 @@
+"""
+Throughput of execute() with 1 to N threads, through ThreadPoolEvaluator.
+
+    python benchmarks/thread_scaling.py --max-threads 8
+    python benchmarks/thread_scaling.py --max-threads 8 --tiering-threshold 1000
+
+On free-threaded CPython (3.13t) it should scale close to linearly with the number of
+cores. With the GIL, throughput stays flat.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_operations.batch import ThreadPoolEvaluator, execute_batch  # noqa: E402
+from json_operations.compiler import configure_tiering  # noqa: E402
+
+RULES = [
+    [
+        "and",
+        [">=", ["key", "user.age"], 18],
+        ["in", ["key", "user.country"], ["US", "CA", "GB"]],
+        ["or", ["&", ["key", "user.tags"], ["beta"]], ["==", ["key", "plan"], "pro"]],
+    ],
+    ["btw", ["key", "amount"], [10, 100]],
+    ["!null", ["key", "user.email"]],
+]
+
+
+def _contexts(count: int):
+    random.seed(0)
+    return [
+        dict(
+            user=dict(
+                age=random.randint(10, 80),
+                country=random.choice(["US", "FR", "GB", "DE"]),
+                tags=random.sample(["beta", "vip", "new", "old"], 2),
+                email=random.choice([None, "a@example.com"]),
+            ),
+            plan=random.choice(["free", "pro"]),
+            amount=random.random() * 200,
+        )
+        for _ in range(count)
+    ]
+
+
+def _run(evaluator, contexts) -> float:
+    started = time.perf_counter()
+    for rule in RULES:
+        if evaluator is None:
+            execute_batch(rule, contexts)
+        else:
+            evaluator.execute_batch(rule, contexts)
+    return len(RULES) * len(contexts) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--contexts", type=int, default=200000)
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument(
+        "--tiering-threshold",
+        type=int,
+        default=None,
+        help="compile rules after this many calls (off by default, as in execute())",
+    )
+    args = parser.parse_args()
+    configure_tiering(threshold=args.tiering_threshold)
+
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"Python {sys.version.split()[0]}, GIL {'enabled' if gil else 'disabled'}")
+    contexts = _contexts(args.contexts)
+    # Warms up, and with --tiering-threshold compiles the rules before timing
+    _run(None, contexts[:5000])
+
+    baseline = _run(None, contexts)
+    print(f"execute_batch: {baseline:,.0f} evaluations/s")
+    for threads in range(1, args.max_threads + 1):
+        with ThreadPoolEvaluator(threads, chunk_size=args.chunk_size) as evaluator:
+            throughput = _run(evaluator, contexts)
+        print(
+            f"{threads} threads: {throughput:,.0f} evaluations/s "
+            f"({throughput / baseline:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,51 @@
+import sys
+import threading
+import weakref
 from functools import wraps
 from typing import Dict, List, Sequence, Union
 
+
 # This is a value that will never match any operator. It is useful when evaluating multiple
 # rule sets and want to ignore rule sets targeting a specific field
-NEVER_MATCH = object()
+class _NeverMatch:
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "NEVER_MATCH"
+
+    def __reduce__(self) -> str:
+        # Pickled by reference, so contexts sent to other processes keep it
+        return "NEVER_MATCH"
+
+
+NEVER_MATCH = _NeverMatch()
 
 
 class JsonOperationError(Exception):
     pass
 
 
+class EvaluationBudget:
+    """
+    Limits the work done by one evaluation. Every operation costs 1 plus the length of
+    its list and string values. Once max_cost is exceeded the evaluation is aborted
+    with a JsonOperationError
+    """
+
+    def __init__(self, max_cost: int):
+        self.max_cost = max_cost
+        self.used = 0
+
+    def charge(self, values):
+        self.used += 1 + sum(
+            len(value) for value in values if isinstance(value, (list, str, dict))
+        )
+        if self.used > self.max_cost:
+            raise JsonOperationError(
+                f"Evaluation budget of {self.max_cost} exceeded ({self.used})"
+            )
+
+
 def get_json_schema() -> Dict:
     return {
         "$schema": "http://json-schema.org/draft-07/schema",
@@ -259,6 +295,11 @@ def _get_key(context, key, default=None):
         return context
 
 
+def _is_key_operation(val):
+    # Check if an operand of a non nesting operation is a key operation
+    return isinstance(val, list) and 2 >= len(val) <= 3 and val[0] == "key"
+
+
 def _execute_operation(operation: str, values):
     if NEVER_MATCH in values:
         return False
@@ -267,6 +308,16 @@ def _execute_operation(operation: str, values):
 
 
 def get_keys(json_operation: List) -> List[Dict]:
+    """
+    Thread safe: it doesn't modify the operation, or any shared state
+    """
+    try:
+        return _get_keys(json_operation)
+    except RecursionError:
+        raise JsonOperationError("Operation is nested too deeply")
+
+
+def _get_keys(json_operation: List) -> List[Dict]:
     operator, *unparsed = json_operation
 
     keys = []
@@ -278,7 +329,7 @@ def get_keys(json_operation: List) -> List[Dict]:
     val = None
     for index, item in enumerate(unparsed):
         if isinstance(item, list):
-            results = get_keys(item)
+            results = _get_keys(item)
             for result in results:
                 if result["index"] is None:
                     result["index"] = index
@@ -315,7 +366,7 @@ def get_keys(json_operation: List) -> List[Dict]:
     return keys + subkeys
 
 
-def _execute_base(json_operation: List, context, handler, prefix=""):
+def _execute_base(json_operation: List, context, handler, prefix="", budget=None):
     # Stop the recursion, we have reached a literal
     if not isinstance(json_operation, list):
         return json_operation
@@ -328,14 +379,14 @@ def _execute_base(json_operation: List, context, handler, prefix=""):
                 context,
                 handler,
                 prefix=".".join([prefix, str(index)]) if prefix else str(index),
+                budget=budget,
             )
             for index, val in enumerate(unparsed)
         ]
     else:
         values = []
         for val in unparsed:
-            # Check if it's a key operation
-            if isinstance(val, list) and 2 >= len(val) <= 3 and val[0] == "key":
+            if _is_key_operation(val):
                 values.append(_get_key(context, *val[1:]))
             else:
                 values.append(val)
@@ -346,6 +397,9 @@ def _execute_base(json_operation: List, context, handler, prefix=""):
     if operator not in _operators:
         raise JsonOperationError(f"Invalid operator: {operator}. {json_operation}")
 
+    if budget is not None:
+        budget.charge(values)
+
     try:
         return handler(_execute_operation(operator, values), prefix)
     except TypeError as e:
@@ -356,13 +410,164 @@ def _boolean_handler(value, prefix):
     return value
 
 
-def execute(json_operation: List, context) -> bool:
-    return _execute_base(
-        json_operation=json_operation, context=context, handler=_boolean_handler
-    )
+class _TieringThread:
+    """
+    A thread's call counts. Entries are [operation, calls, compiled function, or None
+    until compiled, or False if the operation can't be compiled]
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.fallbacks = 0
+
+
+class _Tiering:
+    """
+    Counts the calls to execute() for each operation (by identity), and compiles the
+    operations called threshold times (see json_operations.compiler). Off unless
+    configured, as compiled operations are looked up by identity: an operation changed
+    after it was compiled keeps the compiled result of the operation it was.
+
+    Without the GIL, calls are counted per thread and compiled functions are shared,
+    so execute() never writes to state other threads write to. The lock is only taken
+    the first time a thread calls execute() and when an operation is compiled. With
+    the GIL, threads share their counts, which is faster than looking up thread locals
+    """
+
+    def __init__(self):
+        self.threshold = None
+        self.max_tracked = 10000
+        self.max_compiled = 1000
+        self.per_thread = not getattr(sys, "_is_gil_enabled", lambda: True)()
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        # (weak reference to the thread or None if shared, _TieringThread)
+        self.threads = []
+        # Operation id -> (operation, compiled function)
+        self.compiled = {}
+        # The state shared by all threads, or None to use the thread's
+        self.state = None
+        self.local = threading.local()
+        if not self.per_thread:
+            self.state = _TieringThread()
+            self.threads.append((None, self.state))
+
+    def thread(self) -> _TieringThread:
+        state = getattr(self.local, "state", None)
+        if state is None:
+            state = self.local.state = _TieringThread()
+            with self.lock:
+                self.threads = self._running()
+                self.threads.append((weakref.ref(threading.current_thread()), state))
+        return state
+
+    def _running(self) -> List:
+        running = []
+        for reference, state in self.threads:
+            if reference is not None:
+                thread = reference()
+                if thread is None or not thread.is_alive():
+                    continue
+            running.append((reference, state))
+        return running
+
+    def states(self) -> List[_TieringThread]:
+        """
+        The states of the threads still running
+        """
+        with self.lock:
+            self.threads = self._running()
+            return [state for _, state in self.threads]
+
+    def track(self, state: _TieringThread, json_operation: List) -> List:
+        if len(state.entries) >= self.max_tracked:
+            # Forget the operations that weren't called often enough. Copied first, as
+            # other threads may be adding entries when the state is shared
+            state.entries = {
+                key: entry for key, entry in state.entries.copy().items() if entry[2]
+            }
+        entry = state.entries[id(json_operation)] = [json_operation, 0, None]
+        return entry
+
+    def compile(self, entry: List):
+        json_operation = entry[0]
+        shared = self.compiled.get(id(json_operation))
+        if shared is not None:
+            # Compiled by another thread
+            entry[2] = shared[1]
+            return
+        if len(self.compiled) >= self.max_compiled:
+            # Keep interpreting, rather than evicting an operation that is hot too (and
+            # compiling it again when it's called next). The table only shrinks when
+            # reset, which forgets the entries too
+            entry[2] = False
+            return
+
+        from json_operations.compiler import _compile
+
+        compiled = _compile(json_operation)
+        if compiled is None:
+            entry[2] = False
+            return
+        with self.lock:
+            shared = self.compiled.get(id(json_operation))
+            if shared is None and len(self.compiled) < self.max_compiled:
+                # The table keeps the operation alive, so its id isn't reused
+                shared = self.compiled[id(json_operation)] = (json_operation, compiled)
+        if shared is not None:
+            entry[2] = shared[1]
+
+
+_tiering = _Tiering()
+
+
+def execute(json_operation: List, context, budget: int = None) -> bool:
+    """
+    Thread safe: it doesn't modify the operation or the context, and the call counts
+    and compiled operations it keeps (see _Tiering) can be used from any thread
+    """
+    if budget is None and _tiering.threshold is not None:
+        state = _tiering.state
+        if state is None:
+            try:
+                state = _tiering.local.state
+            except AttributeError:
+                state = _tiering.thread()
+        entry = state.entries.get(id(json_operation))
+        if entry is None or entry[0] is not json_operation:
+            if isinstance(json_operation, list):
+                entry = _tiering.track(state, json_operation)
+            else:
+                entry = None
+        if entry is not None:
+            entry[1] += 1
+            compiled = entry[2]
+            if compiled:
+                try:
+                    return compiled(context)
+                except Exception:
+                    # The interpreter raises the error
+                    state.fallbacks += 1
+            elif compiled is None and entry[1] >= _tiering.threshold:
+                _tiering.compile(entry)
+
+    try:
+        return _execute_base(
+            json_operation=json_operation,
+            context=context,
+            handler=_boolean_handler,
+            budget=None if budget is None else EvaluationBudget(budget),
+        )
+    except RecursionError:
+        raise JsonOperationError("Operation is nested too deeply")
 
 
 def execute_debug(json_operation: List, context) -> bool:
+    """
+    Thread safe: it doesn't modify the operation or the context, or any shared state
+    """
     results = []
 
     def _debug_handler(value, prefix):
@@ -370,8 +575,11 @@ def execute_debug(json_operation: List, context) -> bool:
         results.append((prefix, value))
         return value
 
-    _execute_base(
-        json_operation=json_operation, context=context, handler=_debug_handler
-    )
+    try:
+        _execute_base(
+            json_operation=json_operation, context=context, handler=_debug_handler
+        )
+    except RecursionError:
+        raise JsonOperationError("Operation is nested too deeply")
 
     return dict(results)
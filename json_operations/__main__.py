@@ -0,0 +1,144 @@
+"""
+python -m json_operations serve|loadgen|archive|backtest
+"""
+import argparse
+import json
+import sys
+
+from json_operations.server import Evaluator, make_server, run_load
+
+
+def _serve(args):
+    evaluator = Evaluator(max_batch=args.max_batch, max_delay=args.max_delay)
+    for rule_set in args.rules:
+        name, _, path = rule_set.partition("=")
+        with open(path) as f:
+            evaluator.set_rule_set(name, json.load(f))
+
+    server = make_server(evaluator, args.host, args.port, args.unix_socket)
+    address = args.unix_socket or f"{args.host}:{args.port}"
+    print(f"Serving json operations on {address}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        evaluator.close()
+
+
+def _loadgen(args):
+    if args.rule_set is not None:
+        body = {"rule_set": args.rule_set}
+    else:
+        body = {"operation": json.loads(args.operation)}
+    body["context"] = json.loads(args.context)
+
+    report = run_load(
+        body,
+        requests=args.requests,
+        concurrency=args.concurrency,
+        host=args.host,
+        port=args.port,
+        unix_socket=args.unix_socket,
+    )
+    print(json.dumps(report, indent=2))
+
+
+def _load_rules(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _archive(args):
+    from json_operations.backtest import convert
+
+    rules = _load_rules(args.rules)
+    operations = list(rules.values())
+    if args.baseline is not None:
+        operations.append(json.loads(args.baseline))
+    count = convert(args.source, args.archive, operations, keys=args.key)
+    print(f"Archived {count} contexts to {args.archive}", file=sys.stderr)
+
+
+def _backtest(args):
+    from json_operations.backtest import Archive
+
+    baseline = json.loads(args.baseline) if args.baseline is not None else None
+    with Archive(args.archive) as archive:
+        results = archive.backtest(_load_rules(args.rules), baseline=baseline)
+    report = {
+        name: {
+            "matches": result.matches,
+            "added": result.added,
+            "removed": result.removed,
+        }
+        for name, result in results.items()
+    }
+    print(json.dumps(report, indent=2))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m json_operations")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    serve = commands.add_parser("serve", help="Run the evaluation server")
+    loadgen = commands.add_parser("loadgen", help="Load test a running server")
+    for command in (serve, loadgen):
+        command.add_argument("--host", default="127.0.0.1")
+        command.add_argument("--port", type=int, default=8080)
+        command.add_argument("--unix-socket", help="Use a Unix socket instead of TCP")
+
+    serve.add_argument(
+        "--rules",
+        action="append",
+        default=[],
+        metavar="NAME=PATH",
+        help='Load a rule set from a JSON file of {"<rule id>": <operations>}',
+    )
+    serve.add_argument(
+        "--max-batch", type=int, default=64, help="Most requests evaluated together"
+    )
+    serve.add_argument(
+        "--max-delay",
+        type=float,
+        default=0.001,
+        help="Seconds to wait for more requests to batch together",
+    )
+    serve.set_defaults(handler=_serve)
+
+    target = loadgen.add_mutually_exclusive_group(required=True)
+    target.add_argument("--rule-set", help="Name of the rule set to match")
+    target.add_argument("--operation", help="JSON operations to evaluate")
+    loadgen.add_argument("--context", default="{}", help="JSON context")
+    loadgen.add_argument("--requests", type=int, default=10000)
+    loadgen.add_argument("--concurrency", type=int, default=8)
+    loadgen.set_defaults(handler=_loadgen)
+
+    archive = commands.add_parser(
+        "archive", help="Convert JSON Lines contexts into an archive for backtests"
+    )
+    archive.add_argument("source", help="JSON Lines file, one context per line")
+    archive.add_argument("archive", help="Path of the archive to write")
+    archive.add_argument("--key", action="append", default=[], help="Extra key to keep")
+    archive.set_defaults(handler=_archive)
+
+    backtest = commands.add_parser("backtest", help="Evaluate rules over an archive")
+    backtest.add_argument("archive", help="Archive written by the archive command")
+    backtest.set_defaults(handler=_backtest)
+
+    for command in (archive, backtest):
+        command.add_argument(
+            "--rules",
+            required=True,
+            help='JSON file of {"<rule id>": <operations>}',
+        )
+        command.add_argument("--baseline", help="JSON operations to compare with")
+
+    args = parser.parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
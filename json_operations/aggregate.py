@@ -0,0 +1,149 @@
+"""
+Per rule and per node counters over a stream of contexts, for tuning rules.
+"""
+from typing import Dict, Iterable, List
+
+from json_operations import (
+    NEVER_MATCH,
+    JsonOperationError,
+    _execute_base,
+    _get_key,
+    _is_key_operation,
+    _nesting_operators,
+)
+
+_MISSING = object()
+
+# Indexes of the node counters
+_TRUE = 0
+_FALSE = 1
+_MISSING_KEY = 2
+_NEVER_MATCH = 3
+
+
+def _node_keys(json_operation, prefix: str, keys: Dict[str, List[str]]):
+    # Collects the keys fetched by each node, under the prefix execute_debug reports
+    # the node's result with
+    if not isinstance(json_operation, list) or not json_operation:
+        return
+
+    operator, *unparsed = json_operation
+    if operator == "key":
+        return
+
+    node_keys = []
+    if operator in _nesting_operators:
+        for index, val in enumerate(unparsed):
+            if isinstance(val, list) and val[:1] == ["key"] and len(val) > 1:
+                node_keys.append(val[1])
+            else:
+                path = ".".join([prefix, str(index)]) if prefix else str(index)
+                _node_keys(val, path, keys)
+    else:
+        node_keys = [
+            val[1] for val in unparsed if _is_key_operation(val) and len(val) > 1
+        ]
+    keys[prefix] = node_keys
+
+
+class _RuleCounts:
+    def __init__(self, json_operation):
+        self.json_operation = json_operation
+        self.keys: Dict[str, List[str]] = {}
+        _node_keys(json_operation, "", self.keys)
+        self.events = 0
+        self.matched = 0
+        self.errors = 0
+        # Path -> [true, false, missing key, never match]
+        self.nodes: Dict[str, List[int]] = {}
+
+    def add(self, context):
+        keys = self.keys
+        nodes = self.nodes
+
+        def handler(value, prefix):
+            counts = nodes.get(prefix)
+            if counts is None:
+                counts = nodes[prefix] = [0, 0, 0, 0]
+            counts[_TRUE if value else _FALSE] += 1
+
+            missing = never_match = False
+            for key in keys.get(prefix, ()):
+                resolved = _get_key(context, key, _MISSING)
+                missing = missing or resolved is _MISSING
+                never_match = never_match or resolved is NEVER_MATCH
+            counts[_MISSING_KEY] += missing
+            counts[_NEVER_MATCH] += never_match
+            return value
+
+        self.events += 1
+        try:
+            if _execute_base(self.json_operation, context, handler):
+                self.matched += 1
+        except JsonOperationError:
+            self.errors += 1
+
+    def merge(self, other: "_RuleCounts"):
+        self.events += other.events
+        self.matched += other.matched
+        self.errors += other.errors
+        for path, other_counts in other.nodes.items():
+            counts = self.nodes.setdefault(path, [0, 0, 0, 0])
+            for index, count in enumerate(other_counts):
+                counts[index] += count
+
+    def summary(self) -> Dict:
+        return {
+            "events": self.events,
+            "matched": self.matched,
+            "errors": self.errors,
+            "nodes": {
+                path: {
+                    "true": counts[_TRUE],
+                    "false": counts[_FALSE],
+                    "missing_key": counts[_MISSING_KEY],
+                    "never_match": counts[_NEVER_MATCH],
+                }
+                for path, counts in sorted(self.nodes.items())
+            },
+        }
+
+
+class Aggregator:
+    """
+    Evaluates rules (a dict of rule id to json operations) against a stream of contexts
+    and counts, for each rule, the contexts it matched or raised an error for and, for
+    each node, how often it was true or false, and how often one of the keys it uses
+    was missing or NEVER_MATCH. Nodes use the paths execute_debug reports.
+
+    Aggregators with the same rules (e.g. from different processes, they can be pickled)
+    can be merged
+    """
+
+    def __init__(self, rules: Dict):
+        self._rules = {
+            rule_id: _RuleCounts(json_operation)
+            for rule_id, json_operation in rules.items()
+        }
+
+    def add(self, context):
+        for counts in self._rules.values():
+            counts.add(context)
+
+    def consume(self, contexts: Iterable) -> "Aggregator":
+        for context in contexts:
+            self.add(context)
+        return self
+
+    def merge(self, other: "Aggregator") -> "Aggregator":
+        if self._rules.keys() != other._rules.keys():
+            raise ValueError("Only aggregators of the same rules can be merged")
+        for rule_id, counts in self._rules.items():
+            other_counts = other._rules[rule_id]
+            if counts.json_operation != other_counts.json_operation:
+                raise ValueError(f"Rule {rule_id!r} is different in the aggregators")
+            counts.merge(other_counts)
+        return self
+
+    def summary(self) -> Dict:
+        return {rule_id: counts.summary() for rule_id, counts in self._rules.items()}
@@ -0,0 +1,257 @@
+"""
+Backtesting of json operations against historical contexts. A JSON Lines corpus is
+converted once into an archive holding only the keys the operations use, as typed
+columns with null bitmaps in an Arrow file. The archive is memory mapped, so each
+backtest reads the columns in place instead of parsing JSON again.
+
+Install the arrow extra to use it:
+    pip install json-operations[arrow]
+"""
+import json
+import os
+import tempfile
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from json_operations import JsonOperationError, _get_key, get_keys
+from json_operations.table import _ArrowEvaluator, _python_column, np, pa
+
+# Field metadata of the columns holding JSON encoded values, for keys with values of
+# different types or lists and objects
+_JSON_COLUMN = b"json_operations.json"
+# Larger integers lose precision in a float column
+_MAX_FLOAT_INTEGER = 2**53
+
+
+class BacktestResult(NamedTuple):
+    matches: int
+    # Rows matching the operation but not the baseline, and the other way around. None
+    # without a baseline
+    added: Optional[int]
+    removed: Optional[int]
+    added_rows: Optional["np.ndarray"]
+    removed_rows: Optional["np.ndarray"]
+
+
+def _require_arrow():
+    if pa is None:
+        raise JsonOperationError("Install the arrow extra to use backtesting")
+
+
+def _keys(json_operations: Iterable) -> List[str]:
+    keys = {}
+    for json_operation in json_operations:
+        if isinstance(json_operation, list):
+            for key in get_keys(json_operation):
+                keys.setdefault(str(key["name"]), None)
+    return list(keys)
+
+
+def _value_kind(value) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, int):
+        return "integer" if abs(value) <= _MAX_FLOAT_INTEGER else "object"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, str):
+        return "string"
+    return "object"
+
+
+def _field(key: str, kinds: set) -> "pa.Field":
+    kinds = kinds - {"null"}
+    if not kinds:
+        return pa.field(key, pa.null())
+    if kinds == {"boolean"}:
+        return pa.field(key, pa.bool_())
+    if kinds == {"integer"}:
+        return pa.field(key, pa.int64())
+    if kinds <= {"integer", "float"}:
+        return pa.field(key, pa.float64())
+    if kinds == {"string"}:
+        return pa.field(key, pa.large_string())
+    return pa.field(key, pa.large_string(), metadata={_JSON_COLUMN: b"1"})
+
+
+def _project(context, key: str):
+    try:
+        return _get_key(context, key)
+    except IndexError:
+        return None
+
+
+def convert(
+    source: str,
+    path: str,
+    json_operations: Iterable,
+    keys: Iterable = (),
+    batch_size: int = 65536,
+) -> int:
+    """
+    Converts the JSON Lines file source (one context per line) into an archive at path
+    with the keys json_operations use (and keys). The archive is written next to path
+    and renamed over it. Returns the number of rows.
+
+    Missing keys, and list indexes out of range, are stored as nulls
+    """
+    _require_arrow()
+    keys = list(dict.fromkeys(_keys(json_operations) + [str(key) for key in keys]))
+    kinds = [set() for _ in keys]
+
+    # The contexts are parsed once, and their values for the keys kept in a temporary
+    # file until the type of every column is known
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as projected:
+        with open(source, encoding="utf-8") as lines:
+            for line in lines:
+                if not line.strip():
+                    continue
+                context = json.loads(line)
+                row = [_project(context, key) for key in keys]
+                for key_kinds, value in zip(kinds, row):
+                    key_kinds.add(_value_kind(value))
+                projected.write(json.dumps(row, separators=(",", ":")))
+                projected.write("\n")
+
+        schema = pa.schema(
+            [_field(key, key_kinds) for key, key_kinds in zip(keys, kinds)]
+        )
+        encoded = [field.metadata is not None for field in schema]
+
+        def write_batch(writer, rows):
+            columns = []
+            for index, field in enumerate(schema):
+                values = [row[index] for row in rows]
+                if encoded[index]:
+                    values = [
+                        None if value is None else json.dumps(value) for value in values
+                    ]
+                columns.append(pa.array(values, type=field.type))
+            writer.write_batch(pa.record_batch(columns, schema=schema))
+
+        projected.seek(0)
+        count = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temporary_path = tempfile.mkstemp(dir=directory, prefix=".archive-")
+        try:
+            with os.fdopen(fd, "wb") as f, pa.ipc.new_file(f, schema) as writer:
+                rows = []
+                for line in projected:
+                    rows.append(json.loads(line))
+                    if len(rows) == batch_size:
+                        write_batch(writer, rows)
+                        count += len(rows)
+                        rows = []
+                if rows or not count:
+                    write_batch(writer, rows)
+                    count += len(rows)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+    return count
+
+
+class _ArchiveEvaluator(_ArrowEvaluator):
+    def __init__(self, batch, json_keys: set):
+        super().__init__(batch)
+        self._json_keys = json_keys
+
+    def _column(self, key):
+        if key not in self.table.column_names:
+            raise JsonOperationError(
+                f"Key {key} is not in the archive. Convert the contexts again with "
+                "the operations using it"
+            )
+        if key in self._json_keys:
+            return _python_column(
+                [
+                    None if value is None else json.loads(value)
+                    for value in self.table.column(key).to_pylist()
+                ]
+            )
+        return super()._column(key)
+
+
+class Archive:
+    """
+    An archive written by convert(), memory mapped. Operations are evaluated with
+    execute_table() semantics over its record batches
+    """
+
+    def __init__(self, path: str):
+        _require_arrow()
+        self.path = path
+        self._source = pa.memory_map(path)
+        reader = pa.ipc.open_file(self._source)
+        self._batches = [reader.get_batch(i) for i in range(reader.num_record_batches)]
+        self.schema = reader.schema
+        self.keys = self.schema.names
+        self._json_keys = {
+            field.name
+            for field in self.schema
+            if field.metadata and _JSON_COLUMN in field.metadata
+        }
+
+    def __len__(self) -> int:
+        return sum(batch.num_rows for batch in self._batches)
+
+    def close(self):
+        self._batches = []
+        self._source.close()
+
+    def __enter__(self) -> "Archive":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _masks(self, json_operations: Dict) -> Dict:
+        masks = {name: [] for name in json_operations}
+        for batch in self._batches:
+            # Shared by the operations, so each column is only read once per batch
+            evaluator = _ArchiveEvaluator(batch, self._json_keys)
+            for name, json_operation in json_operations.items():
+                masks[name].append(
+                    np.asarray(evaluator.evaluate(json_operation), dtype=bool)
+                )
+        return {
+            name: np.concatenate(batches) if batches else np.zeros(0, dtype=bool)
+            for name, batches in masks.items()
+        }
+
+    def evaluate(self, json_operation) -> "np.ndarray":
+        """
+        Returns the boolean mask of the rows matching the operation
+        """
+        return self._masks({None: json_operation})[None]
+
+    def backtest(self, json_operations: Dict, baseline=None) -> Dict:
+        """
+        Evaluates json_operations (a dict of name to json operations) over the archive.
+        Returns a dict of name to BacktestResult, with the rows that changed compared
+        to the baseline operation if one is given
+        """
+        operations = {("operation", name): op for name, op in json_operations.items()}
+        if baseline is not None:
+            operations[("baseline", None)] = baseline
+        masks = self._masks(operations)
+
+        results = {}
+        for name in json_operations:
+            mask = masks[("operation", name)]
+            if baseline is None:
+                results[name] = BacktestResult(int(mask.sum()), None, None, None, None)
+                continue
+            baseline_mask = masks[("baseline", None)]
+            added_rows = np.flatnonzero(mask & ~baseline_mask)
+            removed_rows = np.flatnonzero(baseline_mask & ~mask)
+            results[name] = BacktestResult(
+                int(mask.sum()),
+                len(added_rows),
+                len(removed_rows),
+                added_rows,
+                removed_rows,
+            )
+        return results
@@ -0,0 +1,106 @@
+"""
+Evaluation of one json operation against many contexts.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+from json_operations import execute
+from json_operations.bitset import Bitset, _BitsetBuilder
+
+
+def execute_batch(
+    json_operation: List, contexts: Iterable, bitset: bool = False
+) -> Union[List[bool], Bitset]:
+    """
+    Runs the json operations against every context. Returns a list of results, or
+    with bitset=True a Bitset with one bit per context (8x to 64x smaller than a
+    list, and cheap to combine with other results)
+    """
+    if not bitset:
+        return [execute(json_operation, context) for context in contexts]
+
+    builder = _BitsetBuilder()
+    append = builder.append
+    for context in contexts:
+        append(execute(json_operation, context))
+    return builder.build()
+
+
+def _execute_chunk(json_operation: List, contexts: Sequence) -> List:
+    return [execute(json_operation, context) for context in contexts]
+
+
+def _execute_rules_chunk(rules: Dict, contexts: Sequence) -> List[Dict]:
+    return [
+        {
+            rule_id: execute(json_operation, context)
+            for rule_id, json_operation in rules.items()
+        }
+        for context in contexts
+    ]
+
+
+class ThreadPoolEvaluator:
+    """
+    Evaluates json operations on a pool of threads. On free-threaded CPython the
+    threads run in parallel. With the GIL they take turns, so it is no faster than
+    execute_batch().
+
+    Contexts are split into chunks of chunk_size so each task amortizes the cost of
+    handing it to a thread. Results are in the same order as the contexts, and an
+    error raised evaluating any context is raised to the caller
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, chunk_size: int = 256):
+        self.chunk_size = chunk_size
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="json-operations"
+        )
+
+    def _chunks(self, contexts: Iterable) -> List[Sequence]:
+        if not isinstance(contexts, Sequence):
+            contexts = list(contexts)
+        return [
+            contexts[start : start + self.chunk_size]
+            for start in range(0, len(contexts), self.chunk_size)
+        ]
+
+    def execute_batch(
+        self, json_operation: List, contexts: Iterable, bitset: bool = False
+    ) -> Union[List[bool], Bitset]:
+        """
+        Same as execute_batch(), with the contexts evaluated on the pool
+        """
+        chunks = self._chunks(contexts)
+        results = self._executor.map(
+            _execute_chunk, [json_operation] * len(chunks), chunks
+        )
+        if not bitset:
+            return [result for chunk in results for result in chunk]
+
+        builder = _BitsetBuilder()
+        append = builder.append
+        for chunk in results:
+            for result in chunk:
+                append(result)
+        return builder.build()
+
+    def execute_rules(self, rules: Dict, contexts: Iterable) -> List[Dict]:
+        """
+        Runs every rule (a dict of rule id to json operations) against every context.
+        Returns a dict of rule id to result for each context
+        """
+        chunks = self._chunks(contexts)
+        results = self._executor.map(
+            _execute_rules_chunk, [rules] * len(chunks), chunks
+        )
+        return [result for chunk in results for result in chunk]
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self) -> "ThreadPoolEvaluator":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
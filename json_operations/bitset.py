@@ -0,0 +1,185 @@
+"""
+A compact set of row indexes, one bit per row, for combining the results of batch
+evaluations.
+"""
+from typing import Iterable, Iterator, List
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+# The set bits of every possible byte
+_byte_indexes: List[List[int]] = [
+    [bit for bit in range(8) if byte & (1 << bit)] for byte in range(256)
+]
+
+
+def _popcount(value: int) -> int:
+    try:
+        return value.bit_count()
+    except AttributeError:  # pragma: no cover
+        # Python < 3.10
+        return bin(value).count("1")
+
+
+class Bitset:
+    """
+    A fixed length sequence of bits stored in a bytearray, least significant bit
+    first (the layout of numpy.packbits(bitorder="little")).
+
+    &, |, ^ and ~ work on whole bitsets at once by converting them to integers, so
+    combining results never loops over rows in python.
+    """
+
+    __slots__ = ("_data", "_length")
+
+    def __init__(self, length: int = 0, data: bytes = None):
+        size = (length + 7) >> 3
+        if data is None:
+            data = bytearray(size)
+        elif len(data) != size:
+            raise ValueError(f"Expected {size} bytes for {length} bits")
+        self._data = bytearray(data)
+        self._length = length
+        self._clear_padding()
+
+    @classmethod
+    def from_bools(cls, values: Iterable) -> "Bitset":
+        builder = _BitsetBuilder()
+        for value in values:
+            builder.append(value)
+        return builder.build()
+
+    @classmethod
+    def from_indexes(cls, indexes: Iterable[int], length: int) -> "Bitset":
+        bitset = cls(length)
+        data = bitset._data
+        for index in indexes:
+            if not 0 <= index < length:
+                raise IndexError(f"Bit index {index} out of range")
+            data[index >> 3] |= 1 << (index & 7)
+        return bitset
+
+    @classmethod
+    def from_numpy(cls, array, length: int = None) -> "Bitset":
+        """
+        Takes a numpy boolean array, or a uint8 array packed with
+        numpy.packbits(bitorder="little") and its length in bits
+        """
+        if array.dtype == np.bool_:
+            length = len(array)
+            array = np.packbits(array, bitorder="little")
+        elif length is None:
+            raise ValueError("length is required for packed arrays")
+        return cls(length, array.tobytes())
+
+    def _clear_padding(self):
+        # Bits past the end must stay 0, so counts and comparisons ignore them
+        extra = self._length & 7
+        if extra:
+            self._data[-1] &= (1 << extra) - 1
+
+    def _from_int(self, value: int) -> "Bitset":
+        return Bitset(self._length, value.to_bytes(len(self._data), "little"))
+
+    def _int(self) -> int:
+        return int.from_bytes(self._data, "little")
+
+    def _check_length(self, other: "Bitset"):
+        if not isinstance(other, Bitset):
+            raise TypeError(f"Cannot combine Bitset and {type(other).__name__}")
+        if other._length != self._length:
+            raise ValueError(
+                f"Bitsets have different lengths {self._length} and {other._length}"
+            )
+
+    def __and__(self, other: "Bitset") -> "Bitset":
+        self._check_length(other)
+        return self._from_int(self._int() & other._int())
+
+    def __or__(self, other: "Bitset") -> "Bitset":
+        self._check_length(other)
+        return self._from_int(self._int() | other._int())
+
+    def __xor__(self, other: "Bitset") -> "Bitset":
+        self._check_length(other)
+        return self._from_int(self._int() ^ other._int())
+
+    def __invert__(self) -> "Bitset":
+        return self._from_int(~self._int() & ((1 << (len(self._data) * 8)) - 1))
+
+    def __sub__(self, other: "Bitset") -> "Bitset":
+        self._check_length(other)
+        return self._from_int(self._int() & ~other._int())
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Bitset):
+            return NotImplemented
+        return self._length == other._length and self._data == other._data
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index: int) -> bool:
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("Bitset index out of range")
+        return bool(self._data[index >> 3] & (1 << (index & 7)))
+
+    def __iter__(self) -> Iterator[int]:
+        # Yields the indexes of the set bits, skipping over empty bytes
+        for offset, byte in enumerate(self._data):
+            if byte:
+                start = offset << 3
+                for bit in _byte_indexes[byte]:
+                    yield start + bit
+
+    def __repr__(self) -> str:
+        return f"Bitset(length={self._length}, count={self.count()})"
+
+    def count(self) -> int:
+        return _popcount(self._int())
+
+    def any(self) -> bool:
+        return any(self._data)
+
+    def to_bools(self) -> List[bool]:
+        return [self[index] for index in range(self._length)]
+
+    def to_bytes(self) -> bytes:
+        return bytes(self._data)
+
+    def to_numpy(self, packed: bool = True):
+        """
+        Returns the packed bits as a uint8 array, or a boolean array with
+        packed=False
+        """
+        data = np.frombuffer(bytes(self._data), dtype=np.uint8)
+        if packed:
+            return data
+        return np.unpackbits(data, count=self._length, bitorder="little").astype(bool)
+
+
+class _BitsetBuilder:
+    """
+    Appends bits one at a time, for when the number of rows isn't known up front
+    """
+
+    __slots__ = ("_data", "_length")
+
+    def __init__(self):
+        self._data = bytearray()
+        self._length = 0
+
+    def append(self, value):
+        index = self._length
+        if not index & 7:
+            self._data.append(0)
+        if value:
+            self._data[index >> 3] |= 1 << (index & 7)
+        self._length = index + 1
+
+    def build(self) -> Bitset:
+        return Bitset(self._length, self._data)
@@ -0,0 +1,471 @@
+"""
+Compilation of json operations into Python functions, used by execute() for operations
+that are executed often.
+
+The generated code never contains values from the operation: literals and key paths are
+passed in as constants, and the generated source is checked against a small set of
+allowed syntax before it is compiled.
+"""
+import ast
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from json_operations import (
+    NEVER_MATCH,
+    _is_key_operation,
+    _nesting_operators,
+    _operators,
+    _tiering,
+)
+
+# Types for which the generated code inlines operators. Values of other types go
+# through the same functions the interpreter uses
+_PLAIN_TYPES = frozenset({str, int, float, bool, type(None), list, dict})
+_HASHABLE_TYPES = frozenset({str, int, float, bool, type(None)})
+
+_OPERATOR_NAMES = {
+    "=": "op_equal",
+    "==": "op_equal",
+    "!=": "op_not_equal",
+    ">": "op_greater",
+    ">=": "op_greater_or_equal",
+    "<": "op_less",
+    "<=": "op_less_or_equal",
+    "null": "op_null",
+    "!null": "op_not_null",
+    "in": "op_in",
+    "nin": "op_not_in",
+    "!in": "op_not_in",
+    "btw": "op_between",
+    "&": "op_intersection",
+    "!&": "op_not_intersection",
+}
+_COMPARISONS = {
+    "=": "==",
+    "==": "==",
+    "!=": "!=",
+    ">": ">",
+    ">=": ">=",
+    "<": "<",
+    "<=": "<=",
+}
+
+# Larger operations are left to the interpreter
+_MAX_NODES = 5000
+
+_MISSING = object()
+
+
+def _lookup(context, parts, default):
+    # Same as _get_key, with the key already split
+    try:
+        for part in parts:
+            if type(context) is dict:
+                context = context.get(part, _MISSING)
+                if context is _MISSING:
+                    return default
+            else:
+                try:
+                    context = context[part]
+                except TypeError:
+                    context = context[int(part)]
+    except (KeyError, TypeError, ValueError):
+        return default
+    return context
+
+
+_GLOBALS = {
+    "__builtins__": {},
+    "NEVER_MATCH": NEVER_MATCH,
+    "_lookup": _lookup,
+    "bool": bool,
+    "type": type,
+    "int": int,
+    "float": float,
+    "str": str,
+    "list": list,
+    "set": set,
+    "dict": dict,
+    "PLAIN": _PLAIN_TYPES,
+    "HASHABLE": _HASHABLE_TYPES,
+}
+for _operator, _name in _OPERATOR_NAMES.items():
+    _GLOBALS[_name] = _operators[_operator]
+
+_ALLOWED_NODES = (
+    ast.Module,
+    ast.FunctionDef,
+    ast.arguments,
+    ast.arg,
+    ast.Return,
+    ast.Assign,
+    ast.Name,
+    ast.Load,
+    ast.Store,
+    ast.Subscript,
+    ast.Constant,
+    ast.Compare,
+    ast.BoolOp,
+    ast.UnaryOp,
+    ast.IfExp,
+    ast.Call,
+    ast.Attribute,
+    ast.Tuple,
+    ast.And,
+    ast.Or,
+    ast.Not,
+    ast.Is,
+    ast.IsNot,
+    ast.In,
+    ast.NotIn,
+    ast.Eq,
+    ast.NotEq,
+    ast.Gt,
+    ast.GtE,
+    ast.Lt,
+    ast.LtE,
+) + tuple(
+    # Python < 3.8 / < 3.9 node types
+    getattr(ast, name)
+    for name in ("Index", "Num", "Str", "NameConstant")
+    if hasattr(ast, name)
+)
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def _validate(tree: ast.AST, names: set):
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise _Unsupported(f"{type(node).__name__} is not allowed")
+        if isinstance(node, ast.Name) and node.id not in names:
+            raise _Unsupported(f"{node.id} is not allowed")
+        if isinstance(node, ast.Attribute) and node.attr not in ("get", "isdisjoint"):
+            raise _Unsupported(f"{node.attr} is not allowed")
+        if isinstance(node, ast.Subscript) and not (
+            isinstance(node.value, ast.Name) and node.value.id == "values"
+        ):
+            raise _Unsupported("Only values can be indexed")
+        if isinstance(node, ast.Call) and not isinstance(
+            node.func, (ast.Name, ast.Attribute)
+        ):
+            raise _Unsupported("Only named functions can be called")
+
+
+class _Compiler:
+    def __init__(self, slot: Optional[Callable] = None):
+        # With slot, keys are read from a list of values extracted from the context,
+        # at the index slot(key, default) returns
+        self.slot = slot
+        self.constants = []
+        self.lines = []
+        self.keys = {}
+        self.nodes = 0
+        # Node path -> what the compiled code does differently from the interpreter
+        self.notes: Dict[str, List[str]] = {}
+
+    def constant(self, value) -> str:
+        self.constants.append(value)
+        return f"c{len(self.constants) - 1}"
+
+    def assign(self, expression: str) -> str:
+        name = f"t{len(self.lines)}"
+        self.lines.append(f"{name} = {expression}")
+        return name
+
+    def note(self, path: str, note: str):
+        self.notes.setdefault(path, []).append(note)
+
+    def key(self, key, default=None) -> str:
+        # Each key is fetched once per evaluation
+        cache_key = (str(key), type(default), default)
+        try:
+            name = self.keys.get(cache_key)
+        except TypeError:
+            raise _Unsupported("Unhashable default")
+        if name is not None:
+            return name
+
+        if self.slot is not None:
+            lookup = f"values[{int(self.slot(key, default))}]"
+        else:
+            parts = tuple(str(key).split("."))
+            default_name = "None" if default is None else self.constant(default)
+            lookup = f"_lookup(context, {self.constant(parts)}, {default_name})"
+            if len(parts) == 1:
+                part = self.constant(parts[0])
+                lookup = (
+                    f"context.get({part}, {default_name}) if type(context) is dict "
+                    f"else {lookup}"
+                )
+
+        name = f"k{len(self.keys)}"
+        self.keys[cache_key] = name
+        self.lines.insert(len(self.keys) - 1, f"{name} = {lookup}")
+        return name
+
+    def compile(self, json_operation, path: str) -> str:
+        self.nodes += 1
+        if self.nodes > _MAX_NODES:
+            raise _Unsupported("Operation is too large")
+
+        operator, *unparsed = json_operation
+        if operator not in _operators:
+            raise _Unsupported(f"Invalid operator: {operator}")
+        if operator in _nesting_operators:
+            return self.nesting(operator, unparsed, path)
+        return self.leaf(operator, unparsed, path)
+
+    def key_child(self, unparsed: List) -> str:
+        if len(unparsed) not in (1, 2) or any(isinstance(v, list) for v in unparsed):
+            raise _Unsupported("Unsupported key operation")
+        return self.key(*unparsed)
+
+    def nesting(self, operator: str, unparsed: List, path: str) -> str:
+        values = []
+        keys = []
+        never_match = False
+        for index, val in enumerate(unparsed):
+            if isinstance(val, list) and val[:1] == ["key"]:
+                name = self.key_child(val[1:])
+                keys.append(name)
+            elif isinstance(val, list):
+                name = self.compile(
+                    val, ".".join([path, str(index)]) if path else str(index)
+                )
+            else:
+                never_match = never_match or _is_never_match(val)
+                name = self.constant(val)
+            values.append(name)
+
+        if never_match:
+            return self.assign("False")
+
+        joined = (" and " if operator == "and" else " or ").join(values)
+        joined = joined or ("True" if operator == "and" else "False")
+        expression = f"bool({joined})"
+        if keys:
+            expression = (
+                f"False if NEVER_MATCH in ({', '.join(keys)},) else {expression}"
+            )
+        return self.assign(expression)
+
+    def leaf(self, operator: str, unparsed: List, path: str) -> str:
+        names = []
+        keys = []
+        literals = []
+        for val in unparsed:
+            if _is_key_operation(val):
+                if len(val) < 2:
+                    raise _Unsupported("Key operation without a key")
+                name = self.key(val[1])
+                keys.append(name)
+                literals.append(_MISSING)
+            else:
+                if _is_never_match(val):
+                    return self.assign("False")
+                name = self.constant(val)
+                literals.append(val)
+            names.append(name)
+
+        generic = f"{_OPERATOR_NAMES[operator]}({', '.join(names)})"
+        if keys:
+            generic = f"False if NEVER_MATCH in ({', '.join(keys)},) else {generic}"
+
+        fast = self.fast(operator, names, literals, path)
+        if fast is None:
+            return self.assign(generic)
+        condition, expression = fast
+        return self.assign(f"({expression}) if {condition} else ({generic})")
+
+    def fast(self, operator: str, names: List[str], literals: List, path: str):
+        # Returns a condition and an expression equal to the operator whenever the
+        # condition holds
+        if operator in ("null", "!null") and len(names) == 1:
+            if literals[0] is not _MISSING:
+                return None
+            comparison = "is" if operator == "null" else "is not"
+            self.note(path, "inlined for JSON types")
+            return f"type({names[0]}) in PLAIN", f"{names[0]} {comparison} None"
+
+        if len(names) != 2:
+            return None
+        (a, b), (literal_a, literal_b) = names, literals
+
+        if operator in _COMPARISONS:
+            return self.fast_comparison(operator, a, b, literal_a, literal_b, path)
+
+        if operator in ("in", "nin", "!in"):
+            if literal_a is not _MISSING or not isinstance(literal_b, list):
+                return None
+            if not all(type(item) in _HASHABLE_TYPES for item in literal_b):
+                return None
+            items = self.constant(frozenset(literal_b))
+            self.note(
+                path, f"literal list of {len(literal_b)} items converted to a set"
+            )
+            comparison = "in" if operator == "in" else "not in"
+            return f"type({a}) in HASHABLE", f"{a} {comparison} {items}"
+
+        if operator == "btw":
+            if literal_a is not _MISSING or not isinstance(literal_b, list):
+                return None
+            if len(literal_b) != 2 or not all(
+                type(item) in (int, float) for item in literal_b
+            ):
+                return None
+            low, high = self.constant(literal_b[0]), self.constant(literal_b[1])
+            self.note(path, "range checked when compiled, type check inlined")
+            return _is_number(a), f"{low} <= {a} <= {high}"
+
+        if operator in ("&", "!&"):
+            if (literal_a is _MISSING) == (literal_b is _MISSING):
+                return None
+            key, literal = (a, literal_b) if literal_a is _MISSING else (b, literal_a)
+            if not isinstance(literal, list) or not all(
+                type(item) in _HASHABLE_TYPES for item in literal
+            ):
+                return None
+            items = self.constant(frozenset(literal))
+            self.note(path, f"literal list of {len(literal)} items converted to a set")
+            negation = "not " if operator == "&" else ""
+            return f"type({key}) is list", f"{negation}{items}.isdisjoint(set({key}))"
+
+        return None
+
+    def fast_comparison(self, operator, a, b, literal_a, literal_b, path):
+        python_operator = _COMPARISONS[operator]
+        expression = f"{a} {python_operator} {b}"
+        if literal_a is _MISSING and literal_b is _MISSING:
+            self.note(path, "type check inlined")
+            return f"type({a}) is type({b}) and type({a}) in PLAIN", expression
+        if literal_a is not _MISSING and literal_b is not _MISSING:
+            return None
+
+        key, literal = (a, literal_b) if literal_a is _MISSING else (b, literal_a)
+        literal_type = type(literal)
+        if literal_type in (int, float):
+            condition = _is_number(key)
+        elif literal_type in (str, bool):
+            condition = f"type({key}) is {literal_type.__name__}"
+        elif literal_type in (list, dict) and python_operator in ("==", "!="):
+            condition = f"type({key}) is {literal_type.__name__}"
+        else:
+            return None
+        self.note(
+            path, f"type check against the {literal_type.__name__} literal inlined"
+        )
+        return condition, expression
+
+    def build(self, json_operation) -> Callable:
+        result = self.compile(json_operation, "")
+        constants = [f"c{index}" for index in range(len(self.constants))]
+        argument = "context" if self.slot is None else "values"
+        lines = [
+            f"def _build({', '.join(constants)}):",
+            f"    def _compiled({argument}):",
+            *(f"        {line}" for line in self.lines),
+            f"        return {result}",
+            "    return _compiled",
+        ]
+        source = "\n".join(lines) + "\n"
+
+        names = set(_GLOBALS) | set(constants) | set(self.keys.values())
+        names |= {"_build", "_compiled", argument}
+        names |= {f"t{index}" for index in range(len(self.lines))}
+        tree = ast.parse(source)
+        _validate(tree, names)
+
+        namespace = dict(_GLOBALS)
+        exec(compile(tree, "<json operation>", "exec"), namespace)
+        function = namespace["_build"](*self.constants)
+        function.source = source
+        function.notes = self.notes
+        return function
+
+
+def _is_number(name: str) -> str:
+    return f"(type({name}) is int or type({name}) is float)"
+
+
+def _is_never_match(value) -> bool:
+    # The interpreter checks NEVER_MATCH in values, which compares with ==
+    try:
+        return bool(value is NEVER_MATCH or value == NEVER_MATCH)
+    except Exception:
+        raise _Unsupported("Literal can't be compared")
+
+
+def _compile(json_operation, slot: Optional[Callable] = None) -> Optional[Callable]:
+    # Returns None when the operation is left to the interpreter
+    if not isinstance(json_operation, list) or not json_operation:
+        return None
+    try:
+        if json_operation[0] == "key":
+            return None
+        return _Compiler(slot).build(json_operation)
+    except Exception:
+        # Unsupported or invalid operations (which the interpreter raises errors for)
+        return None
+
+
+class HotOperation(NamedTuple):
+    operation: List
+    calls: int
+    compiled: bool
+
+
+class TieringStats(NamedTuple):
+    # Operations execute() is counting calls for
+    tracked: int
+    compiled: int
+    # Calls where the compiled function raised an error and the interpreter was used
+    fallbacks: int
+    # Most called operations first
+    hot: List[HotOperation]
+
+
+def configure_tiering(
+    threshold: Optional[int] = None,
+    max_tracked: int = 10000,
+    max_compiled: int = 1000,
+):
+    """
+    Sets how many times execute() interprets an operation before compiling it (None,
+    the default, turns compilation off), how many operations calls are counted for, and
+    how many compiled operations are kept. Resets the counts and compiled operations.
+    Operations must not be modified once execute() has been called with them
+    """
+    with _tiering.lock:
+        _tiering.threshold = threshold
+        _tiering.max_tracked = max_tracked
+        _tiering.max_compiled = max_compiled
+        _tiering.reset()
+
+
+def tiering_stats(top: int = 10) -> TieringStats:
+    """
+    Calls are summed over the threads calling execute() that are still running (or
+    shared by all threads with the GIL)
+    """
+    states = _tiering.states()
+    compiled = len(_tiering.compiled)
+
+    calls = {}
+    for state in states:
+        # Copied first, as the thread may be adding entries
+        for key, (operation, count, compiled_function) in state.entries.copy().items():
+            entry = calls.setdefault(key, [operation, 0, False])
+            entry[1] += count
+            entry[2] = entry[2] or bool(compiled_function)
+    entries = sorted(calls.values(), key=lambda entry: entry[1], reverse=True)
+    return TieringStats(
+        tracked=len(entries),
+        compiled=compiled,
+        fallbacks=sum(state.fallbacks for state in states),
+        hot=[
+            HotOperation(operation, count, compiled_function)
+            for operation, count, compiled_function in entries[:top]
+        ],
+    )
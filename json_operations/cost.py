@@ -0,0 +1,159 @@
+"""
+Static cost estimation for json operations, so operations from untrusted sources can
+be rejected before they are evaluated.
+"""
+from typing import List, NamedTuple, Optional
+
+from json_operations import JsonOperationError, _is_key_operation, _nesting_operators
+
+
+class Cost(NamedTuple):
+    # Operations, including key operations
+    nodes: int
+    # Deepest nesting of lists, literal or not
+    depth: int
+    # Items in literal lists plus characters in literal strings
+    literal_size: int
+    # Parts of all the dotted key paths
+    key_length: int
+
+    @property
+    def total(self) -> int:
+        # Roughly proportional to the work an evaluation does (excluding values from
+        # the context)
+        return self.nodes + self.literal_size + self.key_length
+
+
+class CostLimits(NamedTuple):
+    max_nodes: Optional[int] = None
+    max_depth: Optional[int] = None
+    max_literal_size: Optional[int] = None
+    max_key_length: Optional[int] = None
+    max_total: Optional[int] = None
+
+
+# Stays well under python's default recursion limit of 1000, which evaluation and
+# get_keys recurse into
+DEFAULT_COST_LIMITS = CostLimits(
+    max_nodes=1000,
+    max_depth=32,
+    max_literal_size=10000,
+    max_key_length=1000,
+    max_total=20000,
+)
+
+
+def _literal_size(value) -> int:
+    size = 0
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, list):
+            size += len(value)
+            stack.extend(item for item in value if isinstance(item, (list, str)))
+        elif isinstance(value, str):
+            size += len(value)
+    return size
+
+
+def _key_length(key) -> int:
+    return len(str(key).split("."))
+
+
+def node_cost(json_operation) -> int:
+    """
+    The cost of evaluating a single operation, not counting nested operations
+    """
+    if not isinstance(json_operation, list) or not json_operation:
+        return 0
+
+    operator, *unparsed = json_operation
+    cost = 1
+    if operator in _nesting_operators:
+        return cost + sum(len(val) for val in unparsed if isinstance(val, str))
+    if operator == "key":
+        return cost + _key_length(unparsed[0]) if unparsed else cost
+
+    for val in unparsed:
+        if _is_key_operation(val):
+            cost += 1 + _key_length(val[1]) if len(val) > 1 else 1
+        else:
+            cost += _literal_size(val)
+    return cost
+
+
+def estimate_cost(json_operation) -> Cost:
+    """
+    Estimates the cost of an operation from its structure. Does not recurse, so it is
+    safe to call on operations too deeply nested to evaluate
+    """
+    nodes = 0
+    depth = 0
+    literal_size = 0
+    key_length = 0
+
+    stack = [(json_operation, 1)]
+    while stack:
+        value, level = stack.pop()
+        if not isinstance(value, list):
+            literal_size += len(value) if isinstance(value, str) else 0
+            continue
+
+        depth = max(depth, level)
+        if not value:
+            continue
+
+        operator, *unparsed = value
+        if operator in _nesting_operators:
+            nodes += 1
+            stack.extend((val, level + 1) for val in unparsed)
+        elif operator == "key":
+            nodes += 1
+            key_length += _key_length(unparsed[0]) if unparsed else 0
+        else:
+            nodes += 1
+            for val in unparsed:
+                if _is_key_operation(val):
+                    nodes += 1
+                    depth = max(depth, level + 1)
+                    key_length += _key_length(val[1]) if len(val) > 1 else 0
+                elif isinstance(val, list):
+                    literal_size += _literal_size(val)
+                    depth = max(depth, level + _list_depth(val))
+                elif isinstance(val, str):
+                    literal_size += len(val)
+
+    return Cost(
+        nodes=nodes, depth=depth, literal_size=literal_size, key_length=key_length
+    )
+
+
+def _list_depth(value: List) -> int:
+    depth = 0
+    stack = [(value, 1)]
+    while stack:
+        value, level = stack.pop()
+        depth = max(depth, level)
+        stack.extend((item, level + 1) for item in value if isinstance(item, list))
+    return depth
+
+
+def validate_cost(json_operation, limits: CostLimits = DEFAULT_COST_LIMITS) -> Cost:
+    """
+    Raises a JsonOperationError if the estimated cost of the operation exceeds any of
+    the limits. Returns the cost otherwise
+    """
+    cost = estimate_cost(json_operation)
+    checks = [
+        ("nodes", cost.nodes, limits.max_nodes),
+        ("depth", cost.depth, limits.max_depth),
+        ("literal size", cost.literal_size, limits.max_literal_size),
+        ("key length", cost.key_length, limits.max_key_length),
+        ("total cost", cost.total, limits.max_total),
+    ]
+    for name, value, limit in checks:
+        if limit is not None and value > limit:
+            raise JsonOperationError(
+                f"Operation {name} of {value} exceeds the limit of {limit}"
+            )
+    return cost
@@ -0,0 +1,343 @@
+"""
+Compilation of a collection of json operations into a decision diagram over their
+predicates, so classifying a context tests each predicate at most once.
+"""
+import threading
+from typing import Callable, Dict, FrozenSet, List, NamedTuple
+
+from json_operations import (
+    NEVER_MATCH,
+    _get_key,
+    _is_key_operation,
+    _nesting_operators,
+    _operators,
+    execute,
+)
+from json_operations.compiler import _compile
+from json_operations.rule_set import _freeze_literal
+
+# Variable of terminal nodes, after every predicate
+_TERMINAL = float("inf")
+
+
+class _TooLarge(Exception):
+    pass
+
+
+class _Unsupported(Exception):
+    pass
+
+
+class DiagramStats(NamedTuple):
+    # Nodes of the diagram of all rules built so far, and of the diagrams of single
+    # rules
+    nodes: int
+    rule_nodes: int
+    predicates: int
+    # Rules in the diagram, and rules evaluated with execute() because they made the
+    # diagram too large or can't be represented
+    compiled_rules: int
+    fallback_rules: int
+
+
+class _Builder:
+    """
+    Nodes of the reduced ordered binary decision diagrams of single rules, shared
+    between rules. Terminals are False and True
+    """
+
+    def __init__(self, max_nodes: int):
+        self.max_nodes = max_nodes
+        self.var = [_TERMINAL, _TERMINAL]
+        self.low = [None, None]
+        self.high = [None, None]
+        self.unique = {}
+        self.false, self.true = 0, 1
+
+    def node(self, var: int, low: int, high: int) -> int:
+        if low == high:
+            return low
+        key = (var, low, high)
+        node = self.unique.get(key)
+        if node is None:
+            if len(self.var) >= self.max_nodes:
+                raise _TooLarge()
+            node = self.unique[key] = len(self.var)
+            self.var.append(var)
+            self.low.append(low)
+            self.high.append(high)
+        return node
+
+    def cofactors(self, node: int, var):
+        if self.var[node] == var:
+            return self.low[node], self.high[node]
+        return node, node
+
+    def apply(self, operator: str, a: int, b: int, memo: Dict) -> int:
+        # operator is "and" or "or"
+        if operator == "and":
+            if a == self.false or b == self.false:
+                return self.false
+            if a == self.true:
+                return b
+            if b == self.true:
+                return a
+        else:
+            if a == self.true or b == self.true:
+                return self.true
+            if a == self.false:
+                return b
+            if b == self.false:
+                return a
+        if a == b:
+            return a
+
+        key = (a, b) if a < b else (b, a)
+        result = memo.get(key)
+        if result is None:
+            var = min(self.var[a], self.var[b])
+            a_low, a_high = self.cofactors(a, var)
+            b_low, b_high = self.cofactors(b, var)
+            result = memo[key] = self.node(
+                var,
+                self.apply(operator, a_low, b_low, memo),
+                self.apply(operator, a_high, b_high, memo),
+            )
+        return result
+
+    def rollback(self, size: int):
+        for node in range(size, len(self.var)):
+            del self.unique[(self.var[node], self.low[node], self.high[node])]
+        del self.var[size:]
+        del self.low[size:]
+        del self.high[size:]
+
+
+def _leaf_predicate(json_operation: List) -> Callable:
+    compiled = _compile(json_operation)
+    if compiled is None:
+        return lambda context: bool(execute(json_operation, context))
+
+    def predicate(context) -> bool:
+        try:
+            return bool(compiled(context))
+        except Exception:
+            # The interpreter raises the error
+            return bool(execute(json_operation, context))
+
+    return predicate
+
+
+def _truthy_predicate(arguments: List) -> Callable:
+    return lambda context: bool(_get_key(context, *arguments))
+
+
+def _never_match_predicate(arguments: List) -> Callable:
+    return lambda context: NEVER_MATCH in (_get_key(context, *arguments),)
+
+
+def _key_arguments(arguments: List) -> List:
+    if len(arguments) not in (1, 2) or any(isinstance(a, list) for a in arguments):
+        raise _Unsupported()
+    return arguments
+
+
+def _formula(json_operation, predicates: Dict, top: bool = False):
+    """
+    Returns the operation as a formula over predicates: True, False, the key of a
+    predicate, or (operator, children, keys of never match predicates). Adds the
+    predicates to predicates (key of the predicate to its key, and the function
+    returning it and its argument)
+    """
+
+    def predicate(kind: str, value, key, function: Callable):
+        # function(value) returns the predicate, it's only called once per predicate
+        predicate_key = (kind, _freeze_literal(value))
+        if predicate_key not in predicates:
+            predicates[predicate_key] = (str(key), function, value)
+        return predicate_key
+
+    if not isinstance(json_operation, list):
+        return bool(json_operation)
+
+    operator, *unparsed = json_operation
+    if operator == "key":
+        if not top:
+            raise _Unsupported()
+        arguments = _key_arguments(unparsed)
+        return predicate("truthy", arguments, arguments[0], _truthy_predicate)
+    if operator not in _operators:
+        raise _Unsupported()
+
+    if operator not in _nesting_operators:
+        keys = [val for val in unparsed if _is_key_operation(val)]
+        if any(len(key) < 2 for key in keys):
+            raise _Unsupported()
+        key = keys[0][1] if keys else ""
+        return predicate("leaf", json_operation, key, _leaf_predicate)
+
+    children = []
+    never_match = []
+    for val in unparsed:
+        if isinstance(val, list) and val[:1] == ["key"]:
+            arguments = _key_arguments(val[1:])
+            children.append(
+                predicate("truthy", arguments, arguments[0], _truthy_predicate)
+            )
+            never_match.append(
+                predicate("never", arguments, arguments[0], _never_match_predicate)
+            )
+        elif isinstance(val, list):
+            children.append(_formula(val, predicates))
+        elif val is NEVER_MATCH or val == NEVER_MATCH:
+            return False
+        else:
+            children.append(bool(val))
+    return operator, children, never_match
+
+
+class DecisionDiagram:
+    """
+    Compiles rules (a dict of rule id to json operations) into a decision diagram over
+    their predicates (leaf operations, and the keys used directly in and/or). Matching
+    a context walks the diagram from its root to the set of matching rules, testing
+    each predicate at most once, and only the predicates that can still change which
+    rules match.
+
+    Each rule is compiled into a reduced ordered binary decision diagram. The diagram
+    of all rules (their product) is built lazily, along the paths contexts take: it is
+    exponential in the number of predicates in general, while only a few of those paths
+    are possible (predicates on the same key are related, like comparisons to
+    different values). Paths past max_nodes nodes are walked without being kept.
+    Rules that would make their own diagram larger than max_nodes, and rules that
+    can't be represented, are evaluated with execute().
+
+    Results are the same as execute()'s, except that execute() evaluates every
+    predicate of a rule and raises an error if any of them does, while the diagram only
+    tests the predicates it needs
+    """
+
+    def __init__(self, rules: Dict, max_nodes: int = 100000):
+        self.max_nodes = max_nodes
+        self._rule_ids = list(rules)
+        self._builder = _Builder(max_nodes)
+        self._fallback = []
+        self._lock = threading.Lock()
+
+        predicates = {}
+        formulas = []
+        for index, json_operation in enumerate(rules.values()):
+            rule_predicates = {}
+            try:
+                formula = _formula(json_operation, rule_predicates, top=True)
+            except (_Unsupported, RecursionError, TypeError, ValueError):
+                self._fallback.append((index, json_operation))
+                continue
+            formulas.append((index, json_operation, formula))
+            for predicate_key, predicate in rule_predicates.items():
+                predicates.setdefault(predicate_key, predicate)
+
+        # Predicates on the same key are next to each other in the order
+        by_key = {}
+        for predicate_key, (key, function, value) in predicates.items():
+            by_key.setdefault(key, []).append((predicate_key, function(value)))
+        ordered = [predicate for group in by_key.values() for predicate in group]
+        self._variables = {key: var for var, (key, _) in enumerate(ordered)}
+        self._predicates = [function for _, function in ordered]
+
+        builder = self._builder
+        residuals = []
+        for index, json_operation, formula in formulas:
+            size = len(builder.var)
+            try:
+                residuals.append((index, self._build(formula)))
+            except (_TooLarge, RecursionError):
+                builder.rollback(size)
+                self._fallback.append((index, json_operation))
+        self._fallback.sort(key=lambda fallback: fallback[0])
+
+        # Nodes of the diagram of all rules are [predicate tested, node if False, node
+        # if True (None until a context takes them), rules matched, (rule index, rule
+        # diagram node) of the rules left to decide, and whether the node is kept]
+        self._nodes = {}
+        self._root = self._node(frozenset(), residuals)
+
+    def _build(self, formula) -> int:
+        builder = self._builder
+        if formula is True:
+            return builder.true
+        if formula is False:
+            return builder.false
+        if formula[0] not in _nesting_operators:
+            var = self._variables[formula]
+            return builder.node(var, builder.false, builder.true)
+
+        operator, children, never_match = formula
+        memo, never_memo = {}, {}
+        result = builder.true if operator == "and" else builder.false
+        for child in children:
+            result = builder.apply(operator, result, self._build(child), memo)
+        for predicate_key in never_match:
+            var = self._variables[predicate_key]
+            never = builder.node(var, builder.true, builder.false)
+            result = builder.apply("and", result, never, never_memo)
+        return result
+
+    def _node(self, matched: FrozenSet[int], residuals: List) -> List:
+        builder = self._builder
+        left = []
+        for index, rule in residuals:
+            if rule == builder.true:
+                matched = matched | {index}
+            elif rule != builder.false:
+                left.append((index, rule))
+
+        key = (matched, tuple(left))
+        node = self._nodes.get(key)
+        if node is None:
+            var = min((builder.var[rule] for _, rule in left), default=_TERMINAL)
+            kept = len(self._nodes) < self.max_nodes
+            node = [var, None, None, matched, left, kept]
+            if kept:
+                self._nodes[key] = node
+        return node
+
+    def _child(self, node: List, value: bool) -> List:
+        cofactors = self._builder.cofactors
+        var = node[0]
+        residuals = [(index, cofactors(rule, var)[value]) for index, rule in node[4]]
+        with self._lock:
+            child = self._node(node[3], residuals)
+            if node[5] and child[5]:
+                node[2 if value else 1] = child
+        return child
+
+    def stats(self) -> DiagramStats:
+        return DiagramStats(
+            nodes=len(self._nodes),
+            rule_nodes=len(self._builder.var),
+            predicates=len(self._predicates),
+            compiled_rules=len(self._rule_ids) - len(self._fallback),
+            fallback_rules=len(self._fallback),
+        )
+
+    def matches(self, context) -> List:
+        predicates = self._predicates
+
+        node = self._root
+        while node[0] != _TERMINAL:
+            value = predicates[node[0]](context)
+            child = node[2 if value else 1]
+            node = self._child(node, value) if child is None else child
+
+        indexes = node[3]
+        if self._fallback:
+            indexes = set(indexes)
+            for index, json_operation in self._fallback:
+                if execute(json_operation, context):
+                    indexes.add(index)
+        return [self._rule_ids[index] for index in sorted(indexes)]
+
+    def execute(self, context) -> Dict:
+        matches = set(self.matches(context))
+        return {rule_id: rule_id in matches for rule_id in self._rule_ids}
@@ -0,0 +1,201 @@
+"""
+Describes how json operations are evaluated, node by node, without evaluating them.
+"""
+import json
+from typing import Dict, List, NamedTuple, Optional
+
+from json_operations import (
+    JsonOperationError,
+    _is_key_operation,
+    _nesting_operators,
+    _operators,
+)
+from json_operations.compiler import _compile
+from json_operations.cost import Cost, estimate_cost, node_cost
+
+_COMPARISON_OPERATORS = {"=", "==", "!=", ">", ">=", "<", "<="}
+_MEMBERSHIP_OPERATORS = {"in", "nin", "!in"}
+_INTERSECTION_OPERATORS = {"&", "!&"}
+
+
+class PlanNode(NamedTuple):
+    # Same as the prefix execute_debug reports the node's result under ("" for the root)
+    path: str
+    # None for literals
+    operator: Optional[str]
+    # Keys fetched from the context by this node, in order
+    keys: List[str]
+    # Literal operands
+    literals: List
+    cost: int
+    notes: List[str]
+    children: List["PlanNode"]
+
+    def to_dict(self) -> Dict:
+        return {
+            "path": self.path,
+            "operator": self.operator,
+            "keys": self.keys,
+            "literals": self.literals,
+            "cost": self.cost,
+            "notes": self.notes,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+
+class Plan(NamedTuple):
+    root: PlanNode
+    cost: Cost
+    # Every key fetched, in evaluation order
+    keys: List[str]
+
+    def nodes(self) -> List[PlanNode]:
+        """
+        Nodes in evaluation order
+        """
+        ordered = []
+
+        def visit(node: PlanNode):
+            for child in node.children:
+                visit(child)
+            ordered.append(node)
+
+        visit(self.root)
+        return ordered
+
+    def to_dict(self) -> Dict:
+        return {
+            "root": self.root.to_dict(),
+            "cost": dict(self.cost._asdict(), total=self.cost.total),
+            "keys": self.keys,
+        }
+
+    def render(self) -> str:
+        lines = []
+
+        def visit(node: PlanNode, depth: int):
+            indent = "  " * depth
+            path = node.path or "root"
+            operands = [f"key({key})" for key in node.keys] + [
+                json.dumps(literal) for literal in node.literals
+            ]
+            description = " ".join([node.operator or "literal"] + operands)
+            lines.append(f"{indent}[{path}] {description} (cost {node.cost})")
+            for note in node.notes:
+                lines.append(f"{indent}    {note}")
+            for child in node.children:
+                visit(child, depth + 1)
+
+        visit(self.root, 0)
+        lines.append(
+            f"Total cost {self.cost.total}: {self.cost.nodes} nodes, depth "
+            f"{self.cost.depth}, literal size {self.cost.literal_size}, key length "
+            f"{self.cost.key_length}"
+        )
+        lines.append("Keys fetched: " + (", ".join(self.keys) or "none"))
+        return "\n".join(lines)
+
+
+def _leaf_notes(operator: str, unparsed: List) -> List[str]:
+    notes = []
+    for index, val in enumerate(unparsed):
+        if isinstance(val, list) and val and val[0] in _operators:
+            notes.append(
+                f"operand {index} is a literal list, operations are only evaluated "
+                f"inside and/or"
+            )
+
+    if operator in _COMPARISON_OPERATORS:
+        notes.append("operand types checked on each evaluation")
+    elif operator in _MEMBERSHIP_OPERATORS and len(unparsed) == 2:
+        stack = unparsed[1]
+        if _is_key_operation(stack):
+            notes.append("stack fetched from the context and scanned linearly")
+        elif isinstance(stack, list):
+            notes.append(f"linear scan of {len(stack)} items")
+        elif isinstance(stack, str):
+            notes.append("substring search")
+    elif operator in _INTERSECTION_OPERATORS:
+        notes.append("both operands converted to sets on each evaluation")
+    elif operator == "btw":
+        notes.append("range and operand types checked on each evaluation")
+    return notes
+
+
+def _plan(json_operation, path: str, keys: List[str]) -> PlanNode:
+    if not isinstance(json_operation, list):
+        return PlanNode(path, None, [], [json_operation], 0, [], [])
+
+    operator, *unparsed = json_operation
+    if operator == "key":
+        node_keys = [str(unparsed[0])] if unparsed else []
+        keys.extend(node_keys)
+        return PlanNode(
+            path,
+            operator,
+            node_keys,
+            [],
+            node_cost(json_operation),
+            ["value used as is, execute_debug does not report it"] if path else [],
+            [],
+        )
+
+    if operator not in _operators:
+        raise JsonOperationError(f"Invalid operator: {operator}. {json_operation}")
+
+    if operator in _nesting_operators:
+        children = [
+            _plan(val, ".".join([path, str(index)]) if path else str(index), keys)
+            for index, val in enumerate(unparsed)
+        ]
+        notes = [f"evaluates all {len(children)} children, no short circuit"]
+        return PlanNode(
+            path, operator, [], [], node_cost(json_operation), notes, children
+        )
+
+    node_keys = []
+    literals = []
+    for val in unparsed:
+        if _is_key_operation(val):
+            node_keys.append(str(val[1]) if len(val) > 1 else "")
+        else:
+            literals.append(val)
+    keys.extend(node_keys)
+    return PlanNode(
+        path,
+        operator,
+        node_keys,
+        literals,
+        node_cost(json_operation),
+        _leaf_notes(operator, unparsed),
+        [],
+    )
+
+
+def _compiled_plan(node: PlanNode, notes: Dict[str, List[str]]) -> PlanNode:
+    if node.operator in _nesting_operators:
+        children = [_compiled_plan(child, notes) for child in node.children]
+        return node._replace(children=children)
+    if node.operator is None or node.operator == "key":
+        return node
+    return node._replace(
+        notes=notes.get(node.path, ["same operator function as the interpreter"])
+    )
+
+
+def explain(json_operation, compiled: bool = False) -> Plan:
+    """
+    Returns the evaluation plan of the operation, or with compiled=True of its compiled
+    form (used by execute() for operations called often). Raises a JsonOperationError
+    for invalid operators
+    """
+    keys = []
+    root = _plan(json_operation, "", keys)
+    if compiled:
+        function = _compile(json_operation)
+        if function is None:
+            root = root._replace(notes=root.notes + ["can't be compiled, interpreted"])
+        else:
+            root = _compiled_plan(root, function.notes)
+            root = root._replace(notes=root.notes + ["each key fetched once"])
+    return Plan(root, estimate_cost(json_operation), list(dict.fromkeys(keys)))
@@ -0,0 +1,148 @@
+"""
+Extraction of every key a set of operations uses in one pass over the context, sharing
+the lookups of common key prefixes, and evaluation from the extracted values.
+"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from json_operations import execute, get_keys
+from json_operations.compiler import _compile
+
+_MISSING = object()
+
+
+class _TrieNode:
+    __slots__ = ("children", "slots", "subtree_slots")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        # Slots of the keys ending at this node
+        self.slots: List[int] = []
+        # Slots of the keys ending at this node or below
+        self.subtree_slots: Set[int] = set()
+
+
+class KeyExtractor:
+    """
+    Merges dotted keys into a prefix trie, and resolves all of them with one walk over
+    the context into a list of values (one slot per key). Each value is what _get_key
+    returns for the key (None, or the key's default, when missing)
+    """
+
+    def __init__(self, keys: Iterable = ()):
+        self._root = _TrieNode()
+        self._slots: Dict[Tuple, int] = {}
+        self._defaults: List = []
+        for key in keys:
+            self.add(key)
+
+    @classmethod
+    def from_operations(cls, json_operations: Iterable[List]) -> "KeyExtractor":
+        return cls(key["name"] for op in json_operations for key in get_keys(op))
+
+    def __len__(self) -> int:
+        return len(self._defaults)
+
+    def add(self, key, default=None) -> int:
+        """
+        Returns the slot of the key, adding it if needed
+        """
+        slot_key = (str(key), type(default), default)
+        slot = self._slots.get(slot_key)
+        if slot is not None:
+            return slot
+
+        slot = self._slots[slot_key] = len(self._defaults)
+        self._defaults.append(default)
+        node = self._root
+        node.subtree_slots.add(slot)
+        for part in str(key).split("."):
+            node = node.children.setdefault(part, _TrieNode())
+            node.subtree_slots.add(slot)
+        node.slots.append(slot)
+        return slot
+
+    def slot(self, key, default=None) -> Optional[int]:
+        return self._slots.get((str(key), type(default), default))
+
+    def extract(self, context) -> List:
+        """
+        Raises an IndexError if _get_key would for any of the keys
+        """
+        values, failed = self._extract(context)
+        if failed:
+            raise IndexError("list index out of range")
+        return values
+
+    def _extract(self, context) -> Tuple[List, Set[int]]:
+        # Returns the values, and the slots of the keys _get_key would raise an
+        # IndexError for
+        values = self._defaults[:]
+        failed = set()
+        stack = [(self._root, context)]
+        while stack:
+            node, value = stack.pop()
+            is_dict = type(value) is dict
+            for part, child in node.children.items():
+                # Same lookup as _get_key
+                try:
+                    if is_dict:
+                        child_value = value.get(part, _MISSING)
+                        if child_value is _MISSING:
+                            continue
+                    else:
+                        try:
+                            child_value = value[part]
+                        except TypeError:
+                            child_value = value[int(part)]
+                except (KeyError, TypeError, ValueError):
+                    continue
+                except IndexError:
+                    failed |= child.subtree_slots
+                    continue
+
+                for slot in child.slots:
+                    values[slot] = child_value
+                if child.children:
+                    stack.append((child, child_value))
+        return values, failed
+
+
+class SlotEvaluator:
+    """
+    Evaluates rules (a dict of rule id to json operations) against a context by
+    extracting all the keys they use once, then running each rule's compiled form
+    on the extracted values. Rules that can't be compiled, and rules using a key the
+    extraction failed for, are evaluated with execute(). Results are the same as
+    execute()'s
+    """
+
+    def __init__(self, rules: Dict):
+        self.extractor = KeyExtractor()
+        self._rules = []
+        for rule_id, json_operation in rules.items():
+            slots = set()
+
+            def slot(key, default):
+                index = self.extractor.add(key, default)
+                slots.add(index)
+                return index
+
+            compiled = _compile(json_operation, slot)
+            self._rules.append((rule_id, json_operation, compiled, frozenset(slots)))
+
+    def execute(self, context) -> Dict:
+        values, failed = self.extractor._extract(context)
+        results = {}
+        for rule_id, json_operation, compiled, slots in self._rules:
+            if compiled is not None and not (failed and not failed.isdisjoint(slots)):
+                try:
+                    results[rule_id] = compiled(values)
+                    continue
+                except Exception:
+                    # The interpreter raises the error
+                    pass
+            results[rule_id] = execute(json_operation, context)
+        return results
+
+    def matches(self, context) -> List:
+        return [rule_id for rule_id, value in self.execute(context).items() if value]
@@ -0,0 +1,141 @@
+from typing import Dict, FrozenSet, Iterable, List
+
+from json_operations import (
+    JsonOperationError,
+    _execute_operation,
+    _nesting_operators,
+    execute,
+    get_keys,
+)
+
+
+class _Node:
+    __slots__ = ("json_operation", "keys", "children", "value")
+
+    def __init__(self, json_operation, keys: FrozenSet[str], children):
+        self.json_operation = json_operation
+        self.keys = keys
+        # Only nesting operations have children. Other operations are re-run whole
+        self.children = children
+        self.value = None
+
+
+def _build(json_operation) -> _Node:
+    keys = frozenset(str(key["name"]) for key in get_keys(json_operation))
+    operator = json_operation[0]
+    if operator not in _nesting_operators:
+        return _Node(json_operation, keys, None)
+
+    children = [
+        _build(child) if isinstance(child, list) else child
+        for child in json_operation[1:]
+    ]
+    return _Node(json_operation, keys, children)
+
+
+def _evaluate(node: _Node, context, changed: FrozenSet[str] = None):
+    # Evaluates the node, reusing the stored value of every child subtree that does
+    # not depend on a changed key. Passing changed=None evaluates everything
+    if node.children is None:
+        node.value = execute(node.json_operation, context)
+        return node.value
+
+    values = []
+    for child in node.children:
+        if not isinstance(child, _Node):
+            values.append(child)
+        elif changed is None or child.keys & changed:
+            values.append(_evaluate(child, context, changed))
+        else:
+            values.append(child.value)
+
+    node.value = _execute_operation(node.json_operation[0], values)
+    return node.value
+
+
+def _prefixes(path: str) -> List[str]:
+    parts = path.split(".")
+    return [".".join(parts[:index]) for index in range(1, len(parts) + 1)]
+
+
+class IncrementalEvaluator:
+    """
+    Evaluates a set of rules against a context that changes a little at a time.
+
+    evaluate() runs every rule and remembers the result of every subtree (given a
+    context, the constructor calls it). update() takes the dotted paths that changed
+    since and only re-runs the subtrees that read one of those paths (or a parent or
+    child of one). When an evaluation raises an error, evaluate() must be called again
+    before update().
+    """
+
+    def __init__(self, rules: Dict, context=None):
+        self._rules: Dict[object, object] = {}
+        # Key -> ids of the rules reading it
+        self._key_rules: Dict[str, set] = {}
+        # Every prefix of every key -> the keys under it (including itself)
+        self._key_prefixes: Dict[str, set] = {}
+        self.results: Dict[object, bool] = {}
+        # Whether every subtree holds its value for the last context
+        self._evaluated = False
+
+        for rule_id, json_operation in dict(rules).items():
+            if isinstance(json_operation, list):
+                node = _build(json_operation)
+            else:
+                # Literal rules never change
+                node = json_operation
+            self._rules[rule_id] = node
+            for key in getattr(node, "keys", ()):
+                self._key_rules.setdefault(key, set()).add(rule_id)
+                for prefix in _prefixes(key):
+                    self._key_prefixes.setdefault(prefix, set()).add(key)
+
+        if context is not None:
+            self.evaluate(context)
+
+    def evaluate(self, context) -> Dict[object, bool]:
+        self._evaluated = False
+        self.results = {
+            rule_id: _evaluate(node, context) if isinstance(node, _Node) else node
+            for rule_id, node in self._rules.items()
+        }
+        self._evaluated = True
+        return dict(self.results)
+
+    def affected_keys(self, changed_paths: Iterable[str]) -> FrozenSet[str]:
+        # Changing a path changes every key under it, and every key that returns a
+        # structure containing it
+        keys = set()
+        for path in changed_paths:
+            path = str(path)
+            keys.update(self._key_prefixes.get(path, ()))
+            keys.update(
+                prefix for prefix in _prefixes(path) if prefix in self._key_rules
+            )
+        return frozenset(keys)
+
+    def update(self, context, changed_paths: Iterable[str]) -> Dict[object, bool]:
+        """
+        Re-evaluates the rules affected by changed_paths against the updated
+        context. Returns the new result of every rule whose result changed
+        """
+        if not self._evaluated:
+            raise JsonOperationError(
+                "update() re-uses the results of evaluate(): call evaluate() first, "
+                "and again after an evaluation raised an error"
+            )
+        changed = self.affected_keys(changed_paths)
+        rule_ids = set()
+        for key in changed:
+            rule_ids.update(self._key_rules[key])
+
+        flipped = {}
+        self._evaluated = False
+        for rule_id in rule_ids:
+            value = _evaluate(self._rules[rule_id], context, changed)
+            if value != self.results[rule_id]:
+                flipped[rule_id] = value
+            self.results[rule_id] = value
+        self._evaluated = True
+        return flipped
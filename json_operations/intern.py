@@ -0,0 +1,128 @@
+"""
+Deduplication of the literals and key paths shared by many loaded operations.
+"""
+import json
+import sys
+from typing import List, NamedTuple, Optional, Tuple
+
+
+class InternStats(NamedTuple):
+    operations: int
+    # Lists (operations, key operations and literal lists) seen and how many of them
+    # were replaced by an identical list loaded before
+    lists: int
+    lists_deduplicated: int
+    strings: int
+    strings_deduplicated: int
+    # Estimated memory freed once the duplicates are no longer referenced
+    bytes_saved: int
+
+
+class Interner:
+    """
+    Loads operations so that identical values are shared between all of them. Strings
+    (key paths, operators and literals) are interned, and identical lists (literal
+    lists, key operations and whole subtrees) become the same list object.
+
+    Lists are kept as lists rather than tuples or frozensets so evaluation results do
+    not change (btw, & and == check for lists). Shared lists must not be modified.
+
+    The interner keeps the lists it returned until they are released: call release()
+    once for each operation intern() or loads() returned when it's no longer used, or
+    drop the interner once the operations are loaded (they stay shared).
+    """
+
+    def __init__(self):
+        # Structural key -> [shared list, reference count]. Lists are keyed by the ids
+        # of their (already shared) items, so building a key never rehashes a whole
+        # subtree
+        self._lists = {}
+        self._operations = 0
+        self._list_count = 0
+        self._lists_deduplicated = 0
+        self._strings = 0
+        self._strings_deduplicated = 0
+        self._bytes_saved = 0
+
+    def intern(self, json_operation: List) -> List:
+        self._operations += 1
+        return self._intern(json_operation)
+
+    def loads(self, value: str) -> List:
+        return self.intern(json.loads(value))
+
+    def release(self, json_operation: List):
+        """
+        Releases an operation intern() or loads() returned, so the interner no longer
+        keeps the lists only released operations use
+        """
+        if not isinstance(json_operation, list):
+            return
+        for item in json_operation:
+            self.release(item)
+        structural_key = self._structural_key(json_operation)
+        slot = self._lists.get(structural_key)
+        if slot is None or slot[0] is not json_operation:
+            return
+        slot[1] -= 1
+        if not slot[1]:
+            del self._lists[structural_key]
+
+    def stats(self) -> InternStats:
+        return InternStats(
+            operations=self._operations,
+            lists=self._list_count,
+            lists_deduplicated=self._lists_deduplicated,
+            strings=self._strings,
+            strings_deduplicated=self._strings_deduplicated,
+            bytes_saved=self._bytes_saved,
+        )
+
+    def _intern(self, value):
+        if isinstance(value, str):
+            self._strings += 1
+            interned = sys.intern(value)
+            if interned is not value:
+                self._strings_deduplicated += 1
+                self._bytes_saved += sys.getsizeof(value)
+            return interned
+
+        if not isinstance(value, list):
+            return value
+
+        self._list_count += 1
+        items = [self._intern(item) for item in value]
+        structural_key = self._structural_key(items)
+        if structural_key is None:
+            # Unhashable literals (e.g. dictionaries) are not shared
+            return items
+
+        slot = self._lists.get(structural_key)
+        if slot is None:
+            self._lists[structural_key] = [items, 1]
+            return items
+
+        shared = slot[0]
+        slot[1] += 1
+        self._lists_deduplicated += 1
+        # The literals of the duplicate are freed with it, unless they are the same
+        # objects (small integers, True...). Lists and strings were counted when they
+        # were interned
+        self._bytes_saved += sys.getsizeof(value) + sum(
+            sys.getsizeof(item)
+            for item, kept in zip(items, shared)
+            if item is not kept and not isinstance(item, (list, str))
+        )
+        return shared
+
+    @staticmethod
+    def _structural_key(items: List) -> Optional[Tuple]:
+        try:
+            structural_key = tuple(
+                id(item) if isinstance(item, (list, str)) else (type(item), item)
+                for item in items
+            )
+            hash(structural_key)
+        except TypeError:
+            return None
+        return structural_key
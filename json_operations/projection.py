@@ -0,0 +1,167 @@
+"""
+Projection of contexts onto the keys a set of operations use, to serialize only those
+before sending contexts to other processes or queues.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from json_operations.extract import KeyExtractor
+
+
+class _Missing:
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "MISSING"
+
+    def __reduce__(self) -> str:
+        return "MISSING"
+
+
+# Value of the keys missing from a context in flattened projections
+MISSING = _Missing()
+
+
+class _Node:
+    """
+    Parts of the keys under a key prefix. Parts ending a key are None: the whole value
+    is kept
+    """
+
+    __slots__ = ("children", "indexes", "length")
+
+    def __init__(self):
+        self.children: Dict[str, Optional["_Node"]] = {}
+        # (index, child) of the parts if all of them are list indexes, None otherwise
+        self.indexes: Optional[List[Tuple[int, Optional["_Node"]]]] = None
+        self.length = 0
+
+    def finish(self):
+        for child in self.children.values():
+            if child is not None:
+                child.finish()
+
+        indexes = {}
+        for part, child in self.children.items():
+            try:
+                index = int(part)
+            except ValueError:
+                return
+            # Parts like "-1" or "01" read elements of lists another way than their
+            # position, and lists holding them are kept whole
+            if str(index) != part or index < 0:
+                return
+            indexes[index] = child
+        self.indexes = sorted(indexes.items())
+        self.length = self.indexes[-1][0] + 1 if self.indexes else 0
+
+
+def _operation_keys(json_operation) -> List[str]:
+    """
+    Returns the names of the keys the operation reads. Unlike get_keys() it accepts
+    any operation execute() does
+    """
+    keys = []
+    if isinstance(json_operation, list):
+        if json_operation[:1] == ["key"] and len(json_operation) > 1:
+            keys.append(str(json_operation[1]))
+        for val in json_operation:
+            keys += _operation_keys(val)
+    return keys
+
+
+def _project(value, node: _Node):
+    if type(value) is dict:
+        projected = {}
+        for part, child in node.children.items():
+            if part in value:
+                projected[part] = (
+                    value[part] if child is None else _project(value[part], child)
+                )
+        return projected
+    if type(value) is list and node.indexes is not None:
+        # Elements after the last index used are dropped and the other unused elements
+        # replaced by None, so indexes out of range still raise an IndexError
+        projected = [None] * min(len(value), node.length)
+        for index, child in node.indexes:
+            if index >= len(projected):
+                break
+            projected[index] = (
+                value[index] if child is None else _project(value[index], child)
+            )
+        return projected
+    # Other values can't be indexed by the parts, or are small (strings)
+    return value
+
+
+class Projector:
+    """
+    Projects contexts onto keys (dotted like the keys of operations). execute() returns
+    the same results and raises the same errors for the projection of a context as for
+    the context itself, for any operation reading only those keys.
+
+    project() keeps the dicts and lists on the way to the keys, with only the items
+    the keys use (lists are cut after the last index used). flatten() returns a tuple
+    of the values of the keys (MISSING for keys the context doesn't have), and
+    expand() turns it back into a context
+    """
+
+    def __init__(self, keys: Iterable = ()):
+        # A key under another key is part of its value
+        keys = sorted(
+            dict.fromkeys(str(key) for key in keys), key=lambda key: key.count(".")
+        )
+        self.keys: List[str] = []
+        self._root = _Node()
+        for key in keys:
+            node = self._root
+            *parents, last = key.split(".")
+            for part in parents:
+                if part not in node.children:
+                    node.children[part] = _Node()
+                node = node.children[part]
+                if node is None:
+                    break
+            else:
+                node.children[last] = None
+                self.keys.append(key)
+        self._root.finish()
+
+        self._extractor = KeyExtractor()
+        for key in self.keys:
+            self._extractor.add(key, default=MISSING)
+
+    def project(self, context):
+        return _project(context, self._root)
+
+    def flatten(self, context) -> Tuple:
+        """
+        Returns the values of the keys, in the order of self.keys. Raises an IndexError
+        if _get_key would for any of the keys (use project() when some operations
+        are expected to raise it)
+        """
+        return tuple(self._extractor.extract(context))
+
+    def expand(self, values: Iterable) -> Dict:
+        """
+        Returns a context of nested dicts with the values flatten() returned. List
+        indexes become dict keys, which keys resolve the same way
+        """
+        context = {}
+        for key, value in zip(self.keys, values):
+            if value is MISSING:
+                continue
+            node = context
+            *parents, last = key.split(".")
+            for part in parents:
+                node = node.setdefault(part, {})
+            node[last] = value
+        return context
+
+
+def projector(json_operations: Iterable, keys: Iterable = ()) -> Projector:
+    """
+    Returns a Projector for the keys json_operations read (and keys)
+    """
+    return Projector(
+        [key for op in json_operations for key in _operation_keys(op)] + list(keys)
+    )
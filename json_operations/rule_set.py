@@ -0,0 +1,756 @@
+import heapq
+import threading
+from bisect import bisect_left
+from itertools import chain
+from operator import attrgetter
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple
+
+from json_operations import (
+    NEVER_MATCH,
+    JsonOperationError,
+    _execute_operation,
+    _get_key,
+    _is_key_operation,
+    _nesting_operators,
+    _operators,
+    execute,
+    get_keys,
+)
+from json_operations.specialize import _prune_never_match
+
+# Compact the entry log once tombstones outnumber live entries (and there are at least
+# this many of them). Compaction is linear, but it only happens after that many writes
+_MIN_COMPACTION = 64
+# Sets of NEVER_MATCH fields a RuleSet keeps the pruned rules of
+_MAX_PRUNED = 64
+# Entries per block of the priority order. A write copies one block and the list of
+# blocks, rather than sorting the rules again
+_BLOCK_SIZE = 256
+# first_match and top_k only look up the rules whose first required key is in the
+# context when there are at least this many rules per first required key. Otherwise
+# checking all the keys costs more than checking each rule
+_MIN_RULES_PER_ANCHOR = 8
+# Lists at least this long are hashed once per pass for the list operators, and the
+# sets shared by the operations using them. Shorter lists are cheaper to hash (or scan)
+# again than to look up
+_MIN_HASHED_LENGTH = 16
+# Most list items hashed into sets in one pass, which bounds the memory it uses
+_MAX_HASHED_ITEMS = 1 << 20
+
+_list_operators = {"&", "!&", "in", "nin", "!in"}
+
+
+def _freeze_literal(value):
+    # Different types that compare equal (1, 1.0, True) behave differently in
+    # operations, so the type is part of the key
+    if isinstance(value, list):
+        return (list, tuple(_freeze_literal(item) for item in value))
+    if isinstance(value, dict):
+        return (
+            dict,
+            tuple((key, _freeze_literal(item)) for key, item in value.items()),
+        )
+    return (type(value), value)
+
+
+_ordering_operators = {">", ">=", "<", "<="}
+_equality_operators = {"=", "==", "!="}
+
+
+def _required_keys(json_operation) -> FrozenSet[str]:
+    """
+    Returns the keys the operation cannot be True without. If one of them is missing
+    from the context (resolves to None) the operation is False or raises an error
+    """
+    if not isinstance(json_operation, list) or not json_operation:
+        return frozenset()
+
+    operator, *unparsed = json_operation
+    if operator == "key":
+        # A missing key is falsy, unless a default is given
+        return frozenset([str(unparsed[0])]) if len(unparsed) == 1 else frozenset()
+    if operator == "and":
+        return frozenset().union(*(_required_keys(val) for val in unparsed))
+    if operator == "or":
+        if not unparsed:
+            return frozenset()
+        return frozenset.intersection(*(_required_keys(val) for val in unparsed))
+
+    keys = [str(val[1]) if _is_key_operation(val) else None for val in unparsed]
+    if operator == "!null" or operator in _ordering_operators:
+        required = keys
+    elif operator in {"btw", "&", "!&"} or len(unparsed) != 2:
+        required = keys if operator != "null" else []
+    elif operator in _equality_operators:
+        # None only compares with None
+        required = [
+            key
+            for key, other, other_key in zip(keys, unparsed[::-1], keys[::-1])
+            if other_key is None and other is not None
+        ]
+    elif operator in {"in", "nin", "!in"}:
+        needle_key, stack_key = keys
+        stack = unparsed[1]
+        # The stack must be a list or string, and None is only in a list holding None
+        required = [stack_key]
+        if stack_key is None and (
+            isinstance(stack, str)
+            or (operator == "in") == (isinstance(stack, list) and None not in stack)
+        ):
+            required.append(needle_key)
+    else:
+        required = []
+
+    return frozenset(key for key in required if key is not None)
+
+
+class _Entry:
+    __slots__ = (
+        "rule_id",
+        "operation",
+        "keys",
+        "required_keys",
+        "subtrees",
+        "priority",
+        "sequence",
+        "added",
+        "removed",
+        "order",
+    )
+
+    def __init__(self, rule_id, operation, keys, subtrees, priority, sequence, added):
+        self.rule_id = rule_id
+        self.operation = operation
+        self.keys = keys
+        self.required_keys = _required_keys(operation)
+        self.subtrees = subtrees
+        self.priority = priority
+        self.sequence = sequence
+        self.added = added
+        self.removed = None
+        # A replaced rule keeps its sequence, so the version tells the entries apart
+        self.order = (priority, sequence, added)
+
+
+_order = attrgetter("order")
+
+
+class _Ordered:
+    """
+    Entries sorted by order, in blocks. insert() returns a new _Ordered sharing the
+    blocks it didn't change, so readers iterating one are not affected by writes
+    """
+
+    __slots__ = ("_blocks", "_lasts", "_length")
+
+    def __init__(self, blocks: Tuple = (), lasts: Tuple = (), length: int = 0):
+        self._blocks = blocks
+        # Order of the last entry of each block
+        self._lasts = lasts
+        self._length = length
+
+    @classmethod
+    def from_sorted(cls, entries: List[_Entry]) -> "_Ordered":
+        blocks = tuple(
+            tuple(entries[start : start + _BLOCK_SIZE])
+            for start in range(0, len(entries), _BLOCK_SIZE)
+        )
+        return cls(blocks, tuple(block[-1].order for block in blocks), len(entries))
+
+    def insert(self, entry: _Entry) -> "_Ordered":
+        blocks = self._blocks
+        if not blocks:
+            return _Ordered(((entry,),), (entry.order,), 1)
+
+        index = min(bisect_left(self._lasts, entry.order), len(blocks) - 1)
+        block = blocks[index]
+        position = bisect_left([other.order for other in block], entry.order)
+        block = block[:position] + (entry,) + block[position:]
+        changed = (
+            (block[:_BLOCK_SIZE], block[_BLOCK_SIZE:])
+            if len(block) > 2 * _BLOCK_SIZE
+            else (block,)
+        )
+        return _Ordered(
+            blocks[:index] + changed + blocks[index + 1 :],
+            self._lasts[:index]
+            + tuple(block[-1].order for block in changed)
+            + self._lasts[index + 1 :],
+            self._length + 1,
+        )
+
+    def __iter__(self) -> Iterator[_Entry]:
+        return chain.from_iterable(self._blocks)
+
+    def __len__(self) -> int:
+        return self._length
+
+
+class _Pruned:
+    """
+    The rules using a set of NEVER_MATCH fields (or keys under them), pruned. Shared
+    by the snapshots of an _Index, and brought up to date with the entries added since
+    it was last used
+    """
+
+    __slots__ = ("fields", "rules", "_keys", "_scanned", "_appended")
+
+    def __init__(self, fields: FrozenSet[str]):
+        self.fields = fields
+        # Entry -> (whether the result is constant or None if the rule raises an
+        # error, the result, operation left or error, required keys of the operation
+        # left or None if one is always missing)
+        self.rules: Dict[_Entry, Tuple] = {}
+        # Keys using the fields -> number of their entries pruned
+        self._keys: Dict[str, int] = {}
+        # Number of the index's keys checked, and of its entries pruned
+        self._scanned = 0
+        self._appended = 0
+
+    def under_field(self, key: str) -> bool:
+        parts = key.split(".")
+        return any(".".join(parts[:end]) in self.fields for end in range(1, len(parts)))
+
+    def update(self, index: "_Index"):
+        if self._appended == index.appended:
+            return
+        with index.lock:
+            # Writers update the lists first, so they hold at least this many entries
+            appended = index.appended
+            keys = index.keys[self._scanned :]
+            self._scanned += len(keys)
+            for key in keys:
+                if key in self.fields or self.under_field(key):
+                    self._keys[key] = 0
+            for key, pruned in list(self._keys.items()):
+                entries = index.by_key[key][pruned:]
+                for entry in entries:
+                    if entry not in self.rules:
+                        self.rules[entry] = self._prune(entry)
+                self._keys[key] = pruned + len(entries)
+            self._appended = appended
+
+    def _prune(self, entry: _Entry) -> Tuple:
+        try:
+            constant, value = _prune_never_match(entry.operation, self.fields)
+        except JsonOperationError as e:
+            # Raised again when the rule is evaluated, as execute() would. Keys
+            # under the fields are missing, so top_k skips the rule if it requires
+            # one
+            required = entry.required_keys
+            if any(self.under_field(key) for key in required):
+                required = None
+            else:
+                required = required - self.fields
+            return None, e, required
+        return constant, value, frozenset() if constant else _required_keys(value)
+
+
+class _Index:
+    """
+    The entries of a RuleSet in priority order, by the first of their required keys
+    and by the keys they use. Shared by its snapshots: entries are only added (removed
+    ones stay until the RuleSet is compacted, which creates a new _Index), so a
+    snapshot sees the entries of its version by filtering on it
+    """
+
+    __slots__ = (
+        "ordered",
+        "anchored",
+        "unanchored",
+        "by_key",
+        "keys",
+        "appended",
+        "pruned",
+        "lock",
+    )
+
+    def __init__(self, entries: Iterable[_Entry] = ()):
+        entries = sorted(entries, key=_order)
+        self.ordered = _Ordered.from_sorted(entries)
+        anchored = {}
+        unanchored = []
+        self.by_key: Dict[str, List[_Entry]] = {}
+        # Keys in the order they were first used
+        self.keys: List[str] = []
+        for entry in entries:
+            if entry.required_keys:
+                anchored.setdefault(min(entry.required_keys), []).append(entry)
+            else:
+                unanchored.append(entry)
+            self._add_keys(entry)
+        # First required key -> entries, and entries without required keys
+        self.anchored: Dict[str, _Ordered] = {
+            key: _Ordered.from_sorted(anchored_entries)
+            for key, anchored_entries in anchored.items()
+        }
+        self.unanchored = _Ordered.from_sorted(unanchored)
+        self.appended = len(entries)
+        self.pruned: Dict[FrozenSet[str], _Pruned] = {}
+        self.lock = threading.Lock()
+
+    def _add_keys(self, entry: _Entry):
+        for key in entry.keys:
+            entries = self.by_key.get(key)
+            if entries is None:
+                entries = self.by_key[key] = []
+                self.keys.append(key)
+            entries.append(entry)
+
+    def add(self, entry: _Entry):
+        # Raises a TypeError, without changing anything, if the priority can't be
+        # compared with the others
+        ordered = self.ordered.insert(entry)
+        if entry.required_keys:
+            anchor = min(entry.required_keys)
+            anchored = self.anchored.get(anchor, _Ordered()).insert(entry)
+        else:
+            unanchored = self.unanchored.insert(entry)
+
+        self.ordered = ordered
+        if entry.required_keys:
+            self.anchored[anchor] = anchored
+        else:
+            self.unanchored = unanchored
+        self._add_keys(entry)
+        self.appended += 1
+
+    def prune(self, never_match: Iterable) -> Dict[_Entry, Tuple]:
+        fields = frozenset(str(field) for field in never_match)
+        pruned = self.pruned.get(fields)
+        if pruned is None:
+            with self.lock:
+                pruned = self.pruned.get(fields)
+                if pruned is None:
+                    if len(self.pruned) >= _MAX_PRUNED:
+                        self.pruned.clear()
+                    pruned = self.pruned[fields] = _Pruned(fields)
+        pruned.update(self)
+        return pruned.rules
+
+    def candidates(self, evaluation: "_Pass") -> Iterable[_Entry]:
+        """
+        Returns the entries in priority order, without the ones whose first required
+        key is missing from the context when that's worth it
+        """
+        ordered = self.ordered
+        # Copied first, as writers may be adding keys
+        anchored = self.anchored.copy()
+        if len(anchored) * _MIN_RULES_PER_ANCHOR > len(ordered):
+            return ordered
+        streams = [self.unanchored]
+        for key, entries in anchored.items():
+            try:
+                missing = evaluation._key(key) is None
+            except IndexError:
+                # Raised when the rules are checked, in priority order
+                missing = False
+            if not missing:
+                streams.append(entries)
+        if sum(len(entries) for entries in streams) * 2 > len(ordered):
+            return ordered
+        return heapq.merge(*streams, key=_order)
+
+
+class _Pass:
+    """
+    Evaluates operations against one context. Subtrees shared between rules are the
+    same object, so each one is evaluated once per pass. The values of the keys used
+    by list operators, and the sets of long lists, are also computed once per pass
+    """
+
+    __slots__ = ("context", "_values", "_keys", "_sets", "_hashed_items")
+
+    def __init__(self, context):
+        self.context = context
+        self._values = {}
+        self._keys = {}
+        # id of a list -> (list, frozenset of its items or None if unhashable)
+        self._sets = {}
+        self._hashed_items = 0
+
+    def evaluate(self, json_operation):
+        if not isinstance(json_operation, list):
+            return json_operation
+
+        try:
+            return self._values[id(json_operation)]
+        except KeyError:
+            pass
+
+        operator = json_operation[0]
+        if operator in _nesting_operators:
+            value = _execute_operation(
+                operator, [self.evaluate(val) for val in json_operation[1:]]
+            )
+        elif operator in _list_operators:
+            value = self._list_operation(json_operation)
+        else:
+            value = execute(json_operation, self.context)
+        self._values[id(json_operation)] = value
+        return value
+
+    def _key(self, key: str):
+        try:
+            return self._keys[key]
+        except KeyError:
+            value = self._keys[key] = _get_key(self.context, key)
+            return value
+
+    def _hashed(self, items: list) -> Optional[FrozenSet]:
+        try:
+            return self._sets[id(items)][1]
+        except KeyError:
+            pass
+        try:
+            hashed = frozenset(items)
+        except TypeError:
+            hashed = None
+        if self._hashed_items + len(items) <= _MAX_HASHED_ITEMS:
+            # The list is kept so its id isn't reused during the pass
+            self._sets[id(items)] = (items, hashed)
+            self._hashed_items += len(items)
+        return hashed
+
+    def _list_operation(self, json_operation):
+        # Falls back to execute() for what isn't handled here, which also raises the
+        # same errors
+        if len(json_operation) != 3:
+            return execute(json_operation, self.context)
+        operator, a, b = json_operation
+        if isinstance(a, list) and (not a or a[0] == "key"):
+            if len(a) != 2 or type(a[1]) is not str:
+                return execute(json_operation, self.context)
+            a = self._key(a[1])
+        if isinstance(b, list) and (not b or b[0] == "key"):
+            if len(b) != 2 or type(b[1]) is not str:
+                return execute(json_operation, self.context)
+            b = self._key(b[1])
+        if a is NEVER_MATCH or b is NEVER_MATCH:
+            return False
+
+        if type(b) is list and len(b) >= _MIN_HASHED_LENGTH:
+            if operator in ("&", "!&"):
+                hashed = self._hashed(a) if type(a) is list else None
+                other = self._hashed(b)
+                if hashed is not None and other is not None:
+                    return hashed.isdisjoint(other) == (operator == "!&")
+            else:
+                stack = self._hashed(b)
+                try:
+                    if stack is not None:
+                        return (a in stack) == (operator == "in")
+                except TypeError:
+                    # Unhashable needle
+                    pass
+        elif (
+            type(a) is list
+            and len(a) >= _MIN_HASHED_LENGTH
+            and operator in ("&", "!&")
+            and type(b) is list
+        ):
+            hashed, other = self._hashed(a), self._hashed(b)
+            if hashed is not None and other is not None:
+                return hashed.isdisjoint(other) == (operator == "!&")
+        else:
+            try:
+                return _operators[operator](a, b)
+            except TypeError:
+                pass
+        return execute(json_operation, self.context)
+
+    def can_match(self, entry: _Entry) -> bool:
+        return self.has_keys(entry.required_keys)
+
+    def has_keys(self, keys: FrozenSet[str]) -> bool:
+        for key in keys:
+            if self._key(key) is None:
+                return False
+        return True
+
+
+class RuleSetSnapshot:
+    """
+    A consistent, read-only view of a RuleSet. Writes made to the RuleSet after the
+    snapshot was taken are not visible.
+    """
+
+    __slots__ = ("_entries", "_length", "version", "_index")
+
+    def __init__(self, entries: List[_Entry], length: int, version: int, index: _Index):
+        self._entries = entries
+        self._length = length
+        self.version = version
+        self._index = index
+
+    def _visible(self) -> Iterator[_Entry]:
+        entries = self._entries
+        return self._of_version(entries[index] for index in range(self._length))
+
+    def _of_version(self, entries: Iterable[_Entry]) -> Iterator[_Entry]:
+        version = self.version
+        for entry in entries:
+            if entry.added <= version and (
+                entry.removed is None or entry.removed > version
+            ):
+                yield entry
+
+    def __iter__(self) -> Iterator[Tuple[object, List]]:
+        for entry in self._visible():
+            yield entry.rule_id, entry.operation
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self._visible())
+
+    def _results(
+        self,
+        evaluation: _Pass,
+        entries: Iterable[_Entry],
+        never_match: Iterable,
+        skip: bool,
+    ) -> Iterator[Tuple[_Entry, object]]:
+        # Yields the entries and their results. With skip, rules that need a key
+        # missing from the context are left out
+        pruned = self._index.prune(never_match) if never_match else {}
+        for entry in entries:
+            rule = pruned.get(entry)
+            if rule is None:
+                if not skip or evaluation.can_match(entry):
+                    yield entry, evaluation.evaluate(entry.operation)
+            elif rule[0] is None:
+                if not skip or (rule[2] is not None and evaluation.has_keys(rule[2])):
+                    raise JsonOperationError(*rule[1].args)
+            elif rule[0]:
+                yield entry, rule[1]
+            elif not skip or evaluation.has_keys(rule[2]):
+                yield entry, evaluation.evaluate(rule[1])
+
+    def execute(self, context, never_match: Iterable = ()) -> Dict[object, bool]:
+        """
+        Here and in matches, top_k and first_match, the fields in never_match are
+        evaluated as if they were NEVER_MATCH in the context. The rules using them are
+        pruned once per set of fields, so what the fields decide isn't evaluated again
+        """
+        if never_match:
+            results = self._results(_Pass(context), self._visible(), never_match, False)
+            return {entry.rule_id: result for entry, result in results}
+        evaluation = _Pass(context)
+        return {
+            entry.rule_id: evaluation.evaluate(entry.operation)
+            for entry in self._visible()
+        }
+
+    def matches(self, context, never_match: Iterable = ()) -> List:
+        if never_match:
+            results = self._results(_Pass(context), self._visible(), never_match, False)
+            return [entry.rule_id for entry, result in results if result]
+        evaluation = _Pass(context)
+        return [
+            entry.rule_id
+            for entry in self._visible()
+            if evaluation.evaluate(entry.operation)
+        ]
+
+    def top_k(self, context, k: int, never_match: Iterable = ()) -> List:
+        """
+        Returns the ids of the first k matching rules in priority order. Evaluation
+        stops once k rules match. Rules that need a key missing from the context are
+        skipped without being evaluated, since they cannot match
+        """
+        matched = []
+        if k <= 0:
+            return matched
+        evaluation = _Pass(context)
+        # Pruned rules may need other keys than the rule did
+        entries = (
+            self._index.ordered if never_match else self._index.candidates(evaluation)
+        )
+        for entry, result in self._results(
+            evaluation, self._of_version(entries), never_match, True
+        ):
+            if result:
+                matched.append(entry.rule_id)
+                if len(matched) >= k:
+                    break
+        return matched
+
+    def first_match(self, context, never_match: Iterable = ()):
+        """
+        Returns the id of the highest priority matching rule, or None
+        """
+        matched = self.top_k(context, 1, never_match)
+        return matched[0] if matched else None
+
+
+class RuleSet:
+    """
+    A mutable collection of json operations keyed by rule id.
+
+    add, remove and replace run in time proportional to the size of the rule being
+    changed. Identical subtrees are shared between rules and reference counted, as is
+    the index from key names to rule ids. Readers call snapshot() to get a consistent
+    view that is not affected by concurrent writes.
+
+    Rules with a lower priority value are evaluated first by first_match and top_k.
+    Rules with the same priority are evaluated in the order they were added. The
+    priority order, and the index from key names to rules, are updated by each write
+    and shared with the snapshots, so a write doesn't sort the rules again.
+    """
+
+    def __init__(self, rules: Optional[Dict] = None):
+        self._lock = threading.Lock()
+        # Append-only log of entries. Removed entries are tombstoned with the version
+        # they were removed in so older snapshots can still see them
+        self._entries: List[_Entry] = []
+        self._by_id: Dict[object, _Entry] = {}
+        self._version = 0
+        self._sequence = 0
+        self._tombstones = 0
+        # Structural key -> [shared subtree, reference count]
+        self._subtrees: Dict[Tuple, List] = {}
+        # Key name -> ids of the rules using that key
+        self._key_index: Dict[str, set] = {}
+        self._index = _Index()
+        self._snapshot = RuleSetSnapshot(self._entries, 0, 0, self._index)
+
+        for rule_id, operation in (rules or {}).items():
+            self.add(rule_id, operation)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __contains__(self, rule_id) -> bool:
+        return rule_id in self._by_id
+
+    def get(self, rule_id, default=None):
+        entry = self._by_id.get(rule_id)
+        return default if entry is None else entry.operation
+
+    def snapshot(self) -> RuleSetSnapshot:
+        return self._snapshot
+
+    def rules_for_key(self, key) -> FrozenSet:
+        # Writers change the sets in place, so they are copied under the lock
+        with self._lock:
+            return frozenset(self._key_index.get(str(key), ()))
+
+    def add(self, rule_id, json_operation: List, priority=0):
+        with self._lock:
+            if rule_id in self._by_id:
+                raise KeyError(f"Rule {rule_id!r} already exists")
+            self._sequence += 1
+            entry = self._new_entry(
+                rule_id, json_operation, priority, self._sequence, self._version + 1
+            )
+            try:
+                self._index.add(entry)
+            except TypeError:
+                self._unshare(entry)
+                self._sequence -= 1
+                raise
+            self._entries.append(entry)
+            self._by_id[rule_id] = entry
+            self._publish()
+
+    def remove(self, rule_id):
+        with self._lock:
+            entry = self._by_id.pop(rule_id)
+            entry.removed = self._version + 1
+            self._release(entry)
+            self._publish()
+
+    def replace(self, rule_id, json_operation: List, priority=None):
+        with self._lock:
+            old_entry = self._by_id[rule_id]
+            # Build the new entry first so shared subtrees are not released and
+            # recreated, and so an invalid operation leaves the old rule in place
+            entry = self._new_entry(
+                rule_id,
+                json_operation,
+                old_entry.priority if priority is None else priority,
+                old_entry.sequence,
+                self._version + 1,
+            )
+            try:
+                self._index.add(entry)
+            except TypeError:
+                self._unshare(entry, keep_keys=old_entry.keys)
+                raise
+            old_entry.removed = entry.added
+            self._release(old_entry, keep_keys=entry.keys)
+            self._entries.append(entry)
+            self._by_id[rule_id] = entry
+            self._publish()
+
+    def _new_entry(
+        self, rule_id, json_operation, priority, sequence, version
+    ) -> _Entry:
+        keys = frozenset(
+            str(key["name"])
+            for key in (
+                get_keys(json_operation) if isinstance(json_operation, list) else []
+            )
+        )
+        subtrees = []
+        operation = self._share(json_operation, subtrees)
+        for key in keys:
+            self._key_index.setdefault(key, set()).add(rule_id)
+        return _Entry(rule_id, operation, keys, subtrees, priority, sequence, version)
+
+    def _share(self, json_operation, subtrees: List):
+        # Replace the operation with a shared copy, bottom up. A nesting operation is
+        # identified by the ids of its (already shared) children, so building the key
+        # does not rehash whole subtrees at every level
+        if not isinstance(json_operation, list):
+            return json_operation
+
+        operator, *unparsed = json_operation
+        if operator in _nesting_operators:
+            children = [self._share(child, subtrees) for child in unparsed]
+            structural_key = (
+                operator,
+                tuple(
+                    id(child) if isinstance(child, list) else _freeze_literal(child)
+                    for child in children
+                ),
+            )
+            shared = [operator, *children]
+        else:
+            structural_key = _freeze_literal(json_operation)
+            shared = json_operation
+
+        slot = self._subtrees.get(structural_key)
+        if slot is None:
+            slot = self._subtrees[structural_key] = [shared, 0]
+        slot[1] += 1
+        subtrees.append(structural_key)
+        return slot[0]
+
+    def _release(self, entry: _Entry, keep_keys: FrozenSet = frozenset()):
+        self._unshare(entry, keep_keys)
+        self._tombstones += 1
+
+    def _unshare(self, entry: _Entry, keep_keys: FrozenSet = frozenset()):
+        for structural_key in entry.subtrees:
+            slot = self._subtrees[structural_key]
+            slot[1] -= 1
+            if not slot[1]:
+                del self._subtrees[structural_key]
+
+        for key in entry.keys - keep_keys:
+            rule_ids = self._key_index[key]
+            rule_ids.discard(entry.rule_id)
+            if not rule_ids:
+                del self._key_index[key]
+
+    def _publish(self):
+        self._version += 1
+        if self._tombstones >= _MIN_COMPACTION and self._tombstones > len(self._by_id):
+            # Older snapshots keep a reference to the old list, so it is replaced
+            # rather than modified
+            self._entries = [entry for entry in self._entries if entry.removed is None]
+            self._index = _Index(self._entries)
+            self._tombstones = 0
+        self._snapshot = RuleSetSnapshot(
+            self._entries, len(self._entries), self._version, self._index
+        )
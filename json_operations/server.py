@@ -0,0 +1,474 @@
+"""
+A local HTTP server (over TCP or a Unix socket) for evaluating json operations from other
+languages, and a load generator for it.
+
+Protocol (JSON bodies, HTTP/1.1 keep-alive):
+    PUT    /rule-sets/<name>  {"rules": {<rule id>: <operations>, ...}}
+    DELETE /rule-sets/<name>
+    GET    /rule-sets         -> {<name>: <number of rules>, ...}
+    POST   /evaluate          {"rule_set": <name>, "context": {...}} -> {"matches": [...]}
+                              {"operation": <operations>, "context": {...}} -> {"result": ...}
+                              "contexts": [...] instead of "context" returns a list
+    GET    /metrics           -> request counts, batch sizes, latency and throughput
+"""
+import http.client
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Dict, List, Optional
+
+from json_operations import JsonOperationError, execute
+from json_operations.batch import execute_batch
+from json_operations.rule_set import RuleSet
+
+# Latencies kept for percentiles
+_LATENCY_SAMPLES = 10000
+# Errors caused by the operations or contexts of a request
+_REQUEST_ERRORS = (ValueError, KeyError, TypeError, IndexError, JsonOperationError)
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"p50": 0.0, "p90": 0.0, "p99": 0.0, "max": 0.0}
+    samples = sorted(samples)
+    last = len(samples) - 1
+    return {
+        "p50": samples[int(last * 0.5)],
+        "p90": samples[int(last * 0.9)],
+        "p99": samples[int(last * 0.99)],
+        "max": samples[last],
+    }
+
+
+class _Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._requests = 0
+        self._errors = 0
+        self._contexts = 0
+        self._batches = 0
+        self._batched_requests = 0
+        self._latencies = deque(maxlen=_LATENCY_SAMPLES)
+
+    def request(self, latency: float, contexts: int, error: bool):
+        with self._lock:
+            self._requests += 1
+            self._errors += error
+            self._contexts += contexts
+            self._latencies.append(latency)
+
+    def batch(self, size: int):
+        with self._lock:
+            self._batches += 1
+            self._batched_requests += size
+
+    def report(self) -> Dict:
+        with self._lock:
+            uptime = time.monotonic() - self._started
+            latencies = _percentiles([l * 1000 for l in self._latencies])
+            return {
+                "uptime": uptime,
+                "requests": self._requests,
+                "errors": self._errors,
+                "contexts": self._contexts,
+                "batches": self._batches,
+                "mean_batch_size": (
+                    self._batched_requests / self._batches if self._batches else 0.0
+                ),
+                "requests_per_second": self._requests / uptime if uptime else 0.0,
+                "latency_ms": latencies,
+            }
+
+
+class _Evaluation:
+    __slots__ = ("rule_set", "operation", "contexts", "results", "error", "done")
+
+    def __init__(self, rule_set, operation, contexts):
+        self.rule_set = rule_set
+        self.operation = operation
+        self.contexts = contexts
+        self.results = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class Evaluator:
+    """
+    Holds named rule sets and evaluates requests from many connection threads. Requests
+    that arrive within max_delay seconds of each other (up to max_batch of them) are
+    evaluated together in one pass: one snapshot and one execute_batch call per rule
+    for each rule set, and one execute_batch call per distinct operation
+    """
+
+    def __init__(self, max_batch: int = 64, max_delay: float = 0.001):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.metrics = _Metrics()
+        self._rule_sets: Dict[str, RuleSet] = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def set_rule_set(self, name: str, rules: Dict):
+        rule_set = RuleSet(rules)
+        with self._lock:
+            self._rule_sets[name] = rule_set
+
+    def delete_rule_set(self, name: str):
+        with self._lock:
+            del self._rule_sets[name]
+
+    def rule_sets(self) -> Dict[str, int]:
+        with self._lock:
+            return {name: len(rule_set) for name, rule_set in self._rule_sets.items()}
+
+    def evaluate(
+        self, contexts: List, rule_set: Optional[str] = None, operation=None
+    ) -> List:
+        """
+        Evaluates the operation, or matches the rule set, against every context
+        """
+        started = time.monotonic()
+        evaluation = _Evaluation(rule_set, operation, contexts)
+        self._queue.put(evaluation)
+        evaluation.done.wait()
+        self.metrics.request(
+            time.monotonic() - started, len(contexts), evaluation.error is not None
+        )
+        if evaluation.error is not None:
+            raise evaluation.error
+        return evaluation.results
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            evaluation = self._queue.get()
+            if evaluation is None:
+                return
+            batch = [evaluation]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    evaluation = (
+                        self._queue.get(timeout=timeout)
+                        if timeout > 0
+                        else self._queue.get_nowait()
+                    )
+                except queue.Empty:
+                    break
+                if evaluation is None:
+                    self._queue.put(None)
+                    break
+                batch.append(evaluation)
+
+            self.metrics.batch(len(batch))
+            self._evaluate(batch)
+
+    def _evaluate(self, batch: List[_Evaluation]):
+        by_rule_set = {}
+        by_operation = {}
+        for evaluation in batch:
+            try:
+                if evaluation.rule_set is not None:
+                    by_rule_set.setdefault(evaluation.rule_set, []).append(evaluation)
+                else:
+                    key = json.dumps(evaluation.operation, sort_keys=True)
+                    by_operation.setdefault(key, []).append(evaluation)
+            except Exception as e:
+                evaluation.error = e
+                evaluation.done.set()
+
+        for name, evaluations in by_rule_set.items():
+            with self._lock:
+                rule_set = self._rule_sets.get(name)
+            if rule_set is None:
+                for evaluation in evaluations:
+                    evaluation.error = KeyError(f"Unknown rule set {name!r}")
+                    evaluation.done.set()
+                continue
+            snapshot = rule_set.snapshot()
+            contexts = [context for e in evaluations for context in e.contexts]
+            try:
+                matches = [[] for _ in contexts]
+                for rule_id, operation in snapshot:
+                    for index, result in enumerate(execute_batch(operation, contexts)):
+                        if result:
+                            matches[index].append(rule_id)
+            except Exception:
+                self._one_at_a_time(evaluations, snapshot.matches)
+                continue
+            self._split(evaluations, matches)
+
+        for evaluations in by_operation.values():
+            operation = evaluations[0].operation
+            try:
+                results = execute_batch(
+                    operation,
+                    [context for e in evaluations for context in e.contexts],
+                )
+            except Exception:
+                self._one_at_a_time(
+                    evaluations, lambda context: execute(operation, context)
+                )
+                continue
+            self._split(evaluations, results)
+
+    @staticmethod
+    def _one_at_a_time(evaluations: List[_Evaluation], evaluate):
+        # Finds which requests failed by evaluating them one at a time
+        for evaluation in evaluations:
+            try:
+                evaluation.results = [
+                    evaluate(context) for context in evaluation.contexts
+                ]
+            except Exception as e:
+                evaluation.error = e
+            evaluation.done.set()
+
+    @staticmethod
+    def _split(evaluations: List[_Evaluation], results: List):
+        start = 0
+        for evaluation in evaluations:
+            end = start + len(evaluation.contexts)
+            evaluation.results = results[start:end]
+            start = end
+            evaluation.done.set()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "json-operations"
+    # Headers and body are written separately, which Nagle's algorithm would delay on
+    # keep-alive connections
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_error(self, error: Exception):
+        # Errors raised by anything else are answered too, rather than dropping the
+        # connection
+        if isinstance(error, _REQUEST_ERRORS):
+            self._send(400, {"error": str(error)})
+        else:
+            self._send(500, {"error": f"{type(error).__name__}: {error}"})
+
+    def _not_found(self, error: str = "Not found"):
+        # The body has to be read, or it would be parsed as the next request on
+        # keep-alive connections
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        self._send(404, {"error": error})
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def _rule_set_name(self) -> Optional[str]:
+        prefix = "/rule-sets/"
+        return self.path[len(prefix) :] if self.path.startswith(prefix) else None
+
+    def do_GET(self):
+        evaluator = self.server.evaluator
+        if self.path == "/metrics":
+            self._send(200, evaluator.metrics.report())
+        elif self.path == "/rule-sets":
+            self._send(200, evaluator.rule_sets())
+        else:
+            self._not_found()
+
+    def do_PUT(self):
+        name = self._rule_set_name()
+        if not name:
+            self._not_found()
+            return
+        try:
+            self.server.evaluator.set_rule_set(name, self._body()["rules"])
+        except Exception as e:
+            self._send_error(e)
+            return
+        self._send(200, {"rule_set": name})
+
+    def do_DELETE(self):
+        name = self._rule_set_name()
+        try:
+            self.server.evaluator.delete_rule_set(name)
+        except KeyError:
+            self._not_found(f"Unknown rule set {name!r}")
+            return
+        self._send(200, {"rule_set": name})
+
+    def do_POST(self):
+        if self.path != "/evaluate":
+            self._not_found()
+            return
+        try:
+            body = self._body()
+            single = "contexts" not in body
+            contexts = [body["context"]] if single else body["contexts"]
+            if "rule_set" in body:
+                results = self.server.evaluator.evaluate(
+                    contexts, rule_set=body["rule_set"]
+                )
+                field = "matches"
+            else:
+                results = self.server.evaluator.evaluate(
+                    contexts, operation=body["operation"]
+                )
+                field = "result" if single else "results"
+        except Exception as e:
+            self._send_error(e)
+            return
+        self._send(200, {field: results[0] if single else results})
+
+
+class _TCPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _UnixHandler(_Handler):
+    disable_nagle_algorithm = False
+
+    def address_string(self):
+        return "unix"
+
+    def setup(self):
+        # UnixStreamServer gives an empty client address, BaseHTTPRequestHandler
+        # expects a tuple
+        self.client_address = ("unix", 0)
+        super().setup()
+
+
+def make_server(
+    evaluator: Evaluator,
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    unix_socket: Optional[str] = None,
+) -> socketserver.BaseServer:
+    """
+    Creates a server for the evaluator, listening on host and port or on unix_socket.
+    Call serve_forever() on it
+    """
+    if unix_socket is not None:
+        if os.path.exists(unix_socket):
+            os.unlink(unix_socket)
+        server = _UnixServer(unix_socket, _UnixHandler)
+    else:
+        server = _TCPServer((host, port), _Handler)
+    server.evaluator = evaluator
+    return server
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+def connect(
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    unix_socket: Optional[str] = None,
+    timeout: float = 10.0,
+) -> http.client.HTTPConnection:
+    """
+    A keep-alive connection to the server
+    """
+    if unix_socket is not None:
+        return _UnixConnection(unix_socket, timeout)
+    return http.client.HTTPConnection(host, port, timeout=timeout)
+
+
+def request(connection: http.client.HTTPConnection, method: str, path: str, body=None):
+    """
+    Sends a request and returns the status and decoded response body
+    """
+    payload = None if body is None else json.dumps(body).encode("utf-8")
+    headers = {"Content-Type": "application/json"} if payload is not None else {}
+    connection.request(method, path, body=payload, headers=headers)
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def run_load(
+    body: Dict,
+    requests: int = 10000,
+    concurrency: int = 8,
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    unix_socket: Optional[str] = None,
+) -> Dict:
+    """
+    Sends requests POST /evaluate requests with body from concurrency keep-alive
+    connections. Returns the throughput and latency seen by the clients
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    per_connection = [requests // concurrency] * concurrency
+    for index in range(requests % concurrency):
+        per_connection[index] += 1
+
+    def worker(count: int):
+        connection = connect(host, port, unix_socket)
+        local_latencies = []
+        local_errors = 0
+        try:
+            for _ in range(count):
+                started = time.monotonic()
+                status, _ = request(connection, "POST", "/evaluate", body)
+                local_latencies.append(time.monotonic() - started)
+                local_errors += status != 200
+        finally:
+            connection.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in per_connection]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": sum(errors),
+        "seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_ms": _percentiles([l * 1000 for l in latencies]),
+    }
@@ -0,0 +1,339 @@
+"""
+A rule set split across local worker processes, for rule sets too large for the memory
+or latency budget of one process. Rules are grouped by the keys they use, so each
+worker only needs a few fields of the context, and contexts are only sent to the
+workers holding rules that can match them.
+"""
+import math
+import multiprocessing
+import threading
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from json_operations import JsonOperationError, _get_key, get_keys
+from json_operations.projection import Projector
+from json_operations.rule_set import RuleSet, _Pass, _required_keys
+
+
+def _worker(connection):
+    rule_set = RuleSet()
+    while True:
+        command, argument = connection.recv()
+        try:
+            if command == "add":
+                for rule_id, json_operation in argument:
+                    rule_set.add(rule_id, json_operation)
+                result = None
+            elif command in ("take", "remove"):
+                result = None
+                if command == "take":
+                    result = [(rule_id, rule_set.get(rule_id)) for rule_id in argument]
+                for rule_id in argument:
+                    rule_set.remove(rule_id)
+            elif command == "matches":
+                entries = list(rule_set.snapshot()._visible())
+                result = []
+                for context in argument:
+                    evaluation = _Pass(context)
+                    result.append(
+                        [
+                            entry.rule_id
+                            for entry in entries
+                            if evaluation.can_match(entry)
+                            and evaluation.evaluate(entry.operation)
+                        ]
+                    )
+            else:
+                connection.send(("ok", None))
+                break
+        except Exception as e:
+            try:
+                connection.send(("error", e))
+            except Exception:
+                connection.send(("error", JsonOperationError(str(e))))
+        else:
+            connection.send(("ok", result))
+    connection.close()
+
+
+class ShardStats(NamedTuple):
+    rules: int
+    # Keys of the contexts sent to the shard, and the key signatures of its rules
+    keys: FrozenSet[str]
+    signatures: int
+
+
+class _Shard:
+    def __init__(self, process, connection):
+        self.process = process
+        self.connection = connection
+        self.rules = 0
+        # Key signature -> ids of the rules with that signature
+        self.groups: Dict[FrozenSet[str], Set] = {}
+        # Key -> number of rules using it
+        self.keys: Dict[str, int] = {}
+        # Required keys -> number of rules needing them
+        self.required: Dict[FrozenSet[str], int] = {}
+        self._projector = None
+
+    def projector(self) -> Projector:
+        if self._projector is None:
+            self._projector = Projector(self.keys)
+        return self._projector
+
+    def add(self, rule_id, signature: FrozenSet[str], required: FrozenSet[str]):
+        self.rules += 1
+        self.groups.setdefault(signature, set()).add(rule_id)
+        for key in signature:
+            if key not in self.keys:
+                self._projector = None
+            self.keys[key] = self.keys.get(key, 0) + 1
+        self.required[required] = self.required.get(required, 0) + 1
+
+    def remove(self, rule_id, signature: FrozenSet[str], required: FrozenSet[str]):
+        self.rules -= 1
+        group = self.groups[signature]
+        group.discard(rule_id)
+        if not group:
+            del self.groups[signature]
+        for key in signature:
+            self.keys[key] -= 1
+            if not self.keys[key]:
+                del self.keys[key]
+                self._projector = None
+        self.required[required] -= 1
+        if not self.required[required]:
+            del self.required[required]
+
+
+class ShardedRuleSet:
+    """
+    Rules (a dict of rule id to json operations) split across shards worker processes.
+
+    Rules with the same key signature (the keys get_keys() returns) are kept on the
+    same shard while it has room, and on shards already using their keys otherwise.
+    Rules needing a key missing from the context are skipped without being evaluated,
+    as in RuleSetSnapshot.top_k, so a context is only sent to the shards with a rule
+    whose required keys are all in it, and only with the fields the shard's rules use. Shards
+    are rebalanced when rules are added or removed, once the largest one holds more
+    than tolerance above the average.
+
+    Contexts and rules are sent to the workers with pickle. Call close() (or use it as
+    a context manager) to stop the workers
+    """
+
+    def __init__(
+        self,
+        rules: Optional[Dict] = None,
+        shards: Optional[int] = None,
+        tolerance: float = 0.1,
+        start_method: Optional[str] = None,
+    ):
+        self.tolerance = tolerance
+        self._lock = threading.Lock()
+        # Rule id -> (key signature, required keys, shard index, sequence)
+        self._rules: Dict[object, Tuple] = {}
+        self._sequence = 0
+
+        context = multiprocessing.get_context(start_method)
+        self._shards: List[_Shard] = []
+        for _ in range(shards or multiprocessing.cpu_count()):
+            connection, worker_connection = context.Pipe()
+            process = context.Process(
+                target=_worker, args=(worker_connection,), daemon=True
+            )
+            process.start()
+            worker_connection.close()
+            self._shards.append(_Shard(process, connection))
+
+        if rules:
+            self.update(rules)
+
+    def __len__(self) -> int:
+        return len(self._rules)
+
+    def __contains__(self, rule_id) -> bool:
+        return rule_id in self._rules
+
+    def __enter__(self) -> "ShardedRuleSet":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            for shard in self._shards:
+                if shard.process.is_alive():
+                    try:
+                        self._call({shard: ("stop", None)})
+                    except (EOFError, OSError):
+                        pass
+                shard.process.join()
+                shard.connection.close()
+            self._shards = []
+
+    def _call(self, commands: Dict) -> Dict:
+        # Sends every shard its command before waiting for any, so they run in
+        # parallel
+        for shard, command in commands.items():
+            shard.connection.send(command)
+        results = {}
+        error = None
+        for shard in commands:
+            status, result = shard.connection.recv()
+            if status == "error":
+                error = error or result
+            results[shard] = result
+        if error is not None:
+            raise error
+        return results
+
+    def _target(self, rules: int) -> int:
+        # Most rules a shard should hold
+        return max(1, math.ceil(rules / len(self._shards) * (1 + self.tolerance)))
+
+    def _place(self, signature: FrozenSet[str], target: int) -> _Shard:
+        with_room = [shard for shard in self._shards if shard.rules < target]
+        candidates = with_room or self._shards
+        # The shard already holding rules with the signature, then the one using most
+        # of its keys, then the smallest
+        return max(
+            candidates,
+            key=lambda shard: (
+                signature in shard.groups,
+                sum(1 for key in signature if key in shard.keys),
+                -shard.rules,
+            ),
+        )
+
+    def update(self, rules: Dict):
+        """
+        Adds the rules. Raises a KeyError if a rule id already exists, without adding
+        any of them
+        """
+        with self._lock:
+            placed = []
+            for rule_id, json_operation in rules.items():
+                if rule_id in self._rules:
+                    raise KeyError(f"Rule {rule_id!r} already exists")
+                keys = (
+                    get_keys(json_operation) if isinstance(json_operation, list) else []
+                )
+                signature = frozenset(str(key["name"]) for key in keys)
+                placed.append(
+                    (rule_id, json_operation, signature, _required_keys(json_operation))
+                )
+
+            batches = {}
+            target = self._target(len(self._rules) + len(placed))
+            for rule_id, json_operation, signature, required in placed:
+                shard = self._place(signature, target)
+                shard.add(rule_id, signature, required)
+                self._sequence += 1
+                self._rules[rule_id] = (
+                    signature,
+                    required,
+                    self._shards.index(shard),
+                    self._sequence,
+                )
+                batches.setdefault(shard, []).append((rule_id, json_operation))
+            self._call({shard: ("add", batch) for shard, batch in batches.items()})
+            self._rebalance()
+
+    def add(self, rule_id, json_operation: List):
+        self.update({rule_id: json_operation})
+
+    def remove(self, rule_id):
+        self.remove_many([rule_id])
+
+    def remove_many(self, rule_ids: Iterable):
+        with self._lock:
+            batches = {}
+            for rule_id in rule_ids:
+                signature, required, index, _ = self._rules.pop(rule_id)
+                shard = self._shards[index]
+                shard.remove(rule_id, signature, required)
+                batches.setdefault(shard, []).append(rule_id)
+            self._call({shard: ("remove", batch) for shard, batch in batches.items()})
+            self._rebalance()
+
+    def _rebalance(self):
+        target = self._target(len(self._rules))
+        while True:
+            largest = max(self._shards, key=lambda shard: shard.rules)
+            smallest = min(self._shards, key=lambda shard: shard.rules)
+            if largest.rules <= target or largest.rules - smallest.rules <= 1:
+                return
+            count = min(largest.rules - target, target - smallest.rules)
+            count = max(1, min(count, (largest.rules - smallest.rules) // 2))
+
+            # Moves whole signatures the smallest shard already has first, then the
+            # smallest signatures, so shards keep needing few keys
+            moved = []
+            groups = sorted(
+                largest.groups.items(),
+                key=lambda item: (item[0] not in smallest.groups, len(item[1])),
+            )
+            for signature, group in groups:
+                for rule_id in list(group)[: count - len(moved)]:
+                    moved.append(rule_id)
+                if len(moved) >= count:
+                    break
+
+            taken = self._call({largest: ("take", moved)})[largest]
+            index = self._shards.index(smallest)
+            for rule_id in moved:
+                signature, required, _, sequence = self._rules[rule_id]
+                largest.remove(rule_id, signature, required)
+                smallest.add(rule_id, signature, required)
+                self._rules[rule_id] = (signature, required, index, sequence)
+            self._call({smallest: ("add", taken)})
+
+    def stats(self) -> List[ShardStats]:
+        with self._lock:
+            return [
+                ShardStats(shard.rules, frozenset(shard.keys), len(shard.groups))
+                for shard in self._shards
+            ]
+
+    def matches(self, context) -> List:
+        return self.matches_batch([context])[0]
+
+    def matches_batch(self, contexts: Iterable) -> List[List]:
+        """
+        Returns the ids of the matching rules for each context, in the order they
+        were added
+        """
+        contexts = list(contexts)
+        with self._lock:
+            batches = {}
+            for index, context in enumerate(contexts):
+                present = {}
+
+                def has(key) -> bool:
+                    if key not in present:
+                        try:
+                            present[key] = _get_key(context, key) is not None
+                        except IndexError:
+                            # Evaluated, so the rule raises the error
+                            present[key] = True
+                    return present[key]
+
+                for shard in self._shards:
+                    if any(all(has(key) for key in keys) for keys in shard.required):
+                        batches.setdefault(shard, ([], []))
+                        batches[shard][0].append(index)
+                        batches[shard][1].append(shard.projector().project(context))
+
+            results = self._call(
+                {shard: ("matches", batch[1]) for shard, batch in batches.items()}
+            )
+            matched = [[] for _ in contexts]
+            for shard, (indexes, _) in batches.items():
+                for index, rule_ids in zip(indexes, results[shard]):
+                    matched[index] += rule_ids
+            order = self._rules
+            return [
+                sorted(rule_ids, key=lambda rule_id: order[rule_id][3])
+                for rule_ids in matched
+            ]
@@ -0,0 +1,199 @@
+"""
+A read-only rule store in a memory mapped file, so every worker process on a host maps one
+copy of the encoded rule set instead of reading its own. Only the file is shared: each
+worker decodes an operation the first time it uses it and keeps it for as long as it uses
+that version of the rules.
+
+Put the file on a RAM backed filesystem (e.g. /dev/shm) to keep it in shared memory.
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from json_operations import JsonOperationError, execute
+from json_operations.intern import Interner
+
+_MAGIC = b"JOPS"
+_FORMAT_VERSION = 1
+# magic, format version, generation, number of rules
+_HEADER = struct.Struct("<4sIQQ")
+# rule id offset, rule id length, operation offset, operation length
+_INDEX_ENTRY = struct.Struct("<QIQI")
+# Rule ids that are decoded as they were published
+_RULE_ID_TYPES = (str, int, float, bool, type(None))
+
+
+def _encode(value) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def _read_generation(path: str) -> Optional[int]:
+    try:
+        with open(path, "rb") as f:
+            header = f.read(_HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(header) != _HEADER.size:
+        return None
+    magic, _, generation, _ = _HEADER.unpack(header)
+    return generation if magic == _MAGIC else None
+
+
+def publish(path: str, rules, generation: Optional[int] = None) -> int:
+    """
+    Writes rules (a dict or iterable of (rule_id, operation) pairs) to path. Rule ids
+    must be strings, numbers, booleans or None, which decode to the same value, and
+    operations JSON serializable. The file is written next to path and renamed over
+    it, so readers see either the old or the new rule set. Returns the new generation
+    """
+    if generation is None:
+        generation = (_read_generation(path) or 0) + 1
+    items = list(rules.items() if isinstance(rules, dict) else rules)
+
+    index = bytearray()
+    blob = bytearray()
+    offset = _HEADER.size + _INDEX_ENTRY.size * len(items)
+    for rule_id, json_operation in items:
+        if not isinstance(rule_id, _RULE_ID_TYPES):
+            # Tuples would decode as lists, which can't be dictionary keys
+            raise TypeError(
+                f"Rule ids must be strings, numbers, booleans or None. {rule_id!r}"
+            )
+        encoded_id = _encode(rule_id)
+        encoded_operation = _encode(json_operation)
+        index += _INDEX_ENTRY.pack(
+            offset,
+            len(encoded_id),
+            offset + len(encoded_id),
+            len(encoded_operation),
+        )
+        blob += encoded_id
+        blob += encoded_operation
+        offset += len(encoded_id) + len(encoded_operation)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temporary_path = tempfile.mkstemp(dir=directory, prefix=".json-operations-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, _FORMAT_VERSION, generation, len(items)))
+            f.write(index)
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.unlink(temporary_path)
+        raise
+    return generation
+
+
+class _MappedRules:
+    """
+    One published version of the rules. Stays usable after a newer version replaces
+    it, for as long as it is referenced
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, format_version, self.generation, self.count = _HEADER.unpack_from(
+            self.buffer
+        )
+        if magic != _MAGIC or format_version != _FORMAT_VERSION:
+            raise JsonOperationError(f"{path} is not a json operations rule store")
+
+        self._decoded: List[Optional[Tuple[object, List]]] = [None] * self.count
+        # Decoded operations share identical strings and lists
+        self._interner = Interner()
+        self._positions = None
+
+    def _entry(self, position: int) -> Tuple[object, List]:
+        decoded = self._decoded[position]
+        if decoded is not None:
+            return decoded
+
+        id_offset, id_length, offset, length = _INDEX_ENTRY.unpack_from(
+            self.buffer, _HEADER.size + position * _INDEX_ENTRY.size
+        )
+        entry = (
+            json.loads(self.buffer[id_offset : id_offset + id_length]),
+            self._interner.loads(self.buffer[offset : offset + length]),
+        )
+        self._decoded[position] = entry
+        return entry
+
+    def __iter__(self) -> Iterator[Tuple[object, List]]:
+        for position in range(self.count):
+            yield self._entry(position)
+
+    def position(self, rule_id) -> Optional[int]:
+        if self._positions is None:
+            positions = {}
+            for position in range(self.count):
+                id_offset, id_length, _, _ = _INDEX_ENTRY.unpack_from(
+                    self.buffer, _HEADER.size + position * _INDEX_ENTRY.size
+                )
+                positions[self.buffer[id_offset : id_offset + id_length]] = position
+            self._positions = positions
+        return self._positions.get(_encode(rule_id))
+
+
+class SharedRuleStore:
+    """
+    Attaches to rules published with publish(). Attaching maps the file without
+    reading it. Only the file is shared between processes: each operation is decoded
+    once per process, the first time it is used, and kept in that process's memory
+    (with identical strings and lists shared) until refresh() switches versions.
+
+    Call refresh() to pick up a newly published version. Iterations and evaluations
+    that already started keep using the version they started with.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._rules = _MappedRules(path)
+
+    @property
+    def generation(self) -> int:
+        return self._rules.generation
+
+    def refresh(self) -> bool:
+        """
+        Switches to the latest published version. Returns True if it changed
+        """
+        stat = os.stat(self.path)
+        if (stat.st_ino, stat.st_mtime_ns, stat.st_size) == self._rules.file_id:
+            return False
+        self._rules = _MappedRules(self.path)
+        return True
+
+    def __len__(self) -> int:
+        return self._rules.count
+
+    def __iter__(self) -> Iterator[Tuple[object, List]]:
+        return iter(self._rules)
+
+    def get(self, rule_id, default=None):
+        rules = self._rules
+        position = rules.position(rule_id)
+        return default if position is None else rules._entry(position)[1]
+
+    def execute(self, context) -> Dict[object, bool]:
+        return {
+            rule_id: execute(json_operation, context)
+            for rule_id, json_operation in self._rules
+        }
+
+    def matches(self, context) -> List:
+        return [
+            rule_id
+            for rule_id, json_operation in self._rules
+            if execute(json_operation, context)
+        ]
@@ -0,0 +1,155 @@
+"""
+Partial evaluation of json operations against the part of the context that is known
+ahead of time.
+"""
+from typing import Callable, Dict, FrozenSet, Iterable, List, Tuple
+
+from json_operations import (
+    NEVER_MATCH,
+    JsonOperationError,
+    _get_key,
+    _is_key_operation,
+    _nesting_operators,
+    _operators,
+    execute,
+)
+
+_UNKNOWN = object()
+
+
+def _lookup(known_context, key):
+    try:
+        return _get_key(known_context, key, _UNKNOWN)
+    except IndexError:
+        return _UNKNOWN
+
+
+def _can_inline(value) -> bool:
+    # A list value put in place of a key operation must still be read as a literal
+    if isinstance(value, list):
+        return bool(value) and not _is_key_operation(value)
+    return True
+
+
+def _is_key_child(json_operation) -> bool:
+    # Key operations directly under and/or pass their value (possibly NEVER_MATCH) on,
+    # everything else evaluates to a boolean
+    return isinstance(json_operation, list) and json_operation[:1] == ["key"]
+
+
+def _specialize(json_operation, known_context, lookup: Callable) -> Tuple[bool, object]:
+    # Returns whether the result is constant, and the constant or residual operation.
+    # lookup(arguments of a key operation) returns the value of the key, or _UNKNOWN
+    if not isinstance(json_operation, list):
+        return True, json_operation
+
+    operator, *unparsed = json_operation
+    if operator == "key":
+        value = lookup(unparsed) if unparsed else _UNKNOWN
+        return (False, json_operation) if value is _UNKNOWN else (True, value)
+
+    if operator not in _operators:
+        raise JsonOperationError(f"Invalid operator: {operator}. {json_operation}")
+
+    if operator in _nesting_operators:
+        constants = []
+        residuals = []
+        for val in unparsed:
+            constant, value = _specialize(val, known_context, lookup)
+            (constants if constant else residuals).append(value)
+
+        if NEVER_MATCH in constants:
+            return True, False
+        if operator == "and" and not all(constants):
+            return True, False
+        if operator == "or" and any(constants):
+            # Still False if a key is NEVER_MATCH
+            keys = [residual for residual in residuals if _is_key_child(residual)]
+            return (False, ["or", True, *keys]) if keys else (True, True)
+
+        if not residuals:
+            return True, operator == "and"
+        if len(residuals) == 1 and not _is_key_child(residuals[0]):
+            return False, residuals[0]
+        return False, [operator, *residuals]
+
+    residual = [operator]
+    unknown = False
+    for val in unparsed:
+        if _is_key_operation(val):
+            value = lookup(val[1:]) if len(val) > 1 else _UNKNOWN
+            if value is NEVER_MATCH:
+                return True, False
+            if value is _UNKNOWN:
+                unknown = True
+            elif _can_inline(value):
+                residual.append(value)
+                continue
+        residual.append(val)
+
+    if not unknown:
+        return True, execute(json_operation, known_context)
+    return False, residual
+
+
+def specialize(json_operation: List, known_context):
+    """
+    Evaluates everything in the operation that only depends on keys found in
+    known_context, and returns the remaining operation, or the result if nothing
+    remains. Executing the result against a context is the same as executing the
+    original operation, as long as the context has the same values for the known keys.
+    Operations that would raise an error may return a result instead
+    """
+    return _specialize(
+        json_operation,
+        known_context,
+        lambda arguments: _lookup(known_context, arguments[0]),
+    )[1]
+
+
+def _never_match_lookup(fields: FrozenSet[str]) -> Callable:
+    def lookup(arguments):
+        key = str(arguments[0])
+        parts = key.split(".")
+        # Keys under a NEVER_MATCH field resolve to their default
+        for end in range(1, len(parts)):
+            if ".".join(parts[:end]) in fields:
+                return arguments[1] if len(arguments) > 1 else None
+        return NEVER_MATCH if key in fields else _UNKNOWN
+
+    return lookup
+
+
+def _never_match_context(fields: FrozenSet[str]) -> Dict:
+    context = {}
+    for field in sorted(fields, key=lambda field: field.count(".")):
+        node = context
+        *parents, last = field.split(".")
+        for part in parents:
+            node = node.setdefault(part, {})
+            if node is NEVER_MATCH:
+                break
+        else:
+            node[last] = NEVER_MATCH
+    return context
+
+
+def _prune_never_match(json_operation, fields: FrozenSet[str]) -> Tuple[bool, object]:
+    """
+    Returns whether the result of the operation is constant when the fields are
+    NEVER_MATCH, and the constant or the operation left to evaluate
+    """
+    return _specialize(
+        json_operation, _never_match_context(fields), _never_match_lookup(fields)
+    )
+
+
+def prune_never_match(json_operation: List, fields: Iterable[str]):
+    """
+    Returns the operation with everything decided by the fields being NEVER_MATCH
+    evaluated, or the result if nothing remains. Executing the result against a
+    context is the same as executing the original operation against the context with
+    the fields set to NEVER_MATCH. Operations that would raise an error may return a
+    result instead
+    """
+    return _prune_never_match(json_operation, frozenset(str(f) for f in fields))[1]
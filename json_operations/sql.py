@@ -0,0 +1,575 @@
+"""
+Translates json operations into parameterized SQL WHERE clauses so rows can be
+filtered in the database instead of in python.
+"""
+import json
+from typing import Dict, List, Optional, Tuple
+
+from json_operations import (
+    JsonOperationError,
+    _between,
+    _is_key_operation,
+    _nesting_operators,
+    _operators,
+    execute,
+)
+
+_comparison_operators = {
+    "=": "=",
+    "==": "=",
+    "!=": "<>",
+    ">": ">",
+    ">=": ">=",
+    "<": "<",
+    "<=": "<=",
+}
+_reflected_operators = {
+    "=": "=",
+    "<>": "<>",
+    ">": "<",
+    ">=": "<=",
+    "<": ">",
+    "<=": ">=",
+}
+
+
+class _Value:
+    """
+    An SQL expression for an operand. For keys extracted from a JSON column, column
+    and path are set so the JSON type of the value can be inspected
+    """
+
+    def __init__(self, sql: str, params: List, column=None, path=None):
+        self.sql = sql
+        self.params = params
+        self.column = column
+        self.path = path
+
+    @property
+    def is_json(self) -> bool:
+        return self.column is not None
+
+
+class _Dialect:
+    placeholder = "?"
+    true = "TRUE"
+    false = "FALSE"
+
+    def json_value(self, column: str, parts: List[str]) -> _Value:
+        raise NotImplementedError
+
+    def literal(self, value, as_json: bool) -> Tuple[str, List]:
+        raise NotImplementedError
+
+    def is_null(self, value: _Value) -> Tuple[str, List]:
+        return f"{value.sql} IS NULL", value.params
+
+    def equals(self, left: _Value, right: _Value) -> Tuple[str, List]:
+        # Missing and null keys are equal, as they both resolve to None
+        return f"{left.sql} IS NOT DISTINCT FROM {right.sql}", [
+            *left.params,
+            *right.params,
+        ]
+
+    def truthy(self, value: _Value) -> Tuple[str, List]:
+        raise NotImplementedError
+
+    def text(self, value: _Value) -> str:
+        return value.sql
+
+    def instr(self, haystack: str, needle: str) -> str:
+        raise NotImplementedError
+
+    def contains(self, stack: _Value, needle) -> Tuple[str, List]:
+        raise NotImplementedError
+
+    def intersects(self, array: _Value, items: List) -> Tuple[str, List]:
+        raise NotImplementedError
+
+    def in_literals(self, needle: _Value, items: List) -> Tuple[str, List]:
+        # needle in a list of literals that are not null
+        if not items:
+            return self.false, []
+        literals = [self.literal(item, needle.is_json) for item in items]
+        placeholders = ", ".join(sql for sql, _ in literals)
+        return f"COALESCE({needle.sql} IN ({placeholders}), FALSE)", [
+            *needle.params,
+            *(param for _, params in literals for param in params),
+        ]
+
+
+def _is_scalar(value) -> bool:
+    return not isinstance(value, (list, dict))
+
+
+def _minified(value) -> str:
+    return json.dumps(value, separators=(",", ":"))
+
+
+class _SqliteDialect(_Dialect):
+    placeholder = "?"
+    # Key parts that are integers index arrays, and are keys of objects otherwise.
+    # Each one doubles the size of the path expression
+    max_index_parts = 4
+
+    def json_path(self, column: str, parts: List[str], path: str = "$"):
+        """
+        Returns the SQL expression of the JSON path of the parts, and its parameters.
+        Like _get_key, parts that are integers are array indexes or object keys
+        depending on the type of the value they are looked up in
+        """
+        for position, part in enumerate(parts):
+            if '"' in part:
+                raise JsonOperationError(f"Unsupported key part for SQLite: {part}")
+            if not part.lstrip("-").isdigit():
+                path += f'."{part}"'
+                continue
+            rest = parts[position + 1 :]
+            if sum(part.lstrip("-").isdigit() for part in rest) >= self.max_index_parts:
+                raise JsonOperationError(
+                    f"Too many integer key parts for SQLite: {'.'.join(parts)}"
+                )
+            index = int(part)
+            array_sql, array_params = self.json_path(
+                column, rest, path + (f"[#{index}]" if index < 0 else f"[{index}]")
+            )
+            object_sql, object_params = self.json_path(
+                column, rest, path + f'."{part}"'
+            )
+            sql = (
+                f"CASE json_type({column}, ?) WHEN 'array' THEN {array_sql} "
+                f"ELSE {object_sql} END"
+            )
+            return sql, [path, *array_params, *object_params]
+        return "?", [path]
+
+    def json_value(self, column: str, parts: List[str]) -> _Value:
+        path_sql, path_params = self.json_path(column, parts)
+        return _Value(
+            f"json_extract({column}, {path_sql})",
+            path_params,
+            column,
+            (path_sql, path_params),
+        )
+
+    def json_type(self, value: _Value) -> Tuple[str, List]:
+        path_sql, path_params = value.path
+        return f"json_type({value.column}, {path_sql})", path_params
+
+    def literal(self, value, as_json: bool) -> Tuple[str, List]:
+        if not _is_scalar(value):
+            # json_extract returns arrays and objects as minified JSON
+            return "json(?)", [_minified(value)]
+        return "?", [value]
+
+    def equals(self, left: _Value, right: _Value) -> Tuple[str, List]:
+        # json_extract returns NULL for both missing keys and JSON nulls
+        return f"{left.sql} IS {right.sql}", [*left.params, *right.params]
+
+    def truthy(self, value: _Value) -> Tuple[str, List]:
+        if not value.is_json:
+            # Plain columns can hold text, which SQLite converts to 0
+            sql = (
+                f"CASE typeof({value.sql}) "
+                f"WHEN 'integer' THEN {value.sql} <> 0 "
+                f"WHEN 'real' THEN {value.sql} <> 0 "
+                f"WHEN 'text' THEN {value.sql} <> '' "
+                f"WHEN 'blob' THEN length({value.sql}) > 0 "
+                "ELSE FALSE END"
+            )
+            return sql, value.params * 5
+        json_type, type_params = self.json_type(value)
+        path_sql, path_params = value.path
+        sql = (
+            f"COALESCE(CASE {json_type} "
+            "WHEN 'true' THEN TRUE "
+            f"WHEN 'integer' THEN {value.sql} <> 0 "
+            f"WHEN 'real' THEN {value.sql} <> 0 "
+            f"WHEN 'text' THEN {value.sql} <> '' "
+            f"WHEN 'array' THEN json_array_length({value.column}, {path_sql}) > 0 "
+            f"WHEN 'object' THEN {value.sql} <> '{{}}' "
+            "ELSE FALSE END, FALSE)"
+        )
+        return sql, [
+            *type_params,
+            *value.params,
+            *value.params,
+            *value.params,
+            *path_params,
+            *value.params,
+        ]
+
+    def instr(self, haystack: str, needle: str) -> str:
+        return f"instr({haystack}, {needle}) > 0"
+
+    def _element_is(self, item) -> Tuple[str, List]:
+        # Condition on the type and value columns of json_each. Arrays and objects
+        # are compared as minified JSON, and only with arrays and objects, since
+        # strings are returned as text too
+        if item is None:
+            return "type = 'null'", []
+        if _is_scalar(item):
+            return "type NOT IN ('array', 'object') AND value = ?", [item]
+        return "type IN ('array', 'object') AND value = json(?)", [_minified(item)]
+
+    def contains(self, stack: _Value, needle) -> Tuple[str, List]:
+        if not stack.is_json:
+            return self.instr(stack.sql, "?"), [*stack.params, needle]
+        json_type, type_params = self.json_type(stack)
+        path_sql, path_params = stack.path
+        element, element_params = self._element_is(needle)
+        # Only strings can be keys of objects or be in strings
+        if isinstance(needle, str):
+            has_key = f"EXISTS (SELECT 1 FROM json_each({stack.column}, {path_sql}) "
+            has_key += "WHERE key = ?)"
+            has_key_params = [*path_params, needle]
+            in_text = self.instr(stack.sql, "?")
+            in_text_params = [*stack.params, needle]
+        else:
+            has_key, has_key_params = self.false, []
+            in_text, in_text_params = "NULL", []
+        sql = (
+            f"CASE {json_type} "
+            f"WHEN 'array' THEN EXISTS (SELECT 1 FROM json_each({stack.column}, "
+            f"{path_sql}) WHERE {element}) "
+            f"WHEN 'object' THEN {has_key} "
+            f"WHEN 'text' THEN {in_text} END"
+        )
+        return sql, [
+            *type_params,
+            *path_params,
+            *element_params,
+            *has_key_params,
+            *in_text_params,
+        ]
+
+    def intersects(self, array: _Value, items: List) -> Tuple[str, List]:
+        if not items:
+            return self.false, []
+        path_sql, path_params = array.path
+        conditions = [self._element_is(item) for item in items]
+        sql = (
+            f"EXISTS (SELECT 1 FROM json_each({array.column}, {path_sql}) WHERE "
+            + " OR ".join(f"({condition})" for condition, _ in conditions)
+            + ")"
+        )
+        return sql, [*path_params, *(p for _, params in conditions for p in params)]
+
+    def in_literals(self, needle: _Value, items: List) -> Tuple[str, List]:
+        scalars = [item for item in items if _is_scalar(item)]
+        others = [_minified(item) for item in items if not _is_scalar(item)]
+        if not needle.is_json:
+            # Plain columns can't hold arrays or objects
+            return super().in_literals(needle, scalars)
+
+        json_type, type_params = self.json_type(needle)
+        clauses = []
+        params = []
+        if scalars:
+            placeholders = ", ".join("?" for _ in scalars)
+            clauses.append(
+                f"({json_type} NOT IN ('array', 'object') "
+                f"AND {needle.sql} IN ({placeholders}))"
+            )
+            params += [*type_params, *needle.params, *scalars]
+        if others:
+            placeholders = ", ".join("json(?)" for _ in others)
+            clauses.append(
+                f"({json_type} IN ('array', 'object') "
+                f"AND {needle.sql} IN ({placeholders}))"
+            )
+            params += [*type_params, *needle.params, *others]
+        if not clauses:
+            return self.false, []
+        return f"COALESCE({' OR '.join(clauses)}, FALSE)", params
+
+
+class _PostgresDialect(_Dialect):
+    placeholder = "%s"
+
+    def json_value(self, column: str, parts: List[str]) -> _Value:
+        # #> resolves path parts against both object keys and array indexes
+        return _Value(f"({column} #> %s::text[])", [parts], column, parts)
+
+    def literal(self, value, as_json: bool) -> Tuple[str, List]:
+        if as_json:
+            return "%s::jsonb", [json.dumps(value)]
+        return "%s", [value]
+
+    def is_null(self, value: _Value) -> Tuple[str, List]:
+        if not value.is_json:
+            return f"{value.sql} IS NULL", value.params
+        sql = f"({value.sql} IS NULL OR jsonb_typeof({value.sql}) = 'null')"
+        return sql, [*value.params, *value.params]
+
+    def equals(self, left: _Value, right: _Value) -> Tuple[str, List]:
+        # #> returns JSON nulls as 'null' and missing keys as NULL
+        sides = [
+            f"NULLIF({value.sql}, 'null'::jsonb)" if value.is_json else value.sql
+            for value in (left, right)
+        ]
+        return f"{sides[0]} IS NOT DISTINCT FROM {sides[1]}", [
+            *left.params,
+            *right.params,
+        ]
+
+    def truthy(self, value: _Value) -> Tuple[str, List]:
+        if not value.is_json:
+            return f"COALESCE({value.sql}, FALSE)", value.params
+        falsy = "'false'::jsonb, '0'::jsonb, '\"\"'::jsonb, '[]'::jsonb, '{}'::jsonb"
+        sql = (
+            f"COALESCE(jsonb_typeof({value.sql}) <> 'null' "
+            f"AND {value.sql} NOT IN ({falsy}), FALSE)"
+        )
+        return sql, [*value.params, *value.params]
+
+    def text(self, value: _Value) -> str:
+        if not value.is_json:
+            return value.sql
+        return f"({value.sql} #>> '{{}}')"
+
+    def instr(self, haystack: str, needle: str) -> str:
+        return f"strpos({haystack}, {needle}) > 0"
+
+    def contains(self, stack: _Value, needle) -> Tuple[str, List]:
+        if not stack.is_json:
+            return self.instr(stack.sql, "%s"), [*stack.params, needle]
+        # Only strings can be keys of objects
+        has_key = (
+            f"EXISTS (SELECT 1 FROM jsonb_object_keys({stack.sql}) AS k(key) "
+            "WHERE k.key = %s)"
+            if isinstance(needle, str)
+            else self.false
+        )
+        # Unlike @>, which also matches elements of nested arrays, only compares the
+        # elements of the array itself
+        sql = (
+            f"CASE jsonb_typeof({stack.sql}) "
+            "WHEN 'array' THEN EXISTS (SELECT 1 FROM "
+            f"jsonb_array_elements({stack.sql}) AS e(value) WHERE e.value = %s::jsonb) "
+            f"WHEN 'object' THEN {has_key} "
+            f"WHEN 'string' THEN {self.instr(self.text(stack), '%s')} END"
+        )
+        return sql, [
+            *stack.params,
+            *stack.params,
+            json.dumps(needle),
+            *([*stack.params, needle] if isinstance(needle, str) else []),
+            *stack.params,
+            needle,
+        ]
+
+    def intersects(self, array: _Value, items: List) -> Tuple[str, List]:
+        if not items:
+            return self.false, []
+        placeholders = ", ".join("%s::jsonb" for _ in items)
+        sql = (
+            f"EXISTS (SELECT 1 FROM jsonb_array_elements({array.sql}) AS e(value) "
+            f"WHERE e.value IN ({placeholders}))"
+        )
+        return sql, [*array.params, *(json.dumps(item) for item in items)]
+
+
+class _Unsupported(Exception):
+    pass
+
+
+_dialects = {
+    "sqlite": _SqliteDialect,
+    "postgres": _PostgresDialect,
+    "postgresql": _PostgresDialect,
+}
+
+
+class _Translator:
+    def __init__(self, dialect: _Dialect, key_mapping: Dict, json_column):
+        self.dialect = dialect
+        self.key_mapping = {str(key): column for key, column in key_mapping.items()}
+        self.json_column = json_column
+
+    def key(self, key) -> _Value:
+        key = str(key)
+        if key in self.key_mapping:
+            return _Value(self.key_mapping[key], [])
+
+        parts = key.split(".")
+        for index in range(len(parts) - 1, 0, -1):
+            prefix = ".".join(parts[:index])
+            if prefix in self.key_mapping:
+                return self.dialect.json_value(self.key_mapping[prefix], parts[index:])
+
+        if self.json_column is None:
+            raise JsonOperationError(f"No column for key {key}")
+        return self.dialect.json_value(self.json_column, parts)
+
+    def constant(self, value) -> Tuple[str, List]:
+        return (self.dialect.true if value else self.dialect.false), []
+
+    def condition(self, json_operation) -> Tuple[str, List]:
+        if not isinstance(json_operation, list):
+            return self.constant(json_operation)
+
+        operator, *unparsed = json_operation
+        if operator in _nesting_operators:
+            if not unparsed:
+                return self.constant(operator == "and")
+            clauses = [self.condition(val) for val in unparsed]
+            joiner = " AND " if operator == "and" else " OR "
+            sql = joiner.join(clause for clause, _ in clauses)
+            return f"({sql})", [param for _, params in clauses for param in params]
+
+        if operator == "key":
+            if len(unparsed) != 1:
+                raise JsonOperationError(
+                    f"Key defaults are not supported in SQL. {json_operation}"
+                )
+            return self.dialect.truthy(self.key(unparsed[0]))
+
+        if operator not in _operators:
+            raise JsonOperationError(f"Invalid operator: {operator}. {json_operation}")
+
+        if not any(_is_key_operation(val) for val in unparsed):
+            # Nothing depends on the row
+            return self.constant(execute(json_operation, {}))
+
+        try:
+            return self.operation(operator, unparsed)
+        except _Unsupported:
+            raise JsonOperationError(
+                f"Operation cannot be translated to SQL. {json_operation}"
+            )
+
+    def operand(self, val):
+        if _is_key_operation(val):
+            return self.key(val[1])
+        return None
+
+    def operation(self, operator, unparsed) -> Tuple[str, List]:
+        operands = [self.operand(val) for val in unparsed]
+
+        if operator in {"null", "!null"} and len(operands) == 1:
+            sql, params = self.dialect.is_null(operands[0])
+            return (sql if operator == "null" else f"NOT ({sql})"), params
+
+        if len(operands) != 2:
+            raise _Unsupported()
+        left, right = operands
+
+        if operator in _comparison_operators:
+            comparison = _comparison_operators[operator]
+            if left is None:
+                left, right = right, left
+                unparsed = unparsed[::-1]
+                comparison = _reflected_operators[comparison]
+            if right is not None:
+                if comparison in {"=", "<>"}:
+                    sql, params = self.dialect.equals(left, right)
+                    return (sql if comparison == "=" else f"NOT ({sql})"), params
+                return f"{left.sql} {comparison} {right.sql}", [
+                    *left.params,
+                    *right.params,
+                ]
+            literal = unparsed[1]
+            if literal is None:
+                if comparison not in {"=", "<>"}:
+                    raise JsonOperationError(
+                        f"'{operator}' not supported with null. {[operator, *unparsed]}"
+                    )
+                sql, params = self.dialect.is_null(left)
+                return (sql if comparison == "=" else f"NOT ({sql})"), params
+            literal_sql, params = self.dialect.literal(literal, left.is_json)
+            return f"{left.sql} {comparison} {literal_sql}", [*left.params, *params]
+
+        if operator in {"in", "nin", "!in"}:
+            if left is not None and right is None:
+                sql, params = self.membership(left, unparsed[1])
+            elif left is None and right is not None:
+                if not right.is_json and not isinstance(unparsed[0], str):
+                    raise _Unsupported()
+                sql, params = self.dialect.contains(right, unparsed[0])
+                sql = f"COALESCE({sql}, FALSE)"
+            else:
+                raise _Unsupported()
+            return (sql if operator == "in" else f"NOT ({sql})"), params
+
+        if operator == "btw" and left is not None and right is None:
+            try:
+                _between(0, unparsed[1])
+            except TypeError as e:
+                raise JsonOperationError(f"{e}. {[operator, *unparsed]}")
+            low, low_params = self.dialect.literal(unparsed[1][0], left.is_json)
+            high, high_params = self.dialect.literal(unparsed[1][1], left.is_json)
+            return f"{left.sql} BETWEEN {low} AND {high}", [
+                *left.params,
+                *low_params,
+                *high_params,
+            ]
+
+        if operator in {"&", "!&"}:
+            if left is None:
+                left, right = right, left
+                unparsed = unparsed[::-1]
+            if (
+                right is not None
+                or not left.is_json
+                or not isinstance(unparsed[1], list)
+            ):
+                raise _Unsupported()
+            if not all(_is_scalar(item) for item in unparsed[1]):
+                # Arrays and objects can't be in the sets that execute() intersects
+                raise JsonOperationError(
+                    f"Unhashable items in '{operator}'. {[operator, *unparsed]}"
+                )
+            sql, params = self.dialect.intersects(left, unparsed[1])
+            return (sql if operator == "&" else f"NOT ({sql})"), params
+
+        raise _Unsupported()
+
+    def membership(self, needle: _Value, stack) -> Tuple[str, List]:
+        # needle in a literal list. A missing needle is in the list only if the list
+        # contains null
+        if isinstance(stack, str):
+            instr = self.dialect.instr(
+                self.dialect.placeholder, self.dialect.text(needle)
+            )
+            return f"COALESCE({instr}, FALSE)", [stack, *needle.params]
+        if not isinstance(stack, list):
+            raise _Unsupported()
+
+        items = [item for item in stack if item is not None]
+        clauses = []
+        params = []
+        if items:
+            sql, params = self.dialect.in_literals(needle, items)
+            clauses.append(sql)
+        if None in stack:
+            sql, null_params = self.dialect.is_null(needle)
+            clauses.append(sql)
+            params += null_params
+        if not clauses:
+            return self.constant(False)
+        return f"({' OR '.join(clauses)})", params
+
+
+def to_sql(
+    json_operation: List,
+    dialect: str = "sqlite",
+    key_mapping: Optional[Dict] = None,
+    json_column: Optional[str] = None,
+) -> Tuple[str, List]:
+    """
+    Translates json operations into an SQL WHERE clause and its parameters.
+
+    key_mapping maps keys to SQL column expressions. A key that is not mapped is
+    extracted with JSON path functions, from the column mapped to its longest prefix
+    or else from json_column. Column expressions are inserted into the SQL as is, so
+    they must not come from untrusted input. Literals are always passed as parameters
+
+    With SQLite, arrays and objects are compared as minified JSON text, so their
+    keys must be in the same order and their numbers formatted the same way. Integer
+    key parts index arrays and are keys of objects, but do not index strings
+    """
+    if dialect not in _dialects:
+        raise JsonOperationError(f"Unsupported dialect: {dialect}")
+    translator = _Translator(_dialects[dialect](), key_mapping or {}, json_column)
+    return translator.condition(json_operation)
@@ -0,0 +1,418 @@
+"""
+Vectorized evaluation of json operations over pandas DataFrames and PyArrow tables.
+
+Install the pandas or arrow extra to use it:
+    pip install json-operations[pandas]
+    pip install json-operations[arrow]
+"""
+from typing import List
+
+from json_operations import (
+    JsonOperationError,
+    _between,
+    _execute_operation,
+    _get_key,
+    _is_key_operation,
+    _is_number,
+    _nesting_operators,
+    _operators,
+    execute,
+)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+try:
+    import pandas as pd
+except ImportError:  # pragma: no cover
+    pd = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pragma: no cover
+    pa = None
+    pc = None
+
+
+_comparison_operators = {"=", "==", "!=", ">", ">=", "<", "<="}
+_ordering_operators = {">", ">=", "<", "<="}
+_reflected_operators = {
+    "=": "=",
+    "==": "==",
+    "!=": "!=",
+    ">": "<",
+    ">=": "<=",
+    "<": ">",
+    "<=": ">=",
+}
+_membership_operators = {"in", "nin", "!in"}
+
+
+def _kind(value):
+    # Values of the same kind never raise a type error when compared
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "boolean"
+    if _is_number(value):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    return "object"
+
+
+class _Column:
+    """
+    A key resolved against every row of a table. values is the native (numpy or
+    arrow) array and is only set for kinds that can be evaluated vectorized
+    """
+
+    def __init__(self, kind: str, nulls, values=None, python_values=None):
+        self.kind = kind
+        self.nulls = nulls
+        self.any_null = bool(nulls.any())
+        self.all_null = bool(nulls.all())
+        self.values = values
+        self._python_values = python_values
+        self._to_python = None
+
+    def python(self) -> List:
+        if self._python_values is None:
+            self._python_values = self._to_python()
+        return self._python_values
+
+
+def _python_column(python_values: List) -> _Column:
+    kinds = {_kind(value) for value in python_values}
+    nulls = np.array([value is None for value in python_values], dtype=bool)
+    kinds.discard("null")
+    kind = kinds.pop() if len(kinds) == 1 else ("null" if not kinds else "object")
+    # Object arrays compare element-wise with python semantics
+    values = np.array(python_values, dtype=object) if kind != "object" else None
+    return _Column(kind, nulls, values=values, python_values=python_values)
+
+
+class _TableEvaluator:
+    def __init__(self, table):
+        self.table = table
+        self._columns = {}
+
+    def column(self, key) -> _Column:
+        key = str(key)
+        if key not in self._columns:
+            self._columns[key] = self._column(key)
+        return self._columns[key]
+
+    def _missing(self) -> _Column:
+        return _python_column([None] * self.length)
+
+    def evaluate(self, json_operation):
+        # Returns the truthiness of the operation for every row
+        if not isinstance(json_operation, list):
+            return np.full(self.length, bool(json_operation))
+
+        operator, *unparsed = json_operation
+        if operator in _nesting_operators:
+            masks = [self.evaluate(val) for val in unparsed]
+            reduce = np.logical_and if operator == "and" else np.logical_or
+            if not masks:
+                return np.full(self.length, operator == "and")
+            return reduce.reduce(masks)
+
+        if operator == "key":
+            default = unparsed[1] if len(unparsed) > 1 else None
+            return np.array(
+                [
+                    bool(default if value is None else value)
+                    for value in self.column(unparsed[0]).python()
+                ],
+                dtype=bool,
+            )
+
+        if operator not in _operators:
+            raise JsonOperationError(f"Invalid operator: {operator}. {json_operation}")
+
+        return self._operation(json_operation)
+
+    def _operation(self, json_operation):
+        operator, *unparsed = json_operation
+        keys = [_is_key_operation(val) for val in unparsed]
+        if not any(keys):
+            # Nothing depends on the row, so evaluate it once
+            return np.full(self.length, bool(execute(json_operation, {})))
+
+        mask = None
+        if len(unparsed) == 1:
+            mask = self._unary(operator, self.column(unparsed[0][1]))
+        elif len(unparsed) == 2 and keys.count(True) == 1:
+            key_index = keys.index(True)
+            column = self.column(unparsed[key_index][1])
+            literal = unparsed[1 - key_index]
+            if operator in _comparison_operators:
+                if key_index == 1:
+                    operator = _reflected_operators[operator]
+                mask = self._comparison(operator, column, literal)
+            elif key_index == 0 and operator in _membership_operators:
+                mask = self._membership(operator, column, literal)
+            elif key_index == 0 and operator == "btw":
+                mask = self._between(column, literal)
+
+        if mask is None:
+            return self._row_wise(json_operation)
+        return mask
+
+    def _unary(self, operator, column: _Column):
+        if operator == "null":
+            return column.nulls.copy()
+        if operator == "!null":
+            return ~column.nulls
+        return None
+
+    def _comparison(self, operator, column: _Column, literal):
+        # Returning None falls back to row by row evaluation, which also raises the
+        # same errors execute() would
+        literal_kind = _kind(literal)
+        if column.kind == "object" or literal_kind == "object":
+            return None
+
+        if literal_kind == "null":
+            if operator in _ordering_operators or not column.all_null:
+                return None
+            return np.full(self.length, operator != "!=")
+
+        if column.any_null or (column.kind != literal_kind and self.length):
+            return None
+        if not self.length:
+            return np.zeros(0, dtype=bool)
+        return self._compare(operator, column, literal)
+
+    def _membership(self, operator, column: _Column, literal):
+        if not isinstance(literal, list) or column.kind == "object":
+            return None
+
+        mask = column.nulls & (None in literal)
+        items = [item for item in literal if item is not None]
+        if items and not column.all_null:
+            if any(_kind(item) != column.kind for item in items):
+                return None
+            in_items = self._is_in(column, items)
+            if in_items is None:
+                return None
+            mask = mask | (in_items & ~column.nulls)
+        return mask if operator == "in" else ~mask
+
+    def _between(self, column: _Column, literal):
+        try:
+            # Validates the range the same way execute() does
+            _between(0, literal)
+        except TypeError:
+            return None
+        if self.length and (column.kind != "number" or column.any_null):
+            return None
+        low = self._compare(">=", column, literal[0])
+        high = self._compare("<=", column, literal[1])
+        return low & high
+
+    def _row_wise(self, json_operation):
+        operator, *unparsed = json_operation
+        columns = [
+            self.column(val[1]).python() if _is_key_operation(val) else None
+            for val in unparsed
+        ]
+        mask = np.zeros(self.length, dtype=bool)
+        for row in range(self.length):
+            values = [
+                val if column is None else column[row]
+                for val, column in zip(unparsed, columns)
+            ]
+            try:
+                mask[row] = bool(_execute_operation(operator, values))
+            except TypeError as e:
+                raise JsonOperationError(f"{e}. {json_operation}")
+        return mask
+
+
+_numpy_comparisons = {
+    "=": lambda a, b: a == b,
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+}
+
+
+class _PandasEvaluator(_TableEvaluator):
+    def __init__(self, table):
+        super().__init__(table)
+        self.length = len(table)
+
+    def _column(self, key) -> _Column:
+        if key in self.table.columns:
+            return self._series_column(self.table[key])
+
+        # Nested values stored as dicts or lists in a column
+        parts = key.split(".")
+        for index in range(len(parts) - 1, 0, -1):
+            prefix = ".".join(parts[:index])
+            if prefix in self.table.columns:
+                rest = ".".join(parts[index:])
+                return _python_column(
+                    [
+                        _get_key(value, rest)
+                        for value in self._series_column(self.table[prefix]).python()
+                    ]
+                )
+        return self._missing()
+
+    def _series_column(self, series) -> _Column:
+        nulls = series.isna().to_numpy(dtype=bool)
+        api = pd.api.types
+        if api.is_bool_dtype(series.dtype):
+            kind = "boolean"
+        elif api.is_numeric_dtype(series.dtype):
+            kind = "number"
+        else:
+            kind = {
+                "string": "string",
+                "boolean": "boolean",
+                "integer": "number",
+                "floating": "number",
+                "mixed-integer-float": "number",
+                "empty": "null",
+            }.get(api.infer_dtype(series, skipna=True), "object")
+
+        column = _Column(
+            kind, nulls, values=series.to_numpy() if kind != "object" else None
+        )
+        column._to_python = lambda: [
+            None if null else value for value, null in zip(series.tolist(), nulls)
+        ]
+        return column
+
+    def _compare(self, operator, column: _Column, literal):
+        return np.asarray(
+            _numpy_comparisons[operator](column.values, literal), dtype=bool
+        )
+
+    def _is_in(self, column: _Column, items):
+        return pd.Series(column.values).isin(items).to_numpy(dtype=bool)
+
+
+_arrow_comparisons = {
+    "=": "equal",
+    "==": "equal",
+    "!=": "not_equal",
+    ">": "greater",
+    ">=": "greater_equal",
+    "<": "less",
+    "<=": "less_equal",
+}
+
+
+class _ArrowEvaluator(_TableEvaluator):
+    def __init__(self, table):
+        super().__init__(table)
+        self.length = table.num_rows
+
+    def _column(self, key) -> _Column:
+        if key in self.table.column_names:
+            return self._array_column(self.table.column(key))
+
+        # Nested values, in the column named after the longest prefix of the key
+        parts = key.split(".")
+        for index in range(len(parts) - 1, 0, -1):
+            prefix = ".".join(parts[:index])
+            if prefix in self.table.column_names:
+                return self._nested(self.table.column(prefix), parts[index:])
+        return self._missing()
+
+    def _nested(self, array, parts: List[str]) -> _Column:
+        array = self._combine(array)
+        for index, part in enumerate(parts):
+            if not pa.types.is_struct(array.type):
+                # Lists, maps, etc are resolved per row
+                rest = ".".join(parts[index:])
+                return _python_column(
+                    [_get_key(value, rest) for value in array.to_pylist()]
+                )
+            field_index = array.type.get_field_index(part)
+            if field_index < 0:
+                return self._missing()
+            # flatten() applies the struct's nulls to its fields
+            array = array.flatten()[field_index]
+        return self._array_column(array)
+
+    def _combine(self, array):
+        if isinstance(array, pa.ChunkedArray):
+            return array.combine_chunks()
+        return array
+
+    def _array_column(self, array) -> _Column:
+        array = self._combine(array)
+        array_type = array.type
+        if pa.types.is_boolean(array_type):
+            kind = "boolean"
+        elif pa.types.is_integer(array_type) or pa.types.is_floating(array_type):
+            kind = "number"
+        elif pa.types.is_string(array_type) or pa.types.is_large_string(array_type):
+            kind = "string"
+        elif pa.types.is_null(array_type):
+            kind = "null"
+        else:
+            kind = "object"
+
+        nulls = pc.is_null(array).to_numpy(zero_copy_only=False)
+        column = _Column(kind, nulls, values=array if kind != "object" else None)
+        column._to_python = array.to_pylist
+        return column
+
+    def _compare(self, operator, column: _Column, literal):
+        result = getattr(pc, _arrow_comparisons[operator])(column.values, literal)
+        return result.to_numpy(zero_copy_only=False)
+
+    def _is_in(self, column: _Column, items):
+        try:
+            value_set = pa.array(items, type=column.values.type)
+        except (pa.ArrowException, TypeError, ValueError, OverflowError):
+            # e.g. floats looked up in an integer column
+            return None
+        return pc.is_in(column.values, value_set=value_set).to_numpy(
+            zero_copy_only=False
+        )
+
+
+def _evaluator(table) -> _TableEvaluator:
+    if pd is not None and isinstance(table, pd.DataFrame):
+        return _PandasEvaluator(table)
+    if pa is not None and isinstance(table, (pa.Table, pa.RecordBatch)):
+        return _ArrowEvaluator(table)
+    raise JsonOperationError(
+        f"Unsupported table type {type(table).__name__}. "
+        "Install the pandas or arrow extra to evaluate tables"
+    )
+
+
+def execute_table(json_operation: List, table, filter: bool = False):
+    """
+    Runs the json operations against every row of a pandas DataFrame or PyArrow
+    Table. Keys map onto columns named with the full dotted key, or onto fields of
+    nested struct (arrow) or dict (pandas) columns. Missing columns and nulls behave
+    like keys missing from the context.
+
+    Returns a boolean mask (a Series for pandas, a BooleanArray for arrow) or, with
+    filter=True, the matching rows
+    """
+    evaluator = _evaluator(table)
+    mask = evaluator.evaluate(json_operation)
+
+    if isinstance(evaluator, _PandasEvaluator):
+        mask = pd.Series(mask, index=table.index, dtype=bool)
+        return table[mask] if filter else mask
+
+    mask = pa.array(mask, type=pa.bool_())
+    return table.filter(mask) if filter else mask
@@ -0,0 +1,135 @@
+"""
+Sampled tracing of live evaluations: node level values and timings for a fraction of
+evaluations (or only the slow ones), kept in a bounded ring buffer.
+"""
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from json_operations import JsonOperationError, _execute_base, execute
+
+
+class _Sampling:
+    __slots__ = ("every", "slow_threshold", "counter")
+
+    def __init__(self, every: Optional[int], slow_threshold: Optional[float]):
+        self.every = every
+        self.slow_threshold = slow_threshold
+        self.counter = itertools.count()
+
+
+def _is_descendant(path: str, ancestor: str) -> bool:
+    return not ancestor or path.startswith(ancestor + ".")
+
+
+def _execute_traced(json_operation, context, nodes: List[Dict]):
+    # Adds the nodes evaluated to nodes, even if the evaluation fails. The handler is
+    # called after each node is evaluated, children before their parent, so a node's
+    # evaluation started when the record before its first descendant was taken
+    clock = time.perf_counter
+    records = []
+
+    def handler(value, prefix):
+        records.append((prefix, value, clock()))
+        return value
+
+    started = clock()
+    try:
+        return _execute_base(json_operation, context, handler)
+    except RecursionError:
+        raise JsonOperationError("Operation is nested too deeply")
+    finally:
+        pending = []
+        previous = started
+        for path, value, ended in records:
+            start = previous
+            while pending and _is_descendant(pending[-1][0], path):
+                start = pending.pop()[1]
+            pending.append((path, start))
+            nodes.append({"path": path, "value": value, "duration": ended - start})
+            previous = ended
+
+
+class Tracer:
+    """
+    Evaluates json operations like execute(), tracing one in `every` evaluations
+    and/or the evaluations slower than slow_threshold seconds. Slow evaluations are evaluated
+    again to trace them. The latest capacity traces are kept.
+
+    Sampling can be set for each rule with configure(); other rules use the settings
+    the tracer was created with
+    """
+
+    def __init__(
+        self,
+        every: Optional[int] = None,
+        slow_threshold: Optional[float] = None,
+        capacity: int = 1000,
+        include_context: bool = False,
+    ):
+        self.include_context = include_context
+        self._default = _Sampling(every, slow_threshold)
+        self._rules: Dict[object, _Sampling] = {}
+        self._traces = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def configure(
+        self, rule, every: Optional[int] = None, slow_threshold: Optional[float] = None
+    ):
+        self._rules[rule] = _Sampling(every, slow_threshold)
+
+    def execute(self, json_operation: List, context, rule=None):
+        sampling = self._rules.get(rule, self._default)
+        if sampling.every and next(sampling.counter) % sampling.every == 0:
+            return self._trace(json_operation, context, rule, "sampled")
+        if sampling.slow_threshold is None:
+            return execute(json_operation, context)
+
+        started = time.perf_counter()
+        result = execute(json_operation, context)
+        duration = time.perf_counter() - started
+        if duration >= sampling.slow_threshold:
+            self._trace(json_operation, context, rule, "slow", duration)
+        return result
+
+    def _trace(self, json_operation, context, rule, reason, duration=None):
+        trace = {
+            "rule": rule,
+            "reason": reason,
+            "timestamp": time.time(),
+            "operation": json_operation,
+            "nodes": [],
+        }
+        if self.include_context:
+            trace["context"] = context
+
+        started = time.perf_counter()
+        try:
+            trace["result"] = _execute_traced(json_operation, context, trace["nodes"])
+        except JsonOperationError as e:
+            trace["error"] = str(e)
+            raise
+        finally:
+            trace["duration"] = (
+                time.perf_counter() - started if duration is None else duration
+            )
+            with self._lock:
+                self._traces.append(trace)
+        return trace["result"]
+
+    def traces(self) -> List[Dict]:
+        with self._lock:
+            return list(self._traces)
+
+    def clear(self):
+        with self._lock:
+            self._traces.clear()
+
+    def export(self) -> str:
+        """
+        The traces as JSON. Values that can't be serialized are exported with repr()
+        """
+        return json.dumps(self.traces(), default=repr)
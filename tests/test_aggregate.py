@@ -0,0 +1,74 @@
+import multiprocessing
+from unittest import TestCase
+
+from json_operations import NEVER_MATCH, execute_debug
+from json_operations.aggregate import Aggregator
+
+RULES = {
+    "adult_us": [
+        "and",
+        [">=", ["key", "age"], 18],
+        ["==", ["key", "country"], "US"],
+    ],
+    "flagged": ["or", ["key", "flagged"], ["in", "vip", ["key", "tags"]]],
+}
+
+CONTEXTS = [
+    dict(age=20, country="US", flagged=False, tags=["vip"]),
+    dict(age=10, country="US", flagged=True, tags=[]),
+    dict(age=30, country="CA", tags=["x"]),
+    dict(age=40, country=NEVER_MATCH, flagged=NEVER_MATCH, tags=[]),
+    dict(country="US", tags=[]),
+]
+
+
+def _aggregate(chunk):
+    # NEVER_MATCH can't be pickled, so the contexts are not sent to the workers
+    start, end = chunk
+    return Aggregator(RULES).consume(CONTEXTS[start:end])
+
+
+class TestAggregator(TestCase):
+    def test_summary(self):
+        summary = Aggregator(RULES).consume(CONTEXTS).summary()
+
+        adult_us = summary["adult_us"]
+        self.assertEqual(
+            (adult_us["events"], adult_us["matched"], adult_us["errors"]), (5, 1, 1)
+        )
+        self.assertEqual(
+            adult_us["nodes"]["0"],
+            dict(true=3, false=1, missing_key=0, never_match=0),
+        )
+        self.assertEqual(
+            adult_us["nodes"]["1"],
+            dict(true=2, false=2, missing_key=0, never_match=1),
+        )
+
+        flagged = summary["flagged"]
+        self.assertEqual((flagged["events"], flagged["matched"]), (5, 2))
+        self.assertEqual(
+            flagged["nodes"][""],
+            dict(true=2, false=3, missing_key=2, never_match=1),
+        )
+
+    def test_paths_match_execute_debug(self):
+        summary = Aggregator(RULES).consume(CONTEXTS[:1]).summary()
+        for rule_id, json_operation in RULES.items():
+            self.assertEqual(
+                set(summary[rule_id]["nodes"]),
+                set(execute_debug(json_operation, CONTEXTS[0])),
+            )
+
+    def test_merge_across_processes(self):
+        chunks = [(0, 2), (2, len(CONTEXTS))]
+        with multiprocessing.Pool(2) as pool:
+            aggregators = pool.map(_aggregate, chunks)
+        merged = aggregators[0].merge(aggregators[1])
+        self.assertEqual(
+            merged.summary(), Aggregator(RULES).consume(CONTEXTS).summary()
+        )
+
+    def test_merge_different_rules(self):
+        with self.assertRaises(ValueError):
+            Aggregator(RULES).merge(Aggregator({"other": ["key", "a"]}))
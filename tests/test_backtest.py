@@ -0,0 +1,102 @@
+import json
+import os
+import tempfile
+from unittest import TestCase, skipIf
+
+from parameterized import parameterized
+
+from json_operations import JsonOperationError, execute
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+if pa is not None:
+    from json_operations.backtest import Archive, convert
+
+CONTEXTS = [
+    dict(age=31, user=dict(country="US", score=1.5), tags=["a", "b"], code=1),
+    dict(age=17, user=dict(country="FR", score=None), tags=["c"], code="1"),
+    dict(age=45, user=dict(country="US", score=3), tags=[], code=[1]),
+    dict(age=30.5, user=dict(country="DE"), tags=["a"], code=None),
+    dict(age=12, user=dict(country="GB"), tags=["z"], flag=True, items=[dict(price=2)]),
+]
+
+OPERATIONS = {
+    "adult": [">=", ["key", "age"], 18],
+    "us": ["==", ["key", "user.country"], "US"],
+    "eu": ["in", ["key", "user.country"], ["FR", "DE"]],
+    "scored": ["!null", ["key", "user.score"]],
+    "tagged": ["&", ["key", "tags"], ["a"]],
+    "code": ["in", ["key", "code"], [1, "1"]],
+    "flag": ["key", "flag"],
+    "price": ["null", ["key", "items.0.price"]],
+    "both": ["and", [">", ["key", "age"], 20], ["key", "tags"]],
+}
+
+
+@skipIf(pa is None, "pyarrow is not installed")
+class TestBacktest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.source = os.path.join(directory.name, "contexts.jsonl")
+        self.path = os.path.join(directory.name, "contexts.arrow")
+        with open(self.source, "w") as f:
+            for context in CONTEXTS:
+                f.write(json.dumps(context) + "\n\n")
+
+    def _archive(self, operations, **kwargs) -> "Archive":
+        self.assertEqual(
+            convert(self.source, self.path, operations, **kwargs), len(CONTEXTS)
+        )
+        archive = Archive(self.path)
+        self.addCleanup(archive.close)
+        return archive
+
+    @parameterized.expand([(batch_size,) for batch_size in (1, 2, 100)])
+    def test_same_results_as_execute(self, batch_size):
+        archive = self._archive(OPERATIONS.values(), batch_size=batch_size)
+        self.assertEqual(len(archive), len(CONTEXTS))
+        for operation in OPERATIONS.values():
+            self.assertEqual(
+                archive.evaluate(operation).tolist(),
+                [bool(execute(operation, context)) for context in CONTEXTS],
+                operation,
+            )
+
+    def test_only_keys_used(self):
+        archive = self._archive([OPERATIONS["us"]], keys=["age"])
+        self.assertEqual(archive.keys, ["user.country", "age"])
+        self.assertEqual(str(archive.schema.field("age").type), "double")
+        with self.assertRaisesRegex(JsonOperationError, "not in the archive"):
+            archive.evaluate(OPERATIONS["tagged"])
+
+    def test_backtest(self):
+        archive = self._archive(OPERATIONS.values())
+        results = archive.backtest(
+            {"us": OPERATIONS["us"], "adult": OPERATIONS["adult"]},
+            baseline=OPERATIONS["us"],
+        )
+        self.assertEqual(results["us"].matches, 2)
+        self.assertEqual((results["us"].added, results["us"].removed), (0, 0))
+        self.assertEqual(results["adult"].matches, 3)
+        self.assertEqual(results["adult"].added_rows.tolist(), [3])
+        self.assertEqual(results["adult"].removed_rows.tolist(), [])
+
+        results = archive.backtest({"us": OPERATIONS["us"]})
+        self.assertEqual(results["us"].matches, 2)
+        self.assertIsNone(results["us"].added)
+
+    def test_errors(self):
+        archive = self._archive([[">", ["key", "user.country"], 1]])
+        with self.assertRaisesRegex(JsonOperationError, "'>' not supported"):
+            archive.evaluate([">", ["key", "user.country"], 1])
+
+    def test_empty(self):
+        open(self.source, "w").close()
+        self.assertEqual(convert(self.source, self.path, OPERATIONS.values()), 0)
+        with Archive(self.path) as archive:
+            self.assertEqual(len(archive), 0)
+            self.assertEqual(archive.backtest(OPERATIONS)["us"].matches, 0)
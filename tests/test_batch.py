@@ -0,0 +1,64 @@
+import threading
+from unittest import TestCase
+
+from json_operations import JsonOperationError, execute, execute_debug, get_keys
+from json_operations.batch import ThreadPoolEvaluator, execute_batch
+from json_operations.bitset import Bitset
+
+OPERATION = ["and", [">", ["key", "a"], 10], ["in", ["key", "b"], ["x", "y"]]]
+CONTEXTS = [dict(a=a, b="xyz"[a % 3]) for a in range(1000)]
+
+
+class TestThreadPoolEvaluator(TestCase):
+    def setUp(self):
+        self.evaluator = ThreadPoolEvaluator(max_workers=4, chunk_size=64)
+        self.addCleanup(self.evaluator.close)
+
+    def test_execute_batch(self):
+        expected = execute_batch(OPERATION, CONTEXTS)
+        self.assertEqual(self.evaluator.execute_batch(OPERATION, CONTEXTS), expected)
+        self.assertEqual(
+            self.evaluator.execute_batch(OPERATION, iter(CONTEXTS), bitset=True),
+            Bitset.from_bools(expected),
+        )
+        self.assertEqual(self.evaluator.execute_batch(OPERATION, []), [])
+
+    def test_execute_rules(self):
+        rules = {"a": OPERATION, "b": ["==", ["key", "b"], "z"]}
+        self.assertEqual(
+            self.evaluator.execute_rules(rules, CONTEXTS),
+            [
+                {rule_id: execute(rule, context) for rule_id, rule in rules.items()}
+                for context in CONTEXTS
+            ],
+        )
+
+    def test_errors(self):
+        with self.assertRaisesRegex(JsonOperationError, "'>' not supported"):
+            self.evaluator.execute_batch(OPERATION, CONTEXTS + [dict(a="x")])
+
+
+class TestThreadSafety(TestCase):
+    def test_concurrent_calls(self):
+        expected = (
+            [execute(OPERATION, context) for context in CONTEXTS],
+            execute_debug(OPERATION, CONTEXTS[20]),
+            get_keys(OPERATION),
+        )
+        results = []
+
+        def run():
+            results.append(
+                (
+                    [execute(OPERATION, context) for context in CONTEXTS],
+                    execute_debug(OPERATION, CONTEXTS[20]),
+                    get_keys(OPERATION),
+                )
+            )
+
+        threads = [threading.Thread(target=run) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [expected] * 8)
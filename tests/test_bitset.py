@@ -0,0 +1,90 @@
+from unittest import TestCase, skipIf
+
+from parameterized import parameterized
+
+from json_operations import execute
+from json_operations.batch import execute_batch
+from json_operations.bitset import Bitset
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class TestBitset(TestCase):
+    @parameterized.expand([(0,), (1,), (7,), (8,), (9,), (100,)])
+    def test_from_bools(self, length):
+        values = [index % 3 == 0 for index in range(length)]
+        bitset = Bitset.from_bools(values)
+        self.assertEqual(len(bitset), length)
+        self.assertEqual(bitset.to_bools(), values)
+        self.assertEqual(list(bitset), [i for i, value in enumerate(values) if value])
+        self.assertEqual(bitset.count(), sum(values))
+
+    def test_algebra(self):
+        a = Bitset.from_indexes([0, 2, 4, 9], 10)
+        b = Bitset.from_indexes([2, 3, 9], 10)
+        self.assertEqual(list(a & b), [2, 9])
+        self.assertEqual(list(a | b), [0, 2, 3, 4, 9])
+        self.assertEqual(list(a ^ b), [0, 3, 4])
+        self.assertEqual(list(a - b), [0, 4])
+        self.assertEqual(list(~a), [1, 3, 5, 6, 7, 8])
+        self.assertEqual((~a).count(), 6)
+        self.assertEqual(~~a, a)
+        self.assertTrue(a.any())
+        self.assertFalse(Bitset(10).any())
+
+    def test_getitem(self):
+        bitset = Bitset.from_indexes([1, 8], 9)
+        self.assertTrue(bitset[1])
+        self.assertFalse(bitset[2])
+        self.assertTrue(bitset[-1])
+        with self.assertRaises(IndexError):
+            bitset[9]
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            Bitset(3) & Bitset(4)
+        with self.assertRaises(TypeError):
+            Bitset(3) & [True, False, True]
+        with self.assertRaises(ValueError):
+            Bitset(9, b"\x00")
+        with self.assertRaises(IndexError):
+            Bitset.from_indexes([3], 3)
+
+    def test_bytes_round_trip(self):
+        bitset = Bitset.from_indexes([0, 5, 11], 12)
+        self.assertEqual(Bitset(12, bitset.to_bytes()), bitset)
+        # Padding bits are ignored
+        self.assertEqual(Bitset(4, b"\xff"), Bitset.from_indexes([0, 1, 2, 3], 4))
+
+    @skipIf(np is None, "numpy is not installed")
+    def test_numpy(self):
+        bools = np.array([True, False, False, True, True, False, True, False, True])
+        bitset = Bitset.from_numpy(bools)
+        self.assertEqual(list(bitset), [0, 3, 4, 6, 8])
+        self.assertEqual(bitset.to_numpy(packed=False).tolist(), bools.tolist())
+        packed = bitset.to_numpy()
+        self.assertEqual(
+            packed.tolist(), np.packbits(bools, bitorder="little").tolist()
+        )
+        self.assertEqual(Bitset.from_numpy(packed, len(bools)), bitset)
+
+
+class TestExecuteBatch(TestCase):
+    def test_execute_batch(self):
+        operation = [">", ["key", "a"], 2]
+        contexts = [dict(a=a) for a in range(10)]
+        expected = [execute(operation, context) for context in contexts]
+        self.assertEqual(execute_batch(operation, contexts), expected)
+
+        bitset = execute_batch(operation, iter(contexts), bitset=True)
+        self.assertEqual(bitset.to_bools(), expected)
+
+    def test_combine_results(self):
+        contexts = [dict(a=a, b=a % 2) for a in range(20)]
+        big = execute_batch([">", ["key", "a"], 10], contexts, bitset=True)
+        odd = execute_batch(["==", ["key", "b"], 1], contexts, bitset=True)
+        self.assertEqual(list(big & odd), [11, 13, 15, 17, 19])
+        self.assertEqual((big | odd).count(), 14)
@@ -0,0 +1,191 @@
+import threading
+from unittest import TestCase, mock
+
+from parameterized import parameterized
+
+from json_operations import NEVER_MATCH, JsonOperationError, _tiering, execute
+from json_operations.compiler import _compile, configure_tiering, tiering_stats
+from json_operations.explain import explain
+
+CONTEXTS = [
+    dict(a=1, b="x", c=[1, 2], d=dict(e=2.5), f=None),
+    dict(a=2.0, b="y", c=["x"], d=dict(e=True), f=[1, [2]]),
+    dict(a=True, b=1, c=[], d=[5], f="x"),
+    dict(a=NEVER_MATCH, b=NEVER_MATCH, c=NEVER_MATCH, d=dict(e=NEVER_MATCH)),
+    dict(d="x"),
+    [1, 2, 3],
+    {},
+]
+
+OPERATIONS = [
+    [">", ["key", "a"], 1],
+    ["<=", 1, ["key", "a"]],
+    ["==", ["key", "b"], "x"],
+    ["!=", ["key", "b"], ["key", "b"]],
+    ["==", ["key", "a"], True],
+    ["==", ["key", "c"], [1, 2]],
+    ["==", ["key", "1"], 2],
+    ["in", ["key", "b"], ["x", "z", 1]],
+    ["in", ["key", "b"], "xyz"],
+    ["nin", ["key", "a"], [1, 2]],
+    ["in", "x", ["key", "c"]],
+    ["btw", ["key", "d.e"], [2, 3]],
+    ["btw", ["key", "a"], [0, 1.5]],
+    ["&", ["key", "c"], [1, "x"]],
+    ["!&", ["key", "f"], [1, "x"]],
+    ["null", ["key", "f"]],
+    ["!null", ["key", "d.e"]],
+    ["and", ["key", "a"], ["key", "b"]],
+    ["or", ["key", "missing", 1], ["key", "f"]],
+    ["or"],
+    ["and"],
+    ["and", 1, "x"],
+    [
+        "and",
+        [">", ["key", "a"], 0],
+        ["or", ["==", ["key", "b"], "x"], ["in", ["key", "d.e"], [2.5, 3]]],
+        ["!null", ["key", "a"]],
+    ],
+]
+
+
+def _run(function, *args):
+    try:
+        return "result", function(*args)
+    except Exception as e:
+        return "error", type(e), str(e)
+
+
+class TestCompiler(TestCase):
+    @parameterized.expand([(operation,) for operation in OPERATIONS])
+    def test_same_results_as_interpreter(self, operation):
+        compiled = _compile(operation)
+        self.assertIsNotNone(compiled)
+        for context in CONTEXTS:
+            expected = _run(execute, operation, context, 10**9)
+            result = _run(compiled, context)
+            # When the compiled function raises, execute() uses the interpreter
+            if result[0] == "result":
+                self.assertEqual(result, expected, (operation, context))
+                self.assertIs(type(result[1]), type(expected[1]))
+
+    @parameterized.expand(
+        [
+            (["~", ["key", "a"], 1],),
+            (["and", ["key"]],),
+            (["key", "a"],),
+            (True,),
+            ([],),
+        ]
+    )
+    def test_not_compiled(self, operation):
+        self.assertIsNone(_compile(operation))
+
+    def test_literals_are_not_in_the_source(self):
+        compiled = _compile(["==", ["key", "a"], "__import__('os')"])
+        self.assertNotIn("import", compiled.source)
+        self.assertFalse(compiled(dict(a="x")))
+
+
+class TestTiering(TestCase):
+    def setUp(self):
+        configure_tiering(threshold=3)
+        self.addCleanup(configure_tiering)
+
+    def test_compiles_hot_operations(self):
+        hot = [">", ["key", "a"], 1]
+        cold = ["<", ["key", "a"], 1]
+        for a in range(10):
+            self.assertEqual(execute(hot, dict(a=a)), a > 1)
+        execute(cold, dict(a=0))
+
+        stats = tiering_stats()
+        self.assertEqual((stats.tracked, stats.compiled), (2, 1))
+        self.assertEqual(stats.hot[0].operation, hot)
+        self.assertEqual(stats.hot[0].calls, 10)
+        self.assertTrue(stats.hot[0].compiled)
+        self.assertFalse(stats.hot[1].compiled)
+
+    def test_errors_match_interpreter(self):
+        operation = [">", ["key", "a"], 1]
+        for _ in range(5):
+            execute(operation, dict(a=2))
+        with self.assertRaisesRegex(JsonOperationError, "'>' not supported"):
+            execute(operation, dict(a="x"))
+        self.assertEqual(tiering_stats().fallbacks, 1)
+
+    def test_budget_uses_interpreter(self):
+        operation = [">", ["key", "a"], 1]
+        for _ in range(5):
+            execute(operation, dict(a=2))
+        with self.assertRaises(JsonOperationError):
+            execute(operation, dict(a=2), budget=0)
+
+    def test_bounded(self):
+        configure_tiering(threshold=1, max_tracked=4, max_compiled=2)
+        operations = [["==", ["key", "a"], value] for value in range(10)]
+        for operation in operations:
+            execute(operation, dict(a=1))
+            execute(operation, dict(a=1))
+        stats = tiering_stats()
+        self.assertLessEqual(stats.compiled, 2)
+        self.assertLessEqual(stats.tracked, 4)
+
+    def test_hot_set_larger_than_max_compiled(self):
+        # Operations past max_compiled stay interpreted, rather than evicting (and later
+        # recompiling) other hot operations
+        configure_tiering(threshold=1, max_compiled=2)
+        operations = [["==", ["key", "a"], value] for value in range(4)]
+        with mock.patch("json_operations.compiler._compile", wraps=_compile) as compile:
+            for _ in range(10):
+                for value, operation in enumerate(operations):
+                    self.assertEqual(execute(operation, dict(a=1)), value == 1)
+        self.assertEqual(compile.call_count, 2)
+        self.assertEqual(tiering_stats().compiled, 2)
+
+    def test_disabled(self):
+        configure_tiering(threshold=None)
+        operation = [">", ["key", "a"], 1]
+        for _ in range(5):
+            execute(operation, dict(a=2))
+        self.assertEqual(tiering_stats().tracked, 0)
+
+    def test_off_by_default(self):
+        configure_tiering()
+        operation = ["==", ["key", "a"], 1]
+        for _ in range(1100):
+            execute(operation, dict(a=1))
+        operation[2] = 2
+        self.assertFalse(execute(operation, dict(a=1)))
+        self.assertEqual(tiering_stats().tracked, 0)
+
+    def test_explain_compiled(self):
+        plan = explain(["in", ["key", "a"], ["x", "y"]], compiled=True)
+        self.assertIn("literal list of 2 items converted to a set", plan.root.notes)
+
+    def test_per_thread_counts(self):
+        # As on free-threaded builds
+        per_thread = _tiering.per_thread
+        _tiering.per_thread = True
+        self.addCleanup(setattr, _tiering, "per_thread", per_thread)
+        configure_tiering(threshold=3)
+
+        operation = [">", ["key", "a"], 1]
+        results = []
+
+        def run():
+            results.append([execute(operation, dict(a=a)) for a in range(5)])
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        run()
+
+        self.assertEqual(results, [[a > 1 for a in range(5)]] * 5)
+        stats = tiering_stats()
+        # Finished threads are not counted
+        self.assertEqual((stats.tracked, stats.compiled), (1, 1))
+        self.assertEqual(stats.hot[0].calls, 5)
+        self.assertTrue(stats.hot[0].compiled)
@@ -0,0 +1,114 @@
+from unittest import TestCase
+
+from parameterized import parameterized
+
+from json_operations import JsonOperationError, execute, execute_debug, get_keys
+from json_operations.cost import (
+    Cost,
+    CostLimits,
+    estimate_cost,
+    node_cost,
+    validate_cost,
+)
+
+
+def _nested(depth):
+    operation = ["==", ["key", "a"], 1]
+    for _ in range(depth):
+        operation = ["and", operation]
+    return operation
+
+
+class TestCost(TestCase):
+    @parameterized.expand(
+        [
+            (
+                [">", ["key", "a"], 1],
+                Cost(nodes=2, depth=2, literal_size=0, key_length=1),
+            ),
+            (
+                ["in", ["key", "user.country"], ["US", "CA", "MX"]],
+                Cost(nodes=2, depth=2, literal_size=9, key_length=2),
+            ),
+            (
+                [
+                    "and",
+                    ["&", ["key", "tags"], [["a", "b"], "cd"]],
+                    ["or", ["null", ["key", "a.b.c"]], ["key", "x"]],
+                ],
+                Cost(nodes=7, depth=4, literal_size=8, key_length=5),
+            ),
+            (
+                ["==", "abc", "abc"],
+                Cost(nodes=1, depth=1, literal_size=6, key_length=0),
+            ),
+            (True, Cost(nodes=0, depth=0, literal_size=0, key_length=0)),
+        ]
+    )
+    def test_estimate_cost(self, operation, cost):
+        self.assertEqual(estimate_cost(operation), cost)
+
+    @parameterized.expand(
+        [
+            ([">", ["key", "a"], 1],),
+            (["in", ["key", "user.country"], ["US", "CA", "MX"]],),
+            (["and", ["key", "a"], "xy", ["!&", ["key", "b"], ["c", "d"]]],),
+        ]
+    )
+    def test_node_costs_add_up_to_total(self, operation):
+        nodes = [operation]
+        total = 0
+        while nodes:
+            node = nodes.pop()
+            total += node_cost(node)
+            if node[0] in ("and", "or"):
+                nodes.extend(val for val in node[1:] if isinstance(val, list))
+        self.assertEqual(total, estimate_cost(operation).total)
+
+    def test_deep_nesting(self):
+        operation = _nested(5000)
+        self.assertEqual(estimate_cost(operation).depth, 5002)
+        with self.assertRaises(JsonOperationError):
+            validate_cost(operation)
+        with self.assertRaises(JsonOperationError):
+            execute(operation, dict(a=1))
+        with self.assertRaises(JsonOperationError):
+            execute_debug(operation, dict(a=1))
+        with self.assertRaises(JsonOperationError):
+            get_keys(operation)
+
+    @parameterized.expand(
+        [
+            (CostLimits(max_nodes=1), "nodes"),
+            (CostLimits(max_depth=1), "depth"),
+            (CostLimits(max_literal_size=2), "literal size"),
+            (CostLimits(max_key_length=1), "key length"),
+            (CostLimits(max_total=10), "total cost"),
+        ]
+    )
+    def test_validate_cost(self, limits, message):
+        operation = ["in", ["key", "user.country"], ["US", "CA", "MX"]]
+        self.assertEqual(validate_cost(operation), estimate_cost(operation))
+        with self.assertRaisesRegex(JsonOperationError, message):
+            validate_cost(operation, limits)
+
+    def test_validated_operations_do_not_hit_recursion_limit(self):
+        operation = _nested(30)
+        validate_cost(operation)
+        self.assertTrue(execute(operation, dict(a=1)))
+        get_keys(operation)
+
+
+class TestEvaluationBudget(TestCase):
+    def test_budget(self):
+        operation = ["&", ["key", "tags"], ["a", "b"]]
+        context = dict(tags=list(range(100)))
+        self.assertFalse(execute(operation, context, budget=103))
+        with self.assertRaisesRegex(JsonOperationError, "budget of 102 exceeded"):
+            execute(operation, context, budget=102)
+
+    def test_budget_counts_every_operation(self):
+        operation = ["and", *([">", ["key", "a"], 1] for _ in range(10))]
+        self.assertTrue(execute(operation, dict(a=2), budget=11))
+        with self.assertRaises(JsonOperationError):
+            execute(operation, dict(a=2), budget=10)
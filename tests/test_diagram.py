@@ -0,0 +1,103 @@
+from unittest import TestCase
+
+from parameterized import parameterized
+
+from json_operations import NEVER_MATCH, JsonOperationError, execute
+from json_operations.diagram import DecisionDiagram
+
+RULES = {
+    "adult": [">=", ["key", "age"], 18],
+    "us_adult": ["and", ["==", ["key", "country"], "US"], [">=", ["key", "age"], 21]],
+    "eu": ["in", ["key", "country"], ["FR", "DE"]],
+    "vip_or_pro": ["or", ["key", "vip"], ["in", ["key", "plan"], ["pro", "team"]]],
+    "named": ["and", ["key", "name", "default"], ["!null", ["key", "age"]]],
+    "no_plan": ["null", ["key", "plan"]],
+    "nested": [
+        "or",
+        ["and", ["==", ["key", "country"], "FR"], ["<", ["key", "age"], 30]],
+        ["and", ["key", "vip"], ["btw", ["key", "age"], [40, 50]]],
+    ],
+    "constant": ["and", True, 1],
+    "never": ["or", False, 0],
+    "key": ["key", "vip"],
+}
+
+CONTEXTS = [
+    dict(age=30, country="US", plan="pro", name="a"),
+    dict(age=19, country="US", vip=True),
+    dict(age=25, country="FR", plan="free", name=""),
+    dict(age=45, country="DE", vip=1, plan="team"),
+    dict(age=17, country="GB", vip=False, plan=None),
+    dict(age=NEVER_MATCH, country="US", vip=True),
+    dict(age=45, country="FR", vip=NEVER_MATCH, plan="pro"),
+    dict(age=60, country=NEVER_MATCH, name=NEVER_MATCH),
+]
+
+
+class TestDecisionDiagram(TestCase):
+    @parameterized.expand([(context,) for context in CONTEXTS])
+    def test_same_results_as_execute(self, context):
+        expected = [
+            rule_id for rule_id, rule in RULES.items() if execute(rule, context)
+        ]
+        diagram = DecisionDiagram(RULES)
+        # Twice, the second walk uses the nodes the first one built
+        self.assertEqual(diagram.matches(context), expected)
+        self.assertEqual(diagram.matches(context), expected)
+        self.assertEqual(
+            diagram.execute(context),
+            {rule_id: rule_id in expected for rule_id in RULES},
+        )
+
+    def test_same_results_when_too_large(self):
+        diagram = DecisionDiagram(RULES, max_nodes=3)
+        stats = diagram.stats()
+        self.assertGreater(stats.fallback_rules, 0)
+        self.assertGreater(stats.compiled_rules, 0)
+        for context in CONTEXTS + CONTEXTS:
+            expected = [
+                rule_id for rule_id, rule in RULES.items() if execute(rule, context)
+            ]
+            self.assertEqual(diagram.matches(context), expected)
+        self.assertLessEqual(diagram.stats().nodes, 3)
+
+    def test_predicates_are_shared(self):
+        diagram = DecisionDiagram(
+            {
+                "a": ["and", [">", ["key", "a"], 1], ["==", ["key", "b"], "x"]],
+                "b": ["or", [">", ["key", "a"], 1], ["==", ["key", "b"], "y"]],
+            }
+        )
+        self.assertEqual(diagram.stats().predicates, 3)
+
+    def test_tests_each_predicate_at_most_once(self):
+        calls = []
+        rules = {
+            str(value): ["and", ["key", "b"], ["==", ["key", "a"], value]]
+            for value in range(5)
+        }
+        diagram = DecisionDiagram(rules)
+        predicates = diagram._predicates
+        diagram._predicates = [
+            lambda context, p=p, i=i: calls.append(i) or p(context)
+            for i, p in enumerate(predicates)
+        ]
+        self.assertEqual(diagram.matches(dict(a=3, b=True)), ["3"])
+        self.assertEqual(len(calls), len(set(calls)))
+        calls.clear()
+        # No rule can match once b is falsy
+        self.assertEqual(diagram.matches(dict(a=3, b=False)), [])
+        self.assertEqual(len(calls), 1)
+
+    def test_unsupported_rules_use_execute(self):
+        diagram = DecisionDiagram(
+            {"a": ["~", ["key", "a"], 1], "b": ["==", ["key", "a"], 1]}
+        )
+        self.assertEqual(diagram.stats().fallback_rules, 1)
+        with self.assertRaisesRegex(JsonOperationError, "Invalid operator"):
+            diagram.matches(dict(a=1))
+
+    def test_errors(self):
+        diagram = DecisionDiagram({"a": [">", ["key", "a"], 1]})
+        with self.assertRaisesRegex(JsonOperationError, "'>' not supported"):
+            diagram.matches(dict(a="x"))
@@ -0,0 +1,72 @@
+import json
+from unittest import TestCase
+
+from parameterized import parameterized
+
+from json_operations import JsonOperationError, execute_debug
+from json_operations.cost import estimate_cost, node_cost
+from json_operations.explain import explain
+
+OPERATION = [
+    "and",
+    [">", ["key", "age"], 18],
+    [
+        "or",
+        ["in", ["key", "country"], ["US", "CA"]],
+        ["&", ["key", "tags"], ["vip"]],
+        ["key", "override"],
+    ],
+]
+
+
+class TestExplain(TestCase):
+    def test_paths_match_execute_debug(self):
+        plan = explain(OPERATION)
+        debug = execute_debug(
+            OPERATION, dict(age=20, country="US", tags=[], override=False)
+        )
+        reported = {node.path for node in plan.nodes() if node.operator != "key"}
+        self.assertEqual(reported, set(debug))
+
+    def test_plan(self):
+        plan = explain(OPERATION)
+        self.assertEqual(plan.keys, ["age", "country", "tags", "override"])
+        self.assertEqual(plan.cost, estimate_cost(OPERATION))
+        self.assertEqual(
+            [node.path for node in plan.nodes()],
+            ["0", "1.0", "1.1", "1.2", "1", ""],
+        )
+
+        membership = plan.root.children[1].children[0]
+        self.assertEqual(membership.operator, "in")
+        self.assertEqual(membership.keys, ["country"])
+        self.assertEqual(membership.literals, [["US", "CA"]])
+        self.assertIn("linear scan of 2 items", membership.notes)
+        self.assertEqual(
+            membership.cost, node_cost(["in", ["key", "country"], ["US", "CA"]])
+        )
+
+    def test_to_dict_is_json(self):
+        plan = explain(OPERATION)
+        self.assertEqual(json.loads(json.dumps(plan.to_dict()))["keys"], plan.keys)
+
+    def test_render(self):
+        rendered = explain(OPERATION).render()
+        self.assertIn("[root] and", rendered)
+        self.assertIn("[1.0] in key(country)", rendered)
+        self.assertIn("Keys fetched: age, country, tags, override", rendered)
+
+    @parameterized.expand(
+        [
+            ([">", [">", ["key", "a"], 1], 2], "operand 0 is a literal list"),
+            (["&", ["key", "a"], [1, 2]], "converted to sets"),
+            (["in", "a", ["key", "b"]], "scanned linearly"),
+        ]
+    )
+    def test_notes(self, operation, note):
+        notes = explain(operation).root.notes
+        self.assertTrue(any(note in n for n in notes), notes)
+
+    def test_invalid_operator(self):
+        with self.assertRaises(JsonOperationError):
+            explain(["and", ["~", 1, 2]])
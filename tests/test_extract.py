@@ -0,0 +1,114 @@
+from unittest import TestCase
+
+from parameterized import parameterized
+
+from json_operations import NEVER_MATCH, _get_key, execute
+from json_operations.extract import KeyExtractor, SlotEvaluator
+
+KEYS = [
+    "user.profile.age",
+    "user.profile.country",
+    "user.profile.tags",
+    "user.id",
+    "items.0.price",
+    "items.2.price",
+    "items",
+    "0",
+    "user",
+]
+
+CONTEXTS = [
+    dict(
+        user=dict(id=1, profile=dict(age=30, country="US", tags=["a"])),
+        items=[dict(price=1), dict(price=2), dict(price=3)],
+    ),
+    dict(user=dict(id=None, profile="x"), items=dict(price=1)),
+    dict(user=[1, 2], items={"0": dict(price=5), "2": 3}),
+    dict(user=dict(profile=dict(age=NEVER_MATCH))),
+    {"0": "zero"},
+    ["zero", 1],
+    {},
+]
+
+
+class TestKeyExtractor(TestCase):
+    @parameterized.expand([(context,) for context in CONTEXTS])
+    def test_same_values_as_get_key(self, context):
+        extractor = KeyExtractor(KEYS)
+        values = extractor.extract(context)
+        for key in KEYS:
+            self.assertIs(values[extractor.slot(key)], _get_key(context, key))
+
+    def test_index_error(self):
+        extractor = KeyExtractor(["items.2.price"])
+        with self.assertRaises(IndexError):
+            _get_key(dict(items=[1]), "items.2.price")
+        with self.assertRaises(IndexError):
+            extractor.extract(dict(items=[1]))
+
+    def test_slots(self):
+        extractor = KeyExtractor()
+        self.assertEqual(extractor.add("a.b"), 0)
+        self.assertEqual(extractor.add("a.c"), 1)
+        self.assertEqual(extractor.add("a.b"), 0)
+        self.assertEqual(extractor.add("a.b", default=1), 2)
+        self.assertEqual(extractor.add("a.b", default=True), 3)
+        self.assertEqual(len(extractor), 4)
+        self.assertEqual(extractor.extract(dict(a=dict(c=2))), [None, 2, 1, True])
+
+    def test_from_operations(self):
+        extractor = KeyExtractor.from_operations(
+            [["and", [">", ["key", "a.b"], 1], ["==", ["key", "a.c"], 2]]]
+        )
+        self.assertEqual(extractor.extract(dict(a=dict(b=5))), [5, None])
+
+
+RULES = {
+    "adult": [">=", ["key", "user.profile.age"], 18],
+    "us": ["==", ["key", "user.profile.country"], "US"],
+    "tagged": ["&", ["key", "user.profile.tags"], ["a", "b"]],
+    "default": ["and", ["key", "user.vip", True], ["!null", ["key", "user.id"]]],
+    "third_item": [">", ["key", "items.2.price"], 2],
+    "literal": True,
+}
+
+
+def _run(function, *args):
+    try:
+        return "result", function(*args)
+    except Exception as e:
+        return "error", type(e), str(e)
+
+
+class TestSlotEvaluator(TestCase):
+    @parameterized.expand([(context,) for context in CONTEXTS])
+    def test_same_results_as_execute(self, context):
+        evaluator = SlotEvaluator(RULES)
+        expected = {}
+        for rule_id, json_operation in RULES.items():
+            expected[rule_id] = _run(execute, json_operation, context)
+
+        if any(result[0] == "error" for result in expected.values()):
+            error = next(r for r in expected.values() if r[0] == "error")
+            self.assertEqual(_run(evaluator.execute, context)[:2], error[:2])
+        else:
+            results = evaluator.execute(context)
+            self.assertEqual(
+                results, {rule_id: value for rule_id, (_, value) in expected.items()}
+            )
+
+    def test_matches(self):
+        evaluator = SlotEvaluator(RULES)
+        self.assertEqual(
+            evaluator.matches(CONTEXTS[0]),
+            ["adult", "us", "tagged", "default", "third_item", "literal"],
+        )
+
+    def test_index_error_only_for_rules_using_the_key(self):
+        evaluator = SlotEvaluator(
+            {"id": ["null", ["key", "user.id"]], "third_item": RULES["third_item"]}
+        )
+        with self.assertRaises(IndexError):
+            evaluator.execute(dict(items=[1]))
+        evaluator = SlotEvaluator({"id": ["null", ["key", "user.id"]]})
+        self.assertEqual(evaluator.execute(dict(items=[1])), {"id": True})
@@ -0,0 +1,114 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from parameterized import parameterized
+
+from json_operations import NEVER_MATCH, JsonOperationError, execute
+from json_operations.incremental import IncrementalEvaluator
+
+RULES = {
+    "adult": [">=", ["key", "user.age"], 18],
+    "bob": ["==", ["key", "user.name"], "bob"],
+    "vip": [
+        "and",
+        ["in", "vip", ["key", "user.tags"]],
+        ["or", [">", ["key", "cart.total"], 100], ["key", "flags.free_shipping"]],
+    ],
+    "always": True,
+}
+
+
+def _context():
+    return dict(
+        user=dict(age=17, name="bob", tags=["vip"]),
+        cart=dict(total=50),
+        flags=dict(free_shipping=False),
+    )
+
+
+class TestIncrementalEvaluator(TestCase):
+    def test_evaluate(self):
+        evaluator = IncrementalEvaluator(RULES)
+        self.assertEqual(
+            evaluator.evaluate(_context()),
+            {"adult": False, "bob": True, "vip": False, "always": True},
+        )
+
+    @parameterized.expand(
+        [
+            ("user.age", 18, {"adult": True}),
+            ("user.name", "alice", {"bob": False}),
+            ("cart.total", 101, {"vip": True}),
+            ("cart.total", 99, {}),
+            ("flags.free_shipping", True, {"vip": True}),
+            ("flags.free_shipping", NEVER_MATCH, {}),
+        ]
+    )
+    def test_update(self, path, value, flipped):
+        evaluator = IncrementalEvaluator(RULES)
+        context = _context()
+        evaluator.evaluate(context)
+
+        parent, key = path.split(".")
+        context[parent][key] = value
+        self.assertEqual(evaluator.update(context, [path]), flipped)
+        self.assertEqual(
+            evaluator.results,
+            {rule_id: execute(rule, context) for rule_id, rule in RULES.items()},
+        )
+
+    def test_update_parent_and_child_paths(self):
+        evaluator = IncrementalEvaluator(RULES)
+        context = _context()
+        evaluator.evaluate(context)
+
+        context["user"] = dict(age=30, name="alice", tags=[])
+        self.assertEqual(
+            evaluator.update(context, ["user"]), {"adult": True, "bob": False}
+        )
+
+        context["user"]["tags"].append("vip")
+        context["cart"]["total"] = 500
+        self.assertEqual(
+            evaluator.update(context, ["user.tags.0", "cart"]), {"vip": True}
+        )
+
+    def test_update_only_runs_affected_subtrees(self):
+        evaluator = IncrementalEvaluator(RULES)
+        context = _context()
+        evaluator.evaluate(context)
+
+        context["cart"]["total"] = 101
+        with patch("json_operations.incremental.execute", wraps=execute) as mock:
+            evaluator.update(context, ["cart.total"])
+        mock.assert_called_once_with([">", ["key", "cart.total"], 100], context)
+
+    def test_unrelated_update(self):
+        evaluator = IncrementalEvaluator(RULES)
+        context = _context()
+        evaluator.evaluate(context)
+        self.assertEqual(evaluator.update(context, ["other"]), {})
+
+    def test_evaluate_in_constructor(self):
+        context = _context()
+        evaluator = IncrementalEvaluator(RULES, context)
+        self.assertEqual(evaluator.results["adult"], False)
+        context["user"]["age"] = 18
+        self.assertEqual(evaluator.update(context, ["user.age"]), {"adult": True})
+
+    def test_update_needs_evaluate(self):
+        evaluator = IncrementalEvaluator(RULES)
+        with self.assertRaisesRegex(JsonOperationError, "call evaluate"):
+            evaluator.update(_context(), ["user.age"])
+
+        context = _context()
+        context["user"]["age"] = "x"
+        with self.assertRaises(JsonOperationError):
+            evaluator.evaluate(context)
+        with self.assertRaisesRegex(JsonOperationError, "call evaluate"):
+            evaluator.update(context, ["user.name"])
+
+        context["user"]["age"] = 18
+        evaluator.evaluate(context)
+        context["user"]["name"] = "alice"
+        self.assertEqual(evaluator.update(context, ["user.name"]), {"bob": False})
@@ -0,0 +1,110 @@
+import json
+import sys
+from unittest import TestCase
+
+from json_operations import execute
+from json_operations.intern import Interner
+
+COUNTRIES = ["US", "CA", "MX", "FR", "DE"]
+
+
+def _rules():
+    # Loaded from JSON so no strings or lists are shared to begin with
+    return [
+        json.dumps(["in", ["key", "user.country"], COUNTRIES]),
+        json.dumps(
+            [
+                "and",
+                ["in", ["key", "user.country"], COUNTRIES],
+                [">", ["key", "user.age"], 18],
+            ]
+        ),
+        json.dumps(["&", ["key", "user.skus"], ["sku-1", "sku-2"]]),
+        json.dumps(["btw", ["key", "user.age"], [18, 30]]),
+        json.dumps(["==", ["key", "user.age"], 18.0]),
+        json.dumps(["==", ["key", "user.flag"], True]),
+    ]
+
+
+class TestInterner(TestCase):
+    def test_identical_values_are_shared(self):
+        interner = Interner()
+        first, second, *_ = [interner.loads(rule) for rule in _rules()]
+
+        self.assertIs(first[2], second[1][2])
+        self.assertIs(first[1], second[1][1])
+        self.assertIs(first, second[1])
+
+    def test_results_are_unchanged(self):
+        interner = Interner()
+        contexts = [
+            dict(user=dict(country="US", age=18, skus=["sku-2"], flag=True)),
+            dict(user=dict(country="GB", age=40, skus=[], flag=False)),
+        ]
+        for rule in _rules():
+            operation = json.loads(rule)
+            interned = interner.loads(rule)
+            self.assertEqual(interned, operation)
+            for context in contexts:
+                self.assertEqual(
+                    execute(interned, context), execute(operation, context)
+                )
+
+    def test_equal_values_of_different_types_are_not_shared(self):
+        interner = Interner()
+        integer = interner.intern(["==", ["key", "a"], 1])
+        boolean = interner.intern(["==", ["key", "a"], True])
+        floating = interner.intern(["==", ["key", "a"], 1.0])
+        self.assertIs(integer[2], 1)
+        self.assertIs(boolean[2], True)
+        self.assertIsInstance(floating[2], float)
+        self.assertIs(integer[1], boolean[1])
+
+    def test_unhashable_literals(self):
+        interner = Interner()
+        operation = ["==", ["key", "a"], {"b": 1}]
+        self.assertEqual(interner.intern(operation), operation)
+
+    def test_stats(self):
+        interner = Interner()
+        for _ in range(3):
+            for rule in _rules():
+                interner.loads(rule)
+
+        stats = interner.stats()
+        self.assertEqual(stats.operations, 18)
+        self.assertEqual(stats.lists, 3 * 19)
+        # Everything after the first load is shared, as are the lists repeated
+        # within it
+        self.assertEqual(stats.lists_deduplicated, 2 * 19 + 5)
+        self.assertGreater(stats.strings_deduplicated, 0)
+        self.assertGreater(stats.bytes_saved, 0)
+
+    def test_bytes_saved_counts_nested_literals(self):
+        def operation():
+            # New lists and floats, same strings
+            return ["in", ["key", "a"], [[float("1.5"), float("2.5")], [float("3.5")]]]
+
+        interner = Interner()
+        interner.intern(operation())
+        duplicate = operation()
+        interner.intern(duplicate)
+        lists = [duplicate, duplicate[1], duplicate[2], *duplicate[2]]
+        floats = [value for literals in duplicate[2] for value in literals]
+        self.assertEqual(
+            interner.stats().bytes_saved,
+            sum(sys.getsizeof(value) for value in lists + floats),
+        )
+
+    def test_release(self):
+        interner = Interner()
+        first, second, *others = [interner.loads(rule) for rule in _rules()]
+        for operation in [first, *others]:
+            interner.release(operation)
+        # Still shared with the operation that wasn't released
+        self.assertIs(interner.loads(_rules()[0]), second[1])
+
+        interner.release(second)
+        interner.release(second[1])
+        self.assertEqual(interner._lists, {})
+        self.assertIsNot(interner.loads(_rules()[0]), second[1])
@@ -0,0 +1,112 @@
+import copy
+import pickle
+from unittest import TestCase
+
+from parameterized import parameterized
+
+from json_operations import NEVER_MATCH, execute
+from json_operations.projection import MISSING, Projector, projector
+
+OPERATIONS = [
+    [">=", ["key", "user.age"], 18],
+    ["==", ["key", "user.country"], "US"],
+    ["and", ["key", "user.vip"], ["!null", ["key", "user.id"]]],
+    [">", ["key", "items.2.price"], 2],
+    ["in", ["key", "items.0.sku"], ["a", "b"]],
+    ["key", "flags.-1", False],
+    ["&", ["key", "tags"], ["a", "b"]],
+    ["null", ["key", "name.0"]],
+    True,
+]
+
+CONTEXTS = [
+    dict(
+        user=dict(age=30, country="US", vip=True, id=1, history=list(range(100))),
+        items=[dict(price=1, sku="a"), dict(price=2), dict(price=3, sku="c"), 4],
+        flags=[False, True],
+        tags=["a"],
+        name="bob",
+        other=dict(wide="x" * 100),
+    ),
+    dict(user=dict(age=10, vip=NEVER_MATCH), items=[dict(sku="b")], tags=[]),
+    dict(user=dict(id=None, country=None), items=dict(price=1), name=None),
+    dict(user="x", items=[], flags=[]),
+    dict(user=[1, 2], items={"0": dict(sku="a"), "2": dict(price=3)}),
+    {"items": None},
+    ["zero", 1],
+    {},
+]
+
+
+def _run(json_operation, context):
+    try:
+        return "result", execute(json_operation, context)
+    except Exception as e:
+        return "error", type(e), str(e)
+
+
+class TestProjector(TestCase):
+    @parameterized.expand([(context,) for context in CONTEXTS])
+    def test_same_results_as_context(self, context):
+        projection = projector(OPERATIONS).project(context)
+        projection = pickle.loads(pickle.dumps(projection))
+        for json_operation in OPERATIONS:
+            self.assertEqual(
+                _run(json_operation, projection), _run(json_operation, context)
+            )
+
+    @parameterized.expand([(context,) for context in CONTEXTS])
+    def test_same_results_as_context_flattened(self, context):
+        projection = projector(OPERATIONS)
+        try:
+            values = projection.flatten(context)
+        except IndexError:
+            return
+        expanded = projection.expand(pickle.loads(pickle.dumps(values)))
+        for json_operation in OPERATIONS:
+            self.assertEqual(
+                _run(json_operation, expanded), _run(json_operation, context)
+            )
+
+    def test_project(self):
+        projection = projector(OPERATIONS)
+        self.assertEqual(
+            projection.project(CONTEXTS[0]),
+            dict(
+                user=dict(age=30, country="US", vip=True, id=1),
+                items=[dict(sku="a"), None, dict(price=3)],
+                flags=[False, True],
+                tags=["a"],
+                name="bob",
+            ),
+        )
+        # Out of range indexes still raise an IndexError
+        self.assertEqual(
+            projection.project(dict(items=[dict(price=1, sku="a")])),
+            dict(items=[dict(sku="a")]),
+        )
+
+    def test_flatten(self):
+        projection = Projector(["a.b", "a", "c.0", "d"])
+        self.assertEqual(projection.keys, ["a", "d", "c.0"])
+        self.assertEqual(
+            projection.flatten(dict(a=dict(b=1), c=[2], e=3)),
+            (dict(b=1), MISSING, 2),
+        )
+        self.assertEqual(
+            projection.expand((dict(b=1), MISSING, 2)), dict(a=dict(b=1), c={"0": 2})
+        )
+        with self.assertRaises(IndexError):
+            projection.flatten(dict(c=[]))
+
+    def test_keys_of_any_operation(self):
+        # get_keys() rejects values of different types, execute() doesn't
+        projection = projector([["in", ["key", "a"], [1, "b"]]], keys=["b"])
+        self.assertEqual(projection.keys, ["a", "b"])
+
+    def test_pickle_and_copy_keep_markers(self):
+        values = [NEVER_MATCH, MISSING]
+        self.assertEqual(pickle.loads(pickle.dumps(values)), values)
+        self.assertIs(pickle.loads(pickle.dumps(NEVER_MATCH)), NEVER_MATCH)
+        self.assertIs(copy.deepcopy(NEVER_MATCH), NEVER_MATCH)
+        self.assertIs(pickle.loads(pickle.dumps(MISSING)), MISSING)
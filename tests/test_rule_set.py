@@ -0,0 +1,426 @@
+import re
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+
+from parameterized import parameterized
+
+from json_operations import NEVER_MATCH, JsonOperationError, execute
+from json_operations.rule_set import RuleSet, _Pass, _required_keys
+from json_operations.specialize import _prune_never_match
+
+
+class TestRuleSet(TestCase):
+    def test_add_remove_replace(self):
+        rule_set = RuleSet({"a": [">", ["key", "age"], 30]})
+        rule_set.add("b", ["==", ["key", "name"], "bob"])
+        self.assertEqual(len(rule_set), 2)
+        self.assertEqual(
+            rule_set.snapshot().matches(dict(age=31, name="bob")), ["a", "b"]
+        )
+
+        rule_set.replace("a", ["<", ["key", "age"], 30])
+        self.assertEqual(rule_set.snapshot().matches(dict(age=31, name="bob")), ["b"])
+
+        rule_set.remove("b")
+        self.assertEqual(len(rule_set), 1)
+        self.assertNotIn("b", rule_set)
+        self.assertEqual(
+            rule_set.snapshot().execute(dict(age=29, name="bob")), {"a": True}
+        )
+
+    def test_duplicate_and_missing_rules(self):
+        rule_set = RuleSet({"a": ["null", ["key", "a"]]})
+        with self.assertRaises(KeyError):
+            rule_set.add("a", ["null", ["key", "a"]])
+        with self.assertRaises(KeyError):
+            rule_set.remove("missing")
+        with self.assertRaises(KeyError):
+            rule_set.replace("missing", ["null", ["key", "a"]])
+
+    def test_invalid_replace_keeps_old_rule(self):
+        rule_set = RuleSet({"a": [">", ["key", "age"], 30]})
+        with self.assertRaises(JsonOperationError):
+            rule_set.replace("a", ["btw", ["key", "age"], "a"])
+        self.assertEqual(rule_set.get("a"), [">", ["key", "age"], 30])
+
+    def test_snapshot_is_consistent(self):
+        rule_set = RuleSet({"a": [">", ["key", "age"], 30]})
+        snapshot = rule_set.snapshot()
+        rule_set.add("b", [">", ["key", "age"], 10])
+        rule_set.replace("a", ["<", ["key", "age"], 30])
+        rule_set.remove("b")
+
+        self.assertEqual(snapshot.matches(dict(age=40)), ["a"])
+        self.assertEqual(rule_set.snapshot().matches(dict(age=40)), [])
+
+    def test_snapshot_survives_compaction(self):
+        rule_set = RuleSet({"keep": ["==", ["key", "a"], 1]})
+        snapshot = rule_set.snapshot()
+        for index in range(200):
+            rule_set.add(index, ["==", ["key", "a"], 1])
+            rule_set.remove(index)
+
+        self.assertLess(len(rule_set._entries), 200)
+        self.assertEqual(snapshot.matches(dict(a=1)), ["keep"])
+        self.assertEqual(rule_set.snapshot().matches(dict(a=1)), ["keep"])
+
+    def test_shared_subtrees_are_reference_counted(self):
+        shared = ["or", ["==", ["key", "a"], 1], ["==", ["key", "b"], 2]]
+        rule_set = RuleSet(
+            {
+                "x": ["and", shared, [">", ["key", "c"], 0]],
+                "y": ["and", shared, ["<", ["key", "c"], 0]],
+            }
+        )
+        self.assertIs(rule_set.get("x")[1], rule_set.get("y")[1])
+        self.assertEqual(len(rule_set._subtrees), 7)
+
+        rule_set.remove("x")
+        self.assertEqual(len(rule_set._subtrees), 5)
+        rule_set.remove("y")
+        self.assertEqual(rule_set._subtrees, {})
+
+    def test_equal_literals_of_different_types_are_not_shared(self):
+        rule_set = RuleSet(
+            {"int": ["==", ["key", "a"], 1], "bool": ["==", ["key", "a"], True]}
+        )
+        self.assertIs(rule_set.get("bool")[2], True)
+
+    def test_key_index(self):
+        rule_set = RuleSet(
+            {
+                "x": ["and", ["==", ["key", "a"], 1], ["==", ["key", "b"], 2]],
+                "y": ["==", ["key", "a"], 3],
+            }
+        )
+        self.assertEqual(rule_set.rules_for_key("a"), {"x", "y"})
+        rule_set.replace("x", ["==", ["key", "a"], 2])
+        self.assertEqual(rule_set.rules_for_key("a"), {"x", "y"})
+        self.assertEqual(rule_set.rules_for_key("b"), set())
+        rule_set.remove("y")
+        self.assertEqual(rule_set.rules_for_key("a"), {"x"})
+
+    def test_rules_for_key_during_writes(self):
+        rule_set = RuleSet()
+        rule_ids = [f"rule_{i}" for i in range(100)]
+        done = threading.Event()
+
+        def write():
+            for _ in range(20):
+                for rule_id in rule_ids:
+                    rule_set.add(rule_id, ["null", ["key", "a"]])
+                for rule_id in rule_ids:
+                    rule_set.remove(rule_id)
+            done.set()
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        while not done.is_set():
+            self.assertLessEqual(rule_set.rules_for_key("a"), set(rule_ids))
+        thread.join()
+        self.assertEqual(rule_set.rules_for_key("a"), set())
+
+
+class TestOrderedRuleSet(TestCase):
+    def setUp(self):
+        self.rule_set = RuleSet()
+        self.rule_set.add("default", True, priority=100)
+        self.rule_set.add("adult", [">=", ["key", "age"], 18], priority=10)
+        self.rule_set.add("us", ["==", ["key", "country"], "US"], priority=5)
+        self.rule_set.add("vip", ["in", "vip", ["key", "tags"]], priority=1)
+
+    @parameterized.expand(
+        [
+            (dict(age=30, country="US", tags=["vip"]), "vip"),
+            (dict(age=30, country="US", tags=[]), "us"),
+            (dict(age=30, country="FR"), "adult"),
+            (dict(age=10, country="FR"), "default"),
+            (dict(), "default"),
+        ]
+    )
+    def test_first_match(self, context, result):
+        self.assertEqual(self.rule_set.snapshot().first_match(context), result)
+
+    def test_top_k(self):
+        snapshot = self.rule_set.snapshot()
+        context = dict(age=30, country="US", tags=["vip"])
+        self.assertEqual(snapshot.top_k(context, 2), ["vip", "us"])
+        self.assertEqual(snapshot.top_k(context, 10), ["vip", "us", "adult", "default"])
+        self.assertEqual(snapshot.top_k(context, 0), [])
+
+    def test_no_match(self):
+        rule_set = RuleSet({"a": ["==", ["key", "a"], 1]})
+        self.assertIsNone(rule_set.snapshot().first_match(dict(a=2)))
+
+    def test_equal_priorities_keep_insertion_order(self):
+        rule_set = RuleSet()
+        for rule_id in ("c", "a", "b"):
+            rule_set.add(rule_id, True)
+        rule_set.replace("c", ["and", True])
+        self.assertEqual(rule_set.snapshot().top_k({}, 3), ["c", "a", "b"])
+
+    def test_replace_keeps_priority(self):
+        self.rule_set.replace("default", ["!null", ["key", "age"]])
+        self.assertEqual(
+            self.rule_set.snapshot().first_match(dict(age=10, country="FR")),
+            "default",
+        )
+        self.rule_set.replace("default", True, priority=0)
+        self.assertEqual(
+            self.rule_set.snapshot().first_match(dict(age=30, country="US")),
+            "default",
+        )
+
+    def test_stops_at_first_match(self):
+        list_operation = patch.object(
+            _Pass, "_list_operation", autospec=True, side_effect=_Pass._list_operation
+        )
+        with patch(
+            "json_operations.rule_set.execute", wraps=execute
+        ) as mock, list_operation as list_mock:
+            self.rule_set.snapshot().first_match(
+                dict(age=30, country="US", tags=["vip"])
+            )
+        # List operators are evaluated by the pass itself
+        mock.assert_not_called()
+        list_mock.assert_called_once()
+        self.assertEqual(list_mock.call_args[0][1], ["in", "vip", ["key", "tags"]])
+
+    def test_skips_rules_missing_required_keys(self):
+        # "vip" and "us" would raise an error, but cannot match without their keys
+        with patch("json_operations.rule_set.execute", wraps=execute) as mock:
+            self.assertEqual(
+                self.rule_set.snapshot().first_match(dict(age=30)), "adult"
+            )
+        mock.assert_called_once_with([">=", ["key", "age"], 18], dict(age=30))
+
+    def test_order_is_updated_by_writes(self):
+        rule_set = RuleSet()
+        with patch("json_operations.rule_set._BLOCK_SIZE", 2):
+            for i in range(30):
+                rule_set.add(i, True, priority=(i * 7) % 5)
+            before = rule_set.snapshot()
+            for i in range(0, 30, 3):
+                rule_set.remove(i)
+            for i in range(1, 30, 3):
+                rule_set.replace(i, True, priority=-i)
+        self.assertEqual(
+            before.top_k({}, 30),
+            sorted(range(30), key=lambda i: ((i * 7) % 5, i)),
+        )
+        self.assertEqual(
+            rule_set.snapshot().top_k({}, 30),
+            [i for i in range(28, 0, -3)]
+            + sorted(range(2, 30, 3), key=lambda i: ((i * 7) % 5, i)),
+        )
+
+    def test_skips_rules_by_first_required_key(self):
+        rule_set = RuleSet()
+        for i in range(20):
+            for key in ("a", "b", "c"):
+                rule_set.add(f"{key}_{i}", ["==", ["key", key], i], priority=i)
+        rule_set.add("default", True, priority=100)
+        can_match = patch.object(
+            _Pass, "can_match", autospec=True, side_effect=_Pass.can_match
+        )
+        with can_match as mock:
+            self.assertEqual(
+                rule_set.snapshot().top_k(dict(b=5), 2), ["b_5", "default"]
+            )
+        # The rules using a and c are not checked
+        self.assertEqual(mock.call_count, 21)
+
+    def test_invalid_priority(self):
+        with self.assertRaises(TypeError):
+            self.rule_set.add("other", ["==", ["key", "other"], 1], priority="x")
+        with self.assertRaises(TypeError):
+            self.rule_set.replace("us", ["==", ["key", "other"], 1], priority="x")
+        self.assertNotIn("other", self.rule_set)
+        self.assertEqual(self.rule_set.rules_for_key("other"), set())
+        self.assertEqual(self.rule_set.snapshot().first_match(dict(country="US")), "us")
+
+    def test_shared_subtrees_are_evaluated_once(self):
+        shared = [">", ["key", "age"], 18]
+        rule_set = RuleSet()
+        rule_set.add("a", ["and", shared, ["==", ["key", "country"], "FR"]])
+        rule_set.add("b", ["and", shared, ["==", ["key", "country"], "US"]])
+        context = dict(age=30, country="US")
+        with patch("json_operations.rule_set.execute", wraps=execute) as mock:
+            self.assertEqual(rule_set.snapshot().matches(context), ["b"])
+        self.assertEqual(mock.call_count, 3)
+
+    def test_never_match_fields(self):
+        rule_set = RuleSet(
+            {
+                "division": ["==", ["key", "division"], "east"],
+                "adult": [">=", ["key", "age"], 18],
+                "either": ["or", ["key", "vip"], ["==", ["key", "division"], "east"]],
+                "vip_division": ["and", ["key", "vip"], ["key", "division"]],
+                "division_set": ["key", "division"],
+            }
+        )
+        snapshot = rule_set.snapshot()
+        context = dict(division="east", age=30, vip=True)
+        never_match = dict(context, division=NEVER_MATCH)
+        self.assertEqual(
+            snapshot.execute(context, never_match=["division"]),
+            snapshot.execute(never_match),
+        )
+        self.assertEqual(
+            snapshot.matches(context, never_match={"division"}),
+            ["adult", "either", "division_set"],
+        )
+        self.assertEqual(
+            snapshot.top_k(context, 5, never_match=["division"]),
+            snapshot.top_k(never_match, 5),
+        )
+        self.assertEqual(snapshot.first_match(context, ["division", "age"]), "either")
+
+    def test_never_match_rules_are_pruned_once(self):
+        rule_set = RuleSet(
+            {
+                "division": ["==", ["key", "division"], "east"],
+                "adult": [">=", ["key", "age"], 18],
+            }
+        )
+        snapshot = rule_set.snapshot()
+        context = dict(division="east", age=30)
+        with patch("json_operations.rule_set.execute", wraps=execute) as mock:
+            self.assertEqual(snapshot.matches(context, ["division"]), ["adult"])
+            self.assertEqual(snapshot.matches(context, ["division"]), ["adult"])
+        mock.assert_called_with([">=", ["key", "age"], 18], context)
+        self.assertEqual(mock.call_count, 2)
+        self.assertEqual(
+            snapshot.matches(context),
+            ["division", "adult"],
+            "Not pruned without fields",
+        )
+
+    def test_never_match_rules_are_pruned_once_across_writes(self):
+        rule_set = RuleSet({"division": ["==", ["key", "division"], "east"]})
+        context = dict(division="east", age=30)
+        with patch(
+            "json_operations.rule_set._prune_never_match", wraps=_prune_never_match
+        ) as mock:
+            self.assertEqual(rule_set.snapshot().matches(context, ["division"]), [])
+            rule_set.add("adult", [">=", ["key", "age"], 18])
+            self.assertEqual(
+                rule_set.snapshot().matches(context, ["division"]), ["adult"]
+            )
+            self.assertEqual(mock.call_count, 1)
+            rule_set.add("west", ["==", ["key", "division"], "west"])
+            self.assertEqual(
+                rule_set.snapshot().matches(context, ["division"]), ["adult"]
+            )
+        self.assertEqual(mock.call_count, 2)
+
+    def test_never_match_errors(self):
+        snapshot = RuleSet({"a": [">", ["key", "a.b"], 1]}).snapshot()
+        with self.assertRaises(JsonOperationError):
+            snapshot.matches(dict(a=dict(b=2)), never_match=["a"])
+        with self.assertRaises(JsonOperationError):
+            snapshot.matches(dict(a=NEVER_MATCH))
+
+    @parameterized.expand(
+        [
+            (["&", ["key", "tags"], ["t3", "x"]],),
+            (["!&", ["key", "tags"], ["x", "y"]],),
+            (["&", ["x", "t5"], ["key", "tags"]],),
+            (["in", "t7", ["key", "tags"]],),
+            (["in", 7, ["key", "tags"]],),
+            (["nin", "t7", ["key", "tags"]],),
+            (["!in", "x", ["key", "tags"]],),
+            (["in", ["key", "tag"], ["key", "tags"]],),
+            (["in", ["key", "never"], ["key", "tags"]],),
+            (["!in", ["key", "never"], ["key", "tags"]],),
+            (["in", ["t1"], ["key", "tags"]],),
+            (["in", ["t1"], ["key", "nested"]],),
+            (["&", ["key", "nested"], [["t1"]]],),
+            (["&", ["key", "tags"], "t1"],),
+            (["in", "t", ["key", "text"]],),
+            (["&", ["key", "tags"], ["key", "missing"]],),
+        ]
+    )
+    def test_list_operators(self, operation):
+        context = dict(
+            tags=[f"t{i}" for i in range(100)],
+            nested=[[f"t{i}"] for i in range(100)],
+            tag="t50",
+            text="t" * 100,
+            never=NEVER_MATCH,
+        )
+        try:
+            expected = execute(operation, context)
+        except JsonOperationError as e:
+            with self.assertRaisesRegex(JsonOperationError, re.escape(str(e))):
+                _Pass(context).evaluate(operation)
+        else:
+            self.assertEqual(_Pass(context).evaluate(operation), expected)
+
+    def test_long_lists_are_hashed_once_per_pass(self):
+        rule_set = RuleSet(
+            {
+                "a": ["in", "t1", ["key", "tags"]],
+                "b": ["in", "x", ["key", "tags"]],
+                "c": ["&", ["key", "tags"], ["x", "t2"]],
+                "short": ["in", "x", ["key", "short"]],
+            }
+        )
+        context = dict(tags=[f"t{i}" for i in range(100)], short=["x"])
+        evaluation = _Pass(context)
+        results = [
+            evaluation.evaluate(operation) for _, operation in rule_set.snapshot()
+        ]
+        self.assertEqual(results, [True, False, True, True])
+        # The tags, and the literal list they are intersected with
+        self.assertEqual(evaluation._hashed_items, 102)
+        self.assertEqual(len(evaluation._sets), 2)
+
+    def test_hashed_items_are_bounded(self):
+        context = dict(tags=[f"t{i}" for i in range(100)])
+        with patch("json_operations.rule_set._MAX_HASHED_ITEMS", 50):
+            evaluation = _Pass(context)
+            self.assertTrue(evaluation.evaluate(["in", "t1", ["key", "tags"]]))
+            self.assertFalse(evaluation.evaluate(["in", "x", ["key", "tags"]]))
+        self.assertEqual(evaluation._sets, {})
+
+    @parameterized.expand(
+        [
+            ([">", ["key", "a"], 1], {"a"}),
+            (["<", ["key", "a"], ["key", "b"]], {"a", "b"}),
+            (["==", ["key", "a"], 1], {"a"}),
+            (["==", ["key", "a"], None], set()),
+            (["==", ["key", "a"], ["key", "b"]], set()),
+            (["!=", 1, ["key", "a"]], {"a"}),
+            (["in", ["key", "a"], [1, 2]], {"a"}),
+            (["in", ["key", "a"], [1, None]], set()),
+            (["in", ["key", "a"], "abc"], {"a"}),
+            (["nin", ["key", "a"], [1, 2]], set()),
+            (["!in", ["key", "a"], [1, None]], {"a"}),
+            (["in", 1, ["key", "a"]], {"a"}),
+            (["btw", ["key", "a"], [1, 2]], {"a"}),
+            (["&", ["key", "a"], [1, 2]], {"a"}),
+            (["null", ["key", "a"]], set()),
+            (["!null", ["key", "a"]], {"a"}),
+            (["key", "a"], {"a"}),
+            (["key", "a", 1], set()),
+            (["and", ["key", "a"], [">", ["key", "b"], 1]], {"a", "b"}),
+            (["or", [">", ["key", "a"], 1], [">", ["key", "b"], 1]], set()),
+            (
+                ["or", [">", ["key", "a"], 1], ["and", ["key", "a"], ["key", "b"]]],
+                {"a"},
+            ),
+            (["or"], set()),
+            (True, set()),
+        ]
+    )
+    def test_required_keys(self, operation, keys):
+        self.assertEqual(_required_keys(operation), keys)
+        # Without a required key the operation is never True
+        for key in keys:
+            context = {other: 1 for other in ("a", "b") if other != key}
+            try:
+                self.assertFalse(execute(operation, context))
+            except JsonOperationError:
+                pass
@@ -0,0 +1,231 @@
+import os
+import tempfile
+import threading
+from unittest import TestCase, mock
+
+from json_operations import JsonOperationError
+from json_operations.batch import execute_batch
+from json_operations.server import (
+    Evaluator,
+    _Evaluation,
+    connect,
+    make_server,
+    request,
+    run_load,
+)
+
+RULES = {
+    "adult": [">=", ["key", "age"], 18],
+    "admin": ["in", "admin", ["key", "roles"]],
+}
+
+
+class TestEvaluator(TestCase):
+    def setUp(self):
+        self.evaluator = Evaluator(max_delay=0.01)
+        self.addCleanup(self.evaluator.close)
+
+    def test_coalesces_requests(self):
+        self.evaluator.set_rule_set("users", RULES)
+        results = {}
+
+        def evaluate(age):
+            results[age] = self.evaluator.evaluate(
+                [dict(age=age, roles=[])], rule_set="users"
+            )
+
+        threads = [threading.Thread(target=evaluate, args=(a,)) for a in range(30)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results[10], [[]])
+        self.assertEqual(results[20], [["adult"]])
+        metrics = self.evaluator.metrics.report()
+        self.assertEqual(metrics["requests"], 30)
+        self.assertLess(metrics["batches"], 30)
+
+    def test_operation_errors_are_isolated(self):
+        operation = [">", ["key", "a"], 1]
+        results = {}
+
+        def evaluate(context):
+            try:
+                results[str(context)] = self.evaluator.evaluate(
+                    [context], operation=operation
+                )
+            except Exception as e:
+                results[str(context)] = type(e)
+
+        contexts = [dict(a=2), dict(b=2), dict(a=0)]
+        threads = [threading.Thread(target=evaluate, args=(c,)) for c in contexts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results[str(dict(a=2))], [True])
+        self.assertEqual(results[str(dict(a=0))], [False])
+        self.assertNotIsInstance(results[str(dict(b=2))], list)
+
+    def test_rule_sets_are_evaluated_in_one_pass(self):
+        self.evaluator.set_rule_set("users", RULES)
+        self.evaluator.set_rule_set("other", {"a": ["key", "a"]})
+        evaluations = [
+            _Evaluation(
+                "users", None, [dict(age=20, roles=["admin"]), dict(age=1, roles=[])]
+            ),
+            _Evaluation("users", None, [dict(age=10, roles=["admin"])]),
+            _Evaluation("other", None, [dict(a=1)]),
+            _Evaluation("users", None, [dict(age="x", roles=[])]),
+        ]
+        with mock.patch(
+            "json_operations.server.execute_batch", wraps=execute_batch
+        ) as batch:
+            self.evaluator._evaluate(evaluations)
+
+        self.assertEqual(evaluations[0].results, [["adult", "admin"], []])
+        self.assertEqual(evaluations[1].results, [["admin"]])
+        self.assertEqual(evaluations[2].results, [["a"]])
+        # Only the request that failed gets the error
+        self.assertIsInstance(evaluations[3].error, JsonOperationError)
+        self.assertTrue(all(evaluation.done.is_set() for evaluation in evaluations))
+        # One call per rule for all the contexts of a rule set
+        self.assertEqual([len(call.args[1]) for call in batch.call_args_list], [4, 1])
+
+    def test_unknown_rule_set(self):
+        with self.assertRaises(KeyError):
+            self.evaluator.evaluate([{}], rule_set="missing")
+
+
+class TestServer(TestCase):
+    def _serve(self, **kwargs):
+        evaluator = Evaluator()
+        server = make_server(evaluator, **kwargs)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        def stop():
+            server.shutdown()
+            server.server_close()
+            evaluator.close()
+
+        self.addCleanup(stop)
+        return server
+
+    def _check_protocol(self, connection):
+        self.assertEqual(
+            request(connection, "PUT", "/rule-sets/users", {"rules": RULES}),
+            (200, {"rule_set": "users"}),
+        )
+        self.assertEqual(request(connection, "GET", "/rule-sets"), (200, {"users": 2}))
+        self.assertEqual(
+            request(
+                connection,
+                "POST",
+                "/evaluate",
+                {"rule_set": "users", "context": {"age": 30, "roles": ["admin"]}},
+            ),
+            (200, {"matches": ["adult", "admin"]}),
+        )
+        self.assertEqual(
+            request(
+                connection,
+                "POST",
+                "/evaluate",
+                {
+                    "operation": ["==", ["key", "a"], 1],
+                    "contexts": [{"a": 1}, {"a": 2}],
+                },
+            ),
+            (200, {"results": [True, False]}),
+        )
+        status, body = request(
+            connection,
+            "POST",
+            "/evaluate",
+            {"operation": [">", ["key", "a"], 1], "context": {}},
+        )
+        self.assertEqual(status, 400)
+        self.assertIn("error", body)
+        self.assertEqual(
+            request(connection, "DELETE", "/rule-sets/users"),
+            (200, {"rule_set": "users"}),
+        )
+        self.assertEqual(request(connection, "DELETE", "/rule-sets/users")[0], 404)
+
+        status, metrics = request(connection, "GET", "/metrics")
+        self.assertEqual(status, 200)
+        self.assertEqual(metrics["requests"], 3)
+        self.assertEqual(metrics["errors"], 1)
+
+    def test_tcp(self):
+        server = self._serve(port=0)
+        port = server.server_address[1]
+        connection = connect(port=port)
+        self.addCleanup(connection.close)
+        self._check_protocol(connection)
+
+        report = run_load(
+            {"operation": ["==", ["key", "a"], 1], "context": {"a": 1}},
+            requests=50,
+            concurrency=4,
+            port=port,
+        )
+        self.assertEqual(report["requests"], 50)
+        self.assertEqual(report["errors"], 0)
+
+    def test_errors_keep_the_connection(self):
+        server = self._serve(port=0)
+        connection = connect(port=server.server_address[1])
+        self.addCleanup(connection.close)
+        for body in [
+            # Index out of range
+            {"operation": ["==", ["key", "a.1"], 1], "context": {"a": [1]}},
+            # Empty literal list
+            {"operation": ["==", ["key", "a"], []], "context": {"a": 1}},
+            {"operation": ["==", ["key", "a"], 1], "contexts": 1},
+        ]:
+            status, response = request(connection, "POST", "/evaluate", body)
+            self.assertEqual(status, 400)
+            self.assertIn("error", response)
+        self.assertEqual(
+            request(connection, "PUT", "/rule-sets/empty", {"rules": {"a": []}})[0],
+            400,
+        )
+        with mock.patch.object(Evaluator, "evaluate", side_effect=RuntimeError("x")):
+            self.assertEqual(
+                request(
+                    connection, "POST", "/evaluate", {"operation": True, "context": {}}
+                ),
+                (500, {"error": "RuntimeError: x"}),
+            )
+        self.assertEqual(request(connection, "GET", "/rule-sets"), (200, {}))
+
+    def test_not_found_keeps_the_connection(self):
+        server = self._serve(port=0)
+        connection = connect(port=server.server_address[1])
+        self.addCleanup(connection.close)
+        body = {"rule_set": "users", "context": {}}
+        self.assertEqual(request(connection, "POST", "/wrong", body)[0], 404)
+        self.assertEqual(request(connection, "PUT", "/wrong", body)[0], 404)
+        self.assertEqual(request(connection, "DELETE", "/rule-sets/x", body)[0], 404)
+        self.assertEqual(
+            request(
+                connection,
+                "POST",
+                "/evaluate",
+                {"operation": ["==", ["key", "a"], 1], "context": {"a": 1}},
+            ),
+            (200, {"result": True}),
+        )
+
+    def test_unix_socket(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "socket")
+        self._serve(unix_socket=path)
+        connection = connect(unix_socket=path)
+        self.addCleanup(connection.close)
+        self._check_protocol(connection)
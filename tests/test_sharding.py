@@ -0,0 +1,110 @@
+from unittest import TestCase
+
+from json_operations import NEVER_MATCH, JsonOperationError
+from json_operations.rule_set import RuleSet
+from json_operations.sharding import ShardedRuleSet
+
+RULES = {
+    "adult": [">=", ["key", "user.age"], 18],
+    "minor": ["<", ["key", "user.age"], 18],
+    "us": ["==", ["key", "user.country"], "US"],
+    "us_adult": [
+        "and",
+        ["==", ["key", "user.country"], "US"],
+        [">=", ["key", "user.age"], 18],
+    ],
+    "vip": ["key", "user.vip"],
+    "first_item": [">", ["key", "items.0.price"], 10],
+    "tagged": ["&", ["key", "tags"], ["a", "b"]],
+    "no_country": ["null", ["key", "user.country"]],
+    "literal": True,
+}
+
+CONTEXTS = [
+    dict(user=dict(age=30, country="US", vip=True), items=[dict(price=20)]),
+    dict(user=dict(age=10, country="CA"), tags=["a"]),
+    dict(user=dict(age=40), items=[dict(price=5)]),
+    dict(user=dict(vip=NEVER_MATCH), tags=["c"]),
+    dict(user="x"),
+    {},
+]
+
+
+def _expected(rules, context):
+    rule_set = RuleSet(rules)
+    return rule_set.snapshot().top_k(context, len(rule_set))
+
+
+class TestShardedRuleSet(TestCase):
+    def sharded(self, rules=None, **kwargs) -> ShardedRuleSet:
+        sharded = ShardedRuleSet(rules, shards=2, **kwargs)
+        self.addCleanup(sharded.close)
+        return sharded
+
+    def test_same_matches_as_rule_set(self):
+        sharded = self.sharded(RULES)
+        self.assertEqual(len(sharded), len(RULES))
+        self.assertEqual(
+            sharded.matches_batch(CONTEXTS),
+            [_expected(RULES, context) for context in CONTEXTS],
+        )
+        self.assertEqual(sharded.matches(CONTEXTS[0]), _expected(RULES, CONTEXTS[0]))
+
+    def test_never_match(self):
+        sharded = self.sharded({"vip": RULES["vip"], "and": ["and", ["key", "a"]]})
+        self.assertEqual(sharded.matches(dict(user=dict(vip=NEVER_MATCH))), ["vip"])
+        self.assertEqual(sharded.matches(dict(a=NEVER_MATCH)), [])
+
+    def test_groups_rules_by_keys(self):
+        rules = {}
+        for i in range(20):
+            rules[f"age_{i}"] = [">", ["key", "age"], i]
+            rules[f"name_{i}"] = ["==", ["key", "name"], str(i)]
+        sharded = self.sharded(rules)
+        stats = sharded.stats()
+        self.assertEqual([shard.rules for shard in stats], [20, 20])
+        self.assertEqual(
+            {shard.keys for shard in stats},
+            {frozenset(["age"]), frozenset(["name"])},
+        )
+        self.assertEqual(sharded.matches(dict(age=10)), [f"age_{i}" for i in range(10)])
+
+    def test_rebalance(self):
+        sharded = self.sharded(tolerance=0)
+        sharded.update({f"age_{i}": [">", ["key", "age"], i] for i in range(10)})
+        sharded.update(
+            {f"name_{i}": ["==", ["key", "name"], str(i)] for i in range(10)}
+        )
+        sharded.remove_many([f"age_{i}" for i in range(8)])
+        self.assertEqual([shard.rules for shard in sharded.stats()], [6, 6])
+        self.assertEqual(
+            sharded.matches(dict(age=10, name="1")), ["age_8", "age_9", "name_1"]
+        )
+
+        sharded.add("age_0", [">", ["key", "age"], 0])
+        sharded.remove("name_1")
+        self.assertEqual(sorted(shard.rules for shard in sharded.stats()), [6, 6])
+        self.assertEqual(
+            sharded.matches(dict(age=10, name="1")), ["age_8", "age_9", "age_0"]
+        )
+
+    def test_duplicate_and_missing_rules(self):
+        sharded = self.sharded({"a": ["null", ["key", "a"]]})
+        with self.assertRaises(KeyError):
+            sharded.update({"b": ["null", ["key", "b"]], "a": ["null", ["key", "a"]]})
+        self.assertNotIn("b", sharded)
+        with self.assertRaises(KeyError):
+            sharded.remove("missing")
+        self.assertEqual(sharded.matches({}), ["a"])
+
+    def test_errors_are_raised(self):
+        sharded = self.sharded({"age": [">", ["key", "age"], 18]})
+        with self.assertRaises(JsonOperationError):
+            sharded.matches(dict(age="x"))
+        self.assertEqual(sharded.matches(dict(age=20)), ["age"])
+
+    def test_close(self):
+        sharded = ShardedRuleSet(RULES, shards=2)
+        processes = [shard.process for shard in sharded._shards]
+        sharded.close()
+        self.assertFalse(any(process.is_alive() for process in processes))
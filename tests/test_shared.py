@@ -0,0 +1,97 @@
+import json
+import multiprocessing
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from json_operations import JsonOperationError, execute
+from json_operations.shared import SharedRuleStore, publish
+
+RULES = {
+    "adult": [">=", ["key", "age"], 18],
+    "admin": ["in", "admin", ["key", "roles"]],
+    "both": [
+        "and",
+        [">=", ["key", "age"], 18],
+        ["in", "admin", ["key", "roles"]],
+    ],
+}
+
+
+def _matches(arguments):
+    path, context = arguments
+    return SharedRuleStore(path).matches(context)
+
+
+class TestSharedRuleStore(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "rules")
+
+    def test_publish_and_attach(self):
+        self.assertEqual(publish(self.path, RULES), 1)
+        store = SharedRuleStore(self.path)
+        self.assertEqual(store.generation, 1)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(dict(store), RULES)
+        self.assertEqual(store.get("admin"), RULES["admin"])
+        self.assertIsNone(store.get("missing"))
+
+        context = dict(age=30, roles=["admin"])
+        self.assertEqual(
+            store.execute(context),
+            {rule_id: execute(op, context) for rule_id, op in RULES.items()},
+        )
+        self.assertEqual(store.matches(dict(age=12, roles=["admin"])), ["admin"])
+
+    def test_refresh(self):
+        publish(self.path, RULES)
+        store = SharedRuleStore(self.path)
+        self.assertFalse(store.refresh())
+
+        iterator = iter(store)
+        publish(self.path, [(1, ["==", ["key", "a"], 1])])
+        self.assertTrue(store.refresh())
+        self.assertEqual(store.generation, 2)
+        self.assertEqual(store.matches(dict(a=1)), [1])
+        # An iteration started before the refresh keeps the old version
+        self.assertEqual(len(list(iterator)), 3)
+
+    def test_rule_ids(self):
+        rules = [(1, True), (1.5, True), ("1", True), (None, True), (False, True)]
+        publish(self.path, rules)
+        store = SharedRuleStore(self.path)
+        self.assertEqual(list(store), rules)
+        self.assertEqual(store.matches({}), [1, 1.5, "1", None, False])
+        self.assertTrue(store.get(1))
+
+        for rule_id in [("a", 1), ["a"], {"a": 1}]:
+            with self.assertRaises(TypeError):
+                publish(self.path, [(rule_id, True)])
+        self.assertEqual(SharedRuleStore(self.path).generation, 1)
+
+    def test_decodes_once(self):
+        publish(self.path, RULES)
+        store = SharedRuleStore(self.path)
+        with mock.patch("json_operations.shared.json.loads", wraps=json.loads) as loads:
+            for _ in range(3):
+                self.assertEqual(dict(store), RULES)
+                store.matches(dict(age=30, roles=[]))
+        self.assertEqual(loads.call_count, 2 * len(RULES))
+        # Identical subtrees of the decoded operations are shared
+        operations = dict(store)
+        self.assertIs(operations["both"][1], operations["adult"])
+
+    def test_not_a_store(self):
+        with open(self.path, "wb") as f:
+            f.write(b"x" * 64)
+        with self.assertRaises(JsonOperationError):
+            SharedRuleStore(self.path)
+
+    def test_multiple_processes(self):
+        publish(self.path, RULES)
+        contexts = [dict(age=age, roles=["admin"]) for age in (10, 20)]
+        with multiprocessing.Pool(2) as pool:
+            results = pool.map(_matches, [(self.path, c) for c in contexts])
+        self.assertEqual(results, [["admin"], ["adult", "admin", "both"]])
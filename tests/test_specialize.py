@@ -0,0 +1,153 @@
+import itertools
+from unittest import TestCase
+
+from parameterized import parameterized
+
+from json_operations import NEVER_MATCH, JsonOperationError, execute, get_keys
+from json_operations.specialize import prune_never_match, specialize
+
+OPERATION = [
+    "and",
+    ["==", ["key", "tenant.plan"], "pro"],
+    [
+        "or",
+        ["in", ["key", "tenant.region"], ["eu", "us"]],
+        [">", ["key", "request.amount"], ["key", "tenant.limit"]],
+    ],
+    ["!null", ["key", "request.user"]],
+]
+
+TENANTS = [
+    dict(plan="pro", region="eu", limit=10),
+    dict(plan="pro", region="ap", limit=10),
+    dict(plan="free", region="eu", limit=10),
+]
+REQUESTS = [
+    dict(amount=5, user="a"),
+    dict(amount=50, user="b"),
+    dict(amount=50, user=None),
+]
+
+
+class TestSpecialize(TestCase):
+    @parameterized.expand(
+        [
+            (
+                dict(plan="pro", region="eu", limit=10),
+                ["!null", ["key", "request.user"]],
+            ),
+            (
+                dict(plan="pro", region="ap", limit=10),
+                [
+                    "and",
+                    [">", ["key", "request.amount"], 10],
+                    ["!null", ["key", "request.user"]],
+                ],
+            ),
+            (dict(plan="free", region="eu", limit=10), False),
+        ]
+    )
+    def test_residual(self, tenant, expected):
+        self.assertEqual(specialize(OPERATION, dict(tenant=tenant)), expected)
+
+    def test_same_results(self):
+        for tenant, request in itertools.product(TENANTS, REQUESTS):
+            residual = specialize(OPERATION, dict(tenant=tenant))
+            context = dict(tenant=tenant, request=request)
+            self.assertEqual(execute(residual, context), execute(OPERATION, context))
+
+    def test_get_keys_of_residual(self):
+        residual = specialize(OPERATION, dict(tenant=TENANTS[1]))
+        self.assertEqual(
+            {key["name"] for key in get_keys(residual)},
+            {"request.amount", "request.user"},
+        )
+
+    def test_nothing_known(self):
+        self.assertEqual(specialize(OPERATION, {}), OPERATION)
+
+    @parameterized.expand(
+        [
+            (["and"], True),
+            (["or"], False),
+            (["key", "a"], 3),
+            (["and", ["key", "a"], ["key", "b"]], ["and", ["key", "b"]]),
+            (["or", ["key", "a"], ["key", "b"]], ["or", True, ["key", "b"]]),
+            (["or", ["key", "z"], ["==", ["key", "b"], 1]], ["==", ["key", "b"], 1]),
+            (["==", ["key", "never"], ["key", "b"]], False),
+            (["and", ["key", "never"], ["key", "b"]], False),
+            (["or", ["key", "never"], ["key", "b"]], False),
+            (
+                ["==", ["key", "empty"], ["key", "b"]],
+                ["==", ["key", "empty"], ["key", "b"]],
+            ),
+        ]
+    )
+    def test_folding(self, operation, expected):
+        known = dict(a=3, z=0, never=NEVER_MATCH, empty=[])
+        self.assertEqual(specialize(operation, known), expected)
+
+    @parameterized.expand(
+        [
+            (dict(b=0),),
+            (dict(b=1),),
+            (dict(b=NEVER_MATCH),),
+            (dict(),),
+        ]
+    )
+    def test_never_match_unknown_key(self, context):
+        # b is unknown and may turn out to be NEVER_MATCH
+        operation = ["or", ["key", "a"], ["key", "b"]]
+        residual = specialize(operation, dict(a=True))
+        context = dict(context, a=True)
+        self.assertEqual(execute(residual, context), execute(operation, context))
+
+    def test_errors(self):
+        with self.assertRaises(JsonOperationError):
+            specialize(["and", [">", ["key", "a"], 1], ["key", "b"]], dict(a="x"))
+        with self.assertRaises(JsonOperationError):
+            specialize(["~", ["key", "a"], 1], {})
+
+
+class TestPruneNeverMatch(TestCase):
+    @parameterized.expand(
+        [
+            ([">", ["key", "a"], 1], ["a"], False),
+            (["and", ["key", "a"], [">", ["key", "b"], 1]], ["a"], False),
+            (["or", ["key", "a"], [">", ["key", "b"], 1]], ["a"], False),
+            (["or", [">", ["key", "a"], 1], ["key", "b"]], ["a"], ["or", ["key", "b"]]),
+            (["key", "a"], ["a"], NEVER_MATCH),
+            (["null", ["key", "a.b"]], ["a"], True),
+            (["and", ["key", "a.b", 1], ["key", "c"]], ["a"], ["and", ["key", "c"]]),
+            ([">", ["key", "c"], 1], ["a"], [">", ["key", "c"], 1]),
+            (["null", ["key", "a"]], ["a.b"], ["null", ["key", "a"]]),
+        ]
+    )
+    def test_pruning(self, operation, fields, expected):
+        self.assertEqual(prune_never_match(operation, fields), expected)
+
+    @parameterized.expand(
+        [
+            (dict(a=dict(b=1), b=2, c=3),),
+            (dict(a=None, b=0),),
+            (dict(b=NEVER_MATCH),),
+            (dict(),),
+        ]
+    )
+    def test_same_results(self, context):
+        operations = [
+            ["or", [">", ["key", "a"], 1], ["key", "b"]],
+            ["and", ["key", "a.b", 1], ["key", "c"]],
+            ["or", ["null", ["key", "a.b"]], ["key", "c"]],
+            ["!null", ["key", "b"]],
+        ]
+        for operation in operations:
+            residual = prune_never_match(operation, ["a"])
+            if isinstance(residual, list):
+                residual = execute(residual, context)
+            self.assertEqual(residual, execute(operation, dict(context, a=NEVER_MATCH)))
+
+    def test_errors(self):
+        # a.b is None when a is NEVER_MATCH
+        with self.assertRaises(JsonOperationError):
+            prune_never_match([">", ["key", "a.b"], 1], ["a"])
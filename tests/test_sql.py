@@ -0,0 +1,225 @@
+import json
+import sqlite3
+from unittest import TestCase
+
+from parameterized import parameterized
+
+from json_operations import JsonOperationError, execute
+from json_operations.sql import to_sql
+
+ROWS = [
+    dict(
+        age=31,
+        name="bob",
+        user=dict(
+            country="US",
+            score=1.5,
+            vip=True,
+            tags=["a", "b"],
+            prefs=dict(a=1),
+            nested=[[1, 2], 3],
+            ids={"1": 5},
+        ),
+        bio="likes sql",
+    ),
+    dict(
+        age=17,
+        name="alice",
+        user=dict(
+            country="FR",
+            score=None,
+            vip=False,
+            tags=["c"],
+            prefs=["b"],
+            nested=[1, 2],
+            ids=[4, 5],
+        ),
+        bio="",
+    ),
+    dict(age=45, name="carol", user=dict(country="US", score=3.0, tags=[], prefs={})),
+    dict(age=30, name="dan", user=dict(country=None, score=2, vip=True, tags=[1])),
+    dict(age=None, name="eve", user=dict(nested=[[1], {"a": 1}]), bio="sql"),
+    dict(age=0, name="", user=dict(nested="[1, 2]", ids={"0": None, "1": "5"})),
+]
+
+OPERATIONS = [
+    [">", ["key", "age"], 30],
+    ["<", 30, ["key", "age"]],
+    ["==", ["key", "name"], "bob"],
+    ["!=", ["key", "name"], "bob"],
+    ["==", ["key", "age"], None],
+    ["!=", ["key", "age"], None],
+    ["==", ["key", "user.country"], "US"],
+    [">=", ["key", "user.score"], 2],
+    ["==", ["key", "user.vip"], True],
+    ["==", ["key", "user.tags"], ["a", "b"]],
+    ["in", ["key", "name"], ["bob", "carol"]],
+    ["nin", ["key", "name"], ["bob", "carol"]],
+    ["in", ["key", "user.country"], ["US", None]],
+    ["!in", ["key", "user.country"], ["US"]],
+    ["in", ["key", "user.country"], ["DE"]],
+    ["in", ["key", "name"], "alice and bob"],
+    ["in", "a", ["key", "user.tags"]],
+    ["in", 1, ["key", "user.tags"]],
+    ["!in", "a", ["key", "user.tags"]],
+    ["in", "sql", ["key", "bio"]],
+    ["btw", ["key", "age"], [18, 40]],
+    ["btw", ["key", "user.score"], [1, 2.5]],
+    ["null", ["key", "user.country"]],
+    ["!null", ["key", "user.country"]],
+    ["null", ["key", "user.missing"]],
+    ["null", ["key", "age"]],
+    ["&", ["key", "user.tags"], ["b", "c"]],
+    ["!&", ["key", "user.tags"], ["b", "c"]],
+    ["&", ["b", "c"], ["key", "user.tags"]],
+    ["==", ["key", "name"], ["key", "name"]],
+    ["==", ["key", "user.country"], ["key", "user.missing"]],
+    ["!=", ["key", "user.country"], ["key", "user.missing"]],
+    ["==", ["key", "age"], ["key", "user.score"]],
+    ["!=", ["key", "user.score"], ["key", "age"]],
+    ["in", "a", ["key", "user.prefs"]],
+    ["nin", "a", ["key", "user.prefs"]],
+    ["!in", "b", ["key", "user.prefs"]],
+    ["in", 1, ["key", "user.prefs"]],
+    ["in", [1, 2], ["key", "user.nested"]],
+    ["!in", [1, 2], ["key", "user.nested"]],
+    ["in", {"a": 1}, ["key", "user.nested"]],
+    ["in", None, ["key", "user.tags"]],
+    ["in", ["key", "user.nested"], [[1, 2], 3]],
+    ["nin", ["key", "user.tags"], [["a", "b"], "c"]],
+    ["&", ["key", "user.tags"], [1, None]],
+    ["==", ["key", "user.ids.1"], 5],
+    ["==", ["key", "user.ids.-1"], 5],
+    ["null", ["key", "user.ids.0"]],
+    ["key", "user.ids.1"],
+    ["==", ["key", "user.nested.0.0"], 1],
+    ["key", "name"],
+    ["key", "age"],
+    ["==", 1, 1],
+    [
+        "and",
+        [">", ["key", "age"], 18],
+        ["or", ["in", ["key", "user.country"], ["US"]], ["key", "user.vip"]],
+    ],
+    ["or", ["key", "user.tags"], ["key", "bio"], ["key", "user.score"]],
+    ["and", ["key", "user.vip"], True],
+    ["or", False, ["!null", ["key", "age"]]],
+    ["and"],
+    ["or"],
+]
+
+
+class TestSql(TestCase):
+    def setUp(self):
+        self.connection = sqlite3.connect(":memory:")
+        self.connection.execute(
+            "CREATE TABLE events (id INTEGER, age INTEGER, name TEXT, context TEXT)"
+        )
+        self.connection.executemany(
+            "INSERT INTO events VALUES (?, ?, ?, ?)",
+            [
+                (index, row["age"], row["name"], json.dumps(row))
+                for index, row in enumerate(ROWS)
+            ],
+        )
+
+    def tearDown(self):
+        self.connection.close()
+
+    def select(self, where, params):
+        cursor = self.connection.execute(
+            f"SELECT id FROM events WHERE {where} ORDER BY id", params
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+    @parameterized.expand([(operation,) for operation in OPERATIONS])
+    def test_matches_execute(self, operation):
+        # Rows execute() raises an error for have no defined result
+        expected = []
+        defined = set()
+        for index, row in enumerate(ROWS):
+            try:
+                result = execute(operation, row)
+            except JsonOperationError:
+                continue
+            defined.add(index)
+            if result:
+                expected.append(index)
+        self.assertTrue(defined)
+
+        for key_mapping in (
+            dict(age="age", name="name"),
+            dict(user="json_extract(context, '$.user')"),
+        ):
+            where, params = to_sql(
+                operation, key_mapping=key_mapping, json_column="context"
+            )
+            matched = [
+                index for index in self.select(where, params) if index in defined
+            ]
+            self.assertEqual(matched, expected, where)
+
+    def test_literals_are_parameters(self):
+        where, params = to_sql(
+            ["==", ["key", "name"], "'; DROP TABLE events; --"],
+            key_mapping=dict(name="name"),
+        )
+        self.assertEqual(where, "name = ?")
+        self.assertEqual(params, ["'; DROP TABLE events; --"])
+        self.assertEqual(self.select(where, params), [])
+
+    def test_postgres(self):
+        self.assertEqual(
+            to_sql(
+                ["and", [">", ["key", "age"], 30], ["in", ["key", "user.tier"], ["a"]]],
+                dialect="postgres",
+                key_mapping=dict(age="age"),
+                json_column="context",
+            ),
+            (
+                "(age > %s AND (COALESCE((context #> %s::text[]) IN (%s::jsonb), FALSE)))",
+                [30, ["user", "tier"], '"a"'],
+            ),
+        )
+        self.assertEqual(
+            to_sql(
+                ["!=", ["key", "age"], ["key", "user.age"]],
+                dialect="postgres",
+                key_mapping=dict(age="age"),
+                json_column="context",
+            ),
+            (
+                "NOT (age IS NOT DISTINCT FROM "
+                "NULLIF((context #> %s::text[]), 'null'::jsonb))",
+                [["user", "age"]],
+            ),
+        )
+        # Only elements of the array itself are compared, unlike with @>
+        self.assertEqual(
+            to_sql(["in", 1, ["key", "tags"]], dialect="postgres", json_column="c"),
+            (
+                "COALESCE(CASE jsonb_typeof((c #> %s::text[])) "
+                "WHEN 'array' THEN EXISTS (SELECT 1 FROM "
+                "jsonb_array_elements((c #> %s::text[])) AS e(value) "
+                "WHERE e.value = %s::jsonb) "
+                "WHEN 'object' THEN FALSE "
+                "WHEN 'string' THEN strpos(((c #> %s::text[]) #>> '{}'), %s) > 0 END, "
+                "FALSE)",
+                [["tags"], ["tags"], "1", ["tags"], 1],
+            ),
+        )
+
+    @parameterized.expand(
+        [
+            (["==", ["key", "a"], 1], "sqlite", None),
+            ([">", ["key", "a"], None], "sqlite", "context"),
+            (["btw", ["key", "a"], [1, "2"]], "sqlite", "context"),
+            (["&", ["key", "a"], ["key", "b"]], "sqlite", "context"),
+            (["&", ["key", "a"], [[1], 2]], "sqlite", "context"),
+            (["bad", ["key", "a"], 1], "sqlite", "context"),
+            (["==", ["key", "a"], 1], "mysql", "context"),
+        ]
+    )
+    def test_errors(self, operation, dialect, json_column):
+        with self.assertRaises(JsonOperationError):
+            to_sql(operation, dialect=dialect, json_column=json_column)
@@ -0,0 +1,146 @@
+from unittest import TestCase, skipIf
+
+from parameterized import parameterized
+
+from json_operations import JsonOperationError, execute
+from json_operations.table import execute_table
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+ROWS = [
+    dict(age=31, name="bob", user=dict(country="US", score=1.5), tags=["a", "b"]),
+    dict(age=17, name="alice", user=dict(country="FR", score=None), tags=["c"]),
+    dict(age=45, name="carol", user=dict(country="US", score=3.0), tags=[]),
+    dict(age=30, name="dan", user=dict(country=None, score=2.0), tags=["a"]),
+]
+
+OPERATIONS = [
+    [">", ["key", "age"], 30],
+    [">=", ["key", "age"], 30.5],
+    ["<", 30, ["key", "age"]],
+    ["==", ["key", "name"], "bob"],
+    ["!=", ["key", "name"], "bob"],
+    ["<=", ["key", "name"], "bob"],
+    ["in", ["key", "name"], ["bob", "carol"]],
+    ["nin", ["key", "name"], ["bob", "carol"]],
+    ["in", ["key", "user.country"], ["US", None]],
+    ["!in", ["key", "user.country"], ["US"]],
+    ["in", ["key", "age"], [17, 45.0]],
+    ["btw", ["key", "age"], [18, 40]],
+    ["null", ["key", "user.country"]],
+    ["!null", ["key", "user.country"]],
+    ["null", ["key", "user.missing"]],
+    ["null", ["key", "missing"]],
+    ["==", ["key", "missing"], None],
+    ["in", "a", ["key", "tags"]],
+    ["&", ["key", "tags"], ["b", "c"]],
+    ["!&", ["key", "tags"], ["b", "c"]],
+    ["==", ["key", "name"], ["key", "name"]],
+    ["==", 1, 1],
+    [
+        "and",
+        [">", ["key", "age"], 18],
+        [
+            "or",
+            ["in", ["key", "user.country"], ["US"]],
+            ["null", ["key", "user.score"]],
+        ],
+    ],
+    ["or", ["key", "tags"], [">", ["key", "age"], 40]],
+    ["and"],
+    ["or"],
+]
+
+ERRORS = [
+    # Comparing with a missing value
+    ["==", ["key", "user.country"], "US"],
+    [">", ["key", "user.score"], 1],
+    ["btw", ["key", "user.score"], [1, 2]],
+    # Comparing different types
+    [">", ["key", "name"], 1],
+    ["==", ["key", "age"], True],
+    ["btw", ["key", "age"], [1, "2"]],
+    ["&", ["key", "name"], ["a"]],
+    ["bad", ["key", "name"], ["a"]],
+]
+
+
+class _TableTestMixin:
+    @parameterized.expand([(operation,) for operation in OPERATIONS])
+    def test_matches_execute(self, operation):
+        expected = [bool(execute(operation, row)) for row in ROWS]
+        self.assertEqual(self.mask(execute_table(operation, self.table())), expected)
+
+    @parameterized.expand([(operation,) for operation in ERRORS])
+    def test_errors_match_execute(self, operation):
+        with self.assertRaises(JsonOperationError):
+            for row in ROWS:
+                execute(operation, row)
+        with self.assertRaises(JsonOperationError):
+            execute_table(operation, self.table())
+
+
+@skipIf(pd is None, "pandas is not installed")
+class TestPandasTable(_TableTestMixin, TestCase):
+    def table(self):
+        return pd.json_normalize(ROWS)
+
+    def mask(self, mask):
+        self.assertIsInstance(mask, pd.Series)
+        return mask.tolist()
+
+    def test_filter(self):
+        filtered = execute_table([">", ["key", "age"], 30], self.table(), filter=True)
+        self.assertEqual(filtered["name"].tolist(), ["bob", "carol"])
+
+    def test_nested_dict_column(self):
+        table = pd.DataFrame(dict(user=[row["user"] for row in ROWS]))
+        mask = execute_table(["in", ["key", "user.score"], [2.0]], table)
+        self.assertEqual(mask.tolist(), [False, False, False, True])
+
+
+@skipIf(pa is None, "pyarrow is not installed")
+class TestArrowTable(_TableTestMixin, TestCase):
+    def table(self):
+        return pa.Table.from_pylist(ROWS)
+
+    def mask(self, mask):
+        self.assertIsInstance(mask, pa.BooleanArray)
+        return mask.to_pylist()
+
+    def test_filter(self):
+        filtered = execute_table([">", ["key", "age"], 30], self.table(), filter=True)
+        self.assertEqual(filtered.column("name").to_pylist(), ["bob", "carol"])
+
+    def test_null_struct(self):
+        table = pa.Table.from_pylist([dict(user=None), dict(user=dict(country="US"))])
+        mask = execute_table(["null", ["key", "user.country"]], table)
+        self.assertEqual(mask.to_pylist(), [True, False])
+
+    def test_dotted_column(self):
+        # As in tables flattened one level, e.g. by pandas.json_normalize(max_level=1)
+        table = pa.Table.from_pydict(
+            {
+                "user.address": [dict(city="Paris"), dict(city="Lyon"), dict(city="Nice")],
+                "user.tags": [["a"], ["c"], ["b", "a"]],
+            }
+        )
+        mask = execute_table(["==", ["key", "user.address.city"], "Lyon"], table)
+        self.assertEqual(mask.to_pylist(), [False, True, False])
+        mask = execute_table(["==", ["key", "user.tags.0"], "b"], table)
+        self.assertEqual(mask.to_pylist(), [False, False, True])
+
+
+class TestUnsupportedTable(TestCase):
+    def test_unsupported_table(self):
+        with self.assertRaises(JsonOperationError):
+            execute_table(["null", ["key", "a"]], [dict(a=1)])
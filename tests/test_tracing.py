@@ -0,0 +1,78 @@
+import json
+from unittest import TestCase
+
+from json_operations import JsonOperationError, execute_debug
+from json_operations.tracing import Tracer
+
+OPERATION = [
+    "and",
+    [">", ["key", "a"], 1],
+    ["or", ["==", ["key", "b"], "x"], ["in", ["key", "c"], [1, 2]]],
+]
+CONTEXT = dict(a=2, b="y", c=2)
+
+
+class TestTracer(TestCase):
+    def test_samples_one_in_n(self):
+        tracer = Tracer(every=3)
+        for _ in range(7):
+            self.assertTrue(tracer.execute(OPERATION, CONTEXT))
+        traces = tracer.traces()
+        self.assertEqual(len(traces), 3)
+        self.assertEqual({trace["reason"] for trace in traces}, {"sampled"})
+
+    def test_node_values_and_timings(self):
+        tracer = Tracer(every=1)
+        tracer.execute(OPERATION, CONTEXT, rule="r1")
+        trace = tracer.traces()[0]
+        self.assertEqual(trace["rule"], "r1")
+        self.assertTrue(trace["result"])
+        self.assertEqual(
+            {node["path"]: node["value"] for node in trace["nodes"]},
+            execute_debug(OPERATION, CONTEXT),
+        )
+        durations = {node["path"]: node["duration"] for node in trace["nodes"]}
+        self.assertGreaterEqual(durations[""], durations["1"])
+        self.assertGreaterEqual(durations["1"], durations["1.0"] + durations["1.1"])
+        self.assertLessEqual(trace["nodes"][-1]["duration"], trace["duration"])
+
+    def test_slow_threshold(self):
+        tracer = Tracer(slow_threshold=0)
+        tracer.execute(OPERATION, CONTEXT)
+        self.assertEqual(tracer.traces()[0]["reason"], "slow")
+
+        tracer = Tracer(slow_threshold=60)
+        tracer.execute(OPERATION, CONTEXT)
+        self.assertEqual(tracer.traces(), [])
+
+    def test_per_rule(self):
+        tracer = Tracer()
+        tracer.configure("traced", every=1)
+        tracer.execute(OPERATION, CONTEXT, rule="traced")
+        tracer.execute(OPERATION, CONTEXT, rule="other")
+        self.assertEqual([trace["rule"] for trace in tracer.traces()], ["traced"])
+
+    def test_ring_buffer(self):
+        tracer = Tracer(every=1, capacity=2)
+        for index in range(5):
+            tracer.execute(OPERATION, dict(CONTEXT, a=index))
+        self.assertEqual(len(tracer.traces()), 2)
+        tracer.clear()
+        self.assertEqual(tracer.traces(), [])
+
+    def test_errors(self):
+        tracer = Tracer(every=1)
+        with self.assertRaises(JsonOperationError):
+            tracer.execute(
+                ["and", ["==", ["key", "b"], "y"], [">", ["key", "b"], 1]], CONTEXT
+            )
+        trace = tracer.traces()[0]
+        self.assertIn("error", trace)
+        self.assertEqual(trace["nodes"][0]["path"], "0")
+
+    def test_export(self):
+        tracer = Tracer(every=1, include_context=True)
+        tracer.execute(OPERATION, CONTEXT)
+        exported = json.loads(tracer.export())
+        self.assertEqual(exported[0]["context"], CONTEXT)
+        self.assertEqual(exported[0]["operation"], OPERATION)